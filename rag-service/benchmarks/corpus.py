@@ -0,0 +1,74 @@
+# rag-service/benchmarks/corpus.py
+import numpy as np
+from typing import Iterator, List, Tuple
+
+# Clause topics of the synthetic contracts; every topic has its own region
+# of the vector space, so texts and vectors of a document agree
+TOPICS = [
+    ("termination", "Either party may terminate this Agreement upon {days} days written notice if the {party} materially breaches any obligation."),
+    ("payment", "The {party} shall pay all invoices within {days} days of receipt, with late amounts bearing interest at {rate} percent per annum."),
+    ("confidentiality", "The {party} shall keep all Confidential Information strictly confidential for a period of {years} years after disclosure."),
+    ("liability", "In no event shall the {party} be liable for indirect or consequential damages exceeding {amount} dollars."),
+    ("governing_law", "This Agreement shall be governed by the laws of {state} and disputes resolved in the courts of {state}."),
+    ("indemnification", "The {party} shall indemnify and hold harmless the other party against all claims arising from its negligence."),
+    ("warranty", "The {party} warrants that the services will be performed in a professional manner for {days} days after delivery."),
+    ("force_majeure", "Neither party shall be liable for delays caused by events beyond its reasonable control lasting up to {days} days."),
+    ("assignment", "The {party} may not assign this Agreement without prior written consent, which shall not be unreasonably withheld."),
+    ("intellectual_property", "All intellectual property created by the {party} under this Agreement vests in the Customer upon payment of {amount} dollars."),
+]
+
+PARTIES = ["Supplier", "Customer", "Licensee", "Licensor", "Contractor", "Consultant", "Tenant", "Landlord"]
+STATES = ["Delaware", "New York", "California", "Texas", "England and Wales", "Ontario"]
+
+def _clause(rng: np.random.Generator, topic: int) -> str:
+    return TOPICS[topic][1].format(
+        party=PARTIES[rng.integers(len(PARTIES))],
+        days=int(rng.choice([10, 15, 30, 45, 60, 90])),
+        rate=float(rng.choice([1.5, 2.0, 5.0, 8.0])),
+        years=int(rng.integers(1, 10)),
+        amount=int(rng.integers(1, 500)) * 1000,
+        state=STATES[rng.integers(len(STATES))]
+    )
+
+def topic_centers(dimension: int, n_clusters: int, seed: int) -> np.ndarray:
+    """Cluster centers in the unit sphere; clustered data is what real embeddings look like"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dimension)).astype(np.float32)
+    return centers / np.linalg.norm(centers, axis=1, keepdims=True)
+
+def _vectors(rng: np.random.Generator, centers: np.ndarray, clusters: np.ndarray, noise: float) -> np.ndarray:
+    # noise is the expected distance from the center, independent of the dimension
+    scale = noise / np.sqrt(centers.shape[1])
+    vectors = centers[clusters] + scale * rng.standard_normal((len(clusters), centers.shape[1])).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def iter_corpus(n_docs: int, dimension: int = 384, seed: int = 0, batch_size: int = 1000,
+                n_clusters: int = 256, noise: float = 0.6) -> Iterator[Tuple[List[str], List[str], List[dict], np.ndarray]]:
+    """
+    Deterministically generate a synthetic contract corpus batch by batch
+
+    Yields:
+        (doc_ids, texts, metadata_list, vectors) per batch
+    """
+    rng = np.random.default_rng(seed)
+    centers = topic_centers(dimension, n_clusters, seed)
+    for start in range(0, n_docs, batch_size):
+        count = min(batch_size, n_docs - start)
+        clusters = rng.integers(n_clusters, size=count)
+        doc_ids = [f"contract_{start + i}" for i in range(count)]
+        texts = []
+        metadata_list = []
+        for cluster in clusters:
+            topic = int(cluster) % len(TOPICS)
+            texts.append(" ".join(_clause(rng, (topic + j) % len(TOPICS)) for j in range(3)))
+            metadata_list.append({"topic": TOPICS[topic][0], "source": "synthetic"})
+        yield doc_ids, texts, metadata_list, _vectors(rng, centers, clusters, noise)
+
+def make_queries(n_queries: int, dimension: int = 384, seed: int = 0,
+                 n_clusters: int = 256, noise: float = 0.6) -> Tuple[List[str], np.ndarray]:
+    """Query texts and vectors drawn from the same distribution as the corpus"""
+    rng = np.random.default_rng(seed + 1)
+    centers = topic_centers(dimension, n_clusters, seed)
+    clusters = rng.integers(n_clusters, size=n_queries)
+    texts = [_clause(rng, int(cluster) % len(TOPICS)) for cluster in clusters]
+    return texts, _vectors(rng, centers, clusters, noise)
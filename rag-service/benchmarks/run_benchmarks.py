@@ -0,0 +1,204 @@
+# rag-service/benchmarks/run_benchmarks.py
+"""
+Offline benchmark of the vector store on synthetic contract corpora
+
+Measures ingest throughput, index build time, query latency percentiles,
+QPS under concurrency, RSS, on-disk size, cold-start time and recall@k
+against exact IndexFlatL2 ground truth, and writes the results as JSON.
+
+Usage:
+    python benchmarks/run_benchmarks.py --sizes 10000,100000 --index-types hnsw,ivfpq
+    python benchmarks/run_benchmarks.py --sizes 1000000 --index-types hnsw_sq8 --output hnsw_sq8_1m.json
+
+Vectors are deterministic and clustered by default; --model encodes the
+texts with a local SentenceTransformer instead. RSS is per process, so run
+one size and index type per invocation when comparing memory.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from corpus import iter_corpus, make_queries
+from vector_store import VectorStore
+
+def rss_mb() -> float:
+    """Current resident set size of this process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        # Peak instead of current where /proc is unavailable (kilobytes on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+def disk_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / 2 ** 20
+
+def percentiles(samples_ms):
+    samples = np.array(samples_ms)
+    return {
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "mean_ms": float(samples.mean())
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+def run_config(n_docs, index_type, args, encoder=None):
+    data_dir = tempfile.mkdtemp(prefix=f"rag-bench-{index_type}-{n_docs}-")
+    result = {"n_docs": n_docs, "index_type": index_type, "exact_search": args.exact_search}
+    rss_before = rss_mb()
+    try:
+        store = VectorStore(
+            dimension=args.dimension,
+            data_dir=data_dir,
+            checkpoint_interval=3600,
+            checkpoint_records=10 ** 9,
+            index_type=index_type,
+            exact_search=args.exact_search
+        )
+        ground_truth = faiss.IndexFlatL2(args.dimension)
+
+        # Ingest
+        ingest_seconds = 0.0
+        for doc_ids, texts, metadata_list, vectors in iter_corpus(n_docs, args.dimension, args.seed, args.batch_size):
+            if encoder is not None:
+                vectors = encoder.encode(texts, batch_size=args.batch_size).astype(np.float32)
+            started = time.perf_counter()
+            store.add_vectors(vectors, doc_ids, texts, metadata_list)
+            ingest_seconds += time.perf_counter() - started
+            ground_truth.add(vectors)
+        started = time.perf_counter()
+        store.wait_for_rebuild()
+        result["ingest"] = {
+            "seconds": ingest_seconds,
+            "docs_per_second": n_docs / ingest_seconds if ingest_seconds > 0 else 0.0,
+            "index_build_seconds": time.perf_counter() - started
+        }
+        result["index_stats"] = store.index_stats()
+        result["rss_mb"] = rss_mb() - rss_before
+
+        # Queries
+        query_texts, query_vectors = make_queries(args.queries, args.dimension, args.seed)
+        if encoder is not None:
+            query_vectors = encoder.encode(query_texts).astype(np.float32)
+        search_options = {"mode": args.search_mode, "ef_search": args.ef_search, "nprobe": args.nprobe}
+        for vector in query_vectors[:min(20, len(query_vectors))]:
+            store.search(vector, k=args.k, search_options=search_options)  # Warm-up
+        _, result["plan"] = store.search(query_vectors[0], k=args.k, search_options=search_options, return_plan=True)
+
+        vector_ms, hybrid_ms, hits = [], [], []
+        for text, vector in zip(query_texts, query_vectors):
+            started = time.perf_counter()
+            results = store.search(vector, k=args.k, search_options=search_options)
+            vector_ms.append((time.perf_counter() - started) * 1000)
+            hits.append([int(r["id"].rsplit("_", 1)[1]) for r in results])
+
+            started = time.perf_counter()
+            store.search(vector, k=args.k, query_text=text, search_options=search_options)
+            hybrid_ms.append((time.perf_counter() - started) * 1000)
+        result["latency"] = {"vector": percentiles(vector_ms), "hybrid_bm25": percentiles(hybrid_ms)}
+
+        # Recall of the approximate vector search against exact search
+        _, truth = ground_truth.search(query_vectors, args.k)
+        recall = [len(set(found) & set(expected)) / args.k for found, expected in zip(hits, truth.tolist())]
+        result[f"recall_at_{args.k}"] = float(np.mean(recall))
+
+        # Throughput under concurrency
+        result["qps"] = {}
+        for concurrency in args.concurrency:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                started = time.perf_counter()
+                list(pool.map(
+                    lambda pair: store.search(pair[1], k=args.k, query_text=pair[0], search_options=search_options),
+                    zip(query_texts, query_vectors)
+                ))
+                elapsed = time.perf_counter() - started
+            result["qps"][str(concurrency)] = len(query_vectors) / elapsed
+
+        # Persistence
+        started = time.perf_counter()
+        store.close()
+        result["checkpoint_seconds"] = time.perf_counter() - started
+        result["disk_mb"] = disk_mb(data_dir)
+
+        started = time.perf_counter()
+        reopened = VectorStore(dimension=args.dimension, data_dir=data_dir, checkpoint_interval=3600,
+                               index_type=index_type, exact_search=args.exact_search)
+        reopened.search(query_vectors[0], k=args.k)
+        result["cold_start_seconds"] = time.perf_counter() - started
+        reopened.close()
+    finally:
+        if not args.keep:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the RAG vector store on synthetic corpora")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated corpus sizes")
+    parser.add_argument("--index-types", default="hnsw", help="Comma-separated index types")
+    parser.add_argument("--exact-search", action="store_true", help="Keep the exact flat index as well")
+    parser.add_argument("--search-mode", default="approximate", help="Vector search plan: auto, exact or approximate")
+    parser.add_argument("--ef-search", type=int, default=None, help="HNSW efSearch per query, default the index's own")
+    parser.add_argument("--nprobe", type=int, default=None, help="IVF lists probed per query, default the index's own")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--batch-size", type=int, default=1000, help="Documents per add_vectors call")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated client thread counts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model", default=None, help="Encode texts with this local SentenceTransformer model")
+    parser.add_argument("--embedding-backend", default="torch", help="Embedding backend for --model: torch, onnx or onnx_int8")
+    parser.add_argument("--keep", action="store_true", help="Keep the data directories")
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+
+    encoder = None
+    if args.model:
+        from embeddings import Embeddings
+        encoder = Embeddings(model_name=args.model, cache_size=0, backend=args.embedding_backend)
+        args.dimension = encoder.dimension
+
+    report = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "faiss": faiss.__version__,
+        "cpu_count": os.cpu_count(),
+        "settings": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": []
+    }
+    for n_docs in [int(size) for size in args.sizes.split(",")]:
+        for index_type in args.index_types.split(","):
+            print(f"Benchmarking {index_type} on {n_docs} documents")
+            result = run_config(n_docs, index_type, args, encoder)
+            print(json.dumps(result, indent=2))
+            report["results"].append(result)
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
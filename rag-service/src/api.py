@@ -1,14 +1,26 @@
 # rag-service/src/api.py
-from fastapi import FastAPI, HTTPException, Body
+from fastapi import FastAPI, HTTPException, Body, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
 import os
 import json
+import time
+import threading
+import itertools
+import numpy as np
 
-from pathway_pipeline import PathwayTextPipeline
-from embeddings import Embeddings
-from vector_store import VectorStore
+from embedding_scheduler import EmbeddingScheduler
+from task_executor import BoundedExecutor, ExecutorOverloaded
+from chunking import chunk_records, iter_chunks
+from startup import LazyComponent, parse_warmup_queries, warm_up
+from result_cache import ResultCache
+from response_formats import (
+    EMBEDDING_FORMATS, MEDIA_TYPES, UnsupportedFormat, encode_embedding, iter_ndjson,
+    negotiate, render, shape_hits
+)
+import metrics
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -29,105 +41,868 @@ app.add_middleware(
 # Create data directories
 os.makedirs("./data/input", exist_ok=True)
 
+# Queries encoded and searched once at startup, so kernels, allocator pools
+# and the pages of a memory-mapped index are warm before traffic arrives
+WARMUP_QUERIES = parse_warmup_queries(os.getenv(
+    "RAG_WARMUP_QUERIES",
+    "termination clause;payment terms;confidentiality obligations;governing law"
+))
+
+# Heavy services are built lazily (torch, FAISS and Pathway are imported by
+# their factories), so importing this module and binding the port is fast.
+# Startup loads them in the background; /ready reports their progress.
+def _load_embeddings():
+    from embeddings import Embeddings
+
+    # RAG_EMBEDDING_BACKEND=onnx_int8 serves an exported, int8-quantized graph
+    # on ONNX Runtime instead of torch; see onnx_export.py
+    threads = int(os.getenv("RAG_EMBED_THREADS", "0"))
+    model = Embeddings(
+        cache_size=int(os.getenv("RAG_EMBED_CACHE_SIZE", "10000")),
+        cache_dir=os.getenv("RAG_EMBED_CACHE_DIR") or None,
+        disk_cache_size=int(os.getenv("RAG_EMBED_DISK_CACHE_SIZE", "100000")),
+        backend=os.getenv("RAG_EMBEDDING_BACKEND", "torch"),
+        onnx_dir=os.getenv("RAG_ONNX_MODEL_DIR") or None,
+        threads=threads or None
+    )
+    if WARMUP_QUERIES:
+        model.encode(WARMUP_QUERIES)
+    return model
+
+def _load_vector_store():
+    # Comma-separated metadata fields /query can filter on, default all
+    filter_fields = os.getenv("RAG_FILTER_FIELDS")
+
+    # RAG_INDEX_TYPE trades recall for memory: hnsw (float32 graph), hnsw_sq8
+    # (~4x smaller) or ivfpq (~dimension/8 bytes per vector). The exact flat
+    # copy used by hybrid=False searches is only kept with RAG_EXACT_SEARCH=true.
+    store_kwargs = dict(
+        dimension=384,
+        index_type=os.getenv("RAG_INDEX_TYPE", "hnsw"),
+        exact_search=os.getenv("RAG_EXACT_SEARCH", "false").lower() in ("1", "true", "yes"),
+        mmap=os.getenv("RAG_MMAP_INDEX", "true").lower() in ("1", "true", "yes"),
+        filter_fields=[field.strip() for field in filter_fields.split(",")] if filter_fields else None,
+        # Corpora up to this size are searched exactly unless a query asks otherwise
+        exact_search_limit=int(os.getenv("RAG_EXACT_SEARCH_LIMIT", "10000")),
+        # New vectors are scanned exactly until this many are merged into the index in the background
+        delta_limit=int(os.getenv("RAG_DELTA_LIMIT", "10000"))
+    )
+
+    # RAG_NUM_SHARDS > 1 partitions the corpus over that many worker
+    # processes; changing it moves the documents on the next start. The first
+    # sharded start moves the unsharded store in ./data into the shards, and a
+    # corpus that was sharded once stays sharded: RAG_NUM_SHARDS=1 then
+    # collapses it into a single shard instead of starting from ./data.
+    num_shards = int(os.getenv("RAG_NUM_SHARDS", "1"))
+    if num_shards > 1 or os.path.exists("./data/shards/shards.json"):
+        from sharded_store import ShardedVectorStore
+        store = ShardedVectorStore(num_shards, data_dir="./data/shards", legacy_dir="./data", **store_kwargs)
+    else:
+        from vector_store import VectorStore
+        store = VectorStore(**store_kwargs)
+
+    if WARMUP_QUERIES and store.index_stats()["documents"]:
+        for text, vector in zip(WARMUP_QUERIES, embeddings.encode(WARMUP_QUERIES)):
+            store.search(vector, k=5, query_text=text)
+    return store
+
+def _load_dedup_index():
+    from dedup import DuplicateIndex
+    return DuplicateIndex(
+        os.getenv("RAG_DEDUP_PATH", "./data/dedup.db"),
+        threshold=float(os.getenv("RAG_DEDUP_THRESHOLD", "0.8"))
+    )
+
+def _load_pipeline():
+    from pathway_pipeline import PathwayTextPipeline
+
+    # Shares the service's model instead of loading a second copy
+    text_pipeline = PathwayTextPipeline(embeddings.get())
+    if os.getenv("PATHWAY_REALTIME_ENABLED", "true").lower() in ("1", "true", "yes"):
+        text_pipeline.start()
+    return text_pipeline
+
 # Initialize services
-pipeline = PathwayTextPipeline()
-embeddings = Embeddings()
-vector_store = VectorStore(dimension=384)
+embeddings = LazyComponent("embeddings", _load_embeddings)
+vector_store = LazyComponent("vector_store", _load_vector_store)
+pipeline = LazyComponent("pipeline", _load_pipeline)
+COMPONENTS = [embeddings, vector_store, pipeline]
+
+# Incoming documents that repeat a stored one, exactly or up to OCR noise,
+# are caught before they are embedded. RAG_DEDUP_POLICY: off, skip (return
+# the stored copy's id), link (record the new id as an alias of it) or
+# replace (index the new copy and delete the stored one)
+DEDUP_POLICY = os.getenv("RAG_DEDUP_POLICY", "off").lower()
+if DEDUP_POLICY not in ("off", "skip", "link", "replace"):
+    raise ValueError(f"Unknown RAG_DEDUP_POLICY {DEDUP_POLICY!r}")
+dedup_index = LazyComponent("dedup_index", _load_dedup_index) if DEDUP_POLICY != "off" else None
+if dedup_index is not None:
+    COMPONENTS.append(dedup_index)
+
+# Held for the duplicate lookup and the reservation of the fingerprints to
+# index, not while they are embedded and stored. A lookup waits for requests
+# indexing a copy of the same document, so concurrent uploads of it cannot
+# both miss each other.
+dedup_lock = threading.Condition()
+# Fingerprints being indexed, by reservation
+_reserved: Dict[int, List[Any]] = {}
+_reservation_ids = itertools.count()
+
+# Single-text query encodes are micro-batched across concurrent requests
+query_encoder = EmbeddingScheduler(
+    embeddings,
+    max_batch_size=int(os.getenv("RAG_EMBED_MAX_BATCH_SIZE", "32")),
+    max_wait_ms=float(os.getenv("RAG_EMBED_MAX_WAIT_MS", "5"))
+)
+
+# CPU and disk work runs off the event loop so /health and queries stay
+# responsive during ingest bursts; excess requests are shed with a 503
+max_workers = int(os.getenv("PATHWAY_MAX_CONCURRENT_TASKS", "4"))
+executor = BoundedExecutor(
+    max_workers=max_workers,
+    max_queue_size=int(os.getenv("RAG_MAX_QUEUED_TASKS", str(4 * max_workers))),
+    retry_after=int(os.getenv("RAG_RETRY_AFTER_SECONDS", "1"))
+)
+
+# Query results keyed on the normalized query and search parameters, dropped
+# once the index generation moves on (RAG_RESULT_CACHE_SIZE=0 disables)
+result_cache_size = int(os.getenv("RAG_RESULT_CACHE_SIZE", "1024"))
+result_cache = ResultCache(result_cache_size) if result_cache_size > 0 else None
+
+REQUEST_SECONDS = metrics.histogram("rag_request_seconds", "End-to-end request handling time", ["endpoint"])
+STAGE_SECONDS = metrics.histogram("rag_request_stage_seconds", "Time per request stage", ["endpoint", "stage"])
+REQUEST_ERRORS = metrics.counter("rag_request_errors", "Requests that failed", ["endpoint", "status"])
+DUPLICATES = metrics.counter(
+    "rag_duplicates", "Incoming documents found to duplicate a stored or batched one", ["match", "policy"]
+)
+RESULT_CACHE_LOOKUPS = metrics.counter(
+    "rag_result_cache_lookups", "Result cache lookups by outcome (hit, or miss including stale)", ["endpoint", "result"]
+)
+EXECUTOR_REJECTED = metrics.counter("rag_executor_rejected", "Requests shed because the executor queue was full")
+
+# Sampled when /metrics is scraped
+metrics.gauge("rag_executor_in_flight", "Tasks running or queued on the executor",
+              function=lambda: executor.stats()["in_flight"])
+metrics.gauge("rag_executor_queued", "Tasks waiting for an executor worker",
+              function=lambda: executor.stats()["queued"])
+metrics.gauge("rag_embedding_queue_depth", "Query texts waiting for the embedding batcher",
+              function=lambda: query_encoder.stats()["queue_depth"])
+metrics.gauge("rag_embedding_max_batch_size", "Configured micro-batch size limit of the embedding batcher",
+              function=lambda: query_encoder.max_batch_size)
+metrics.gauge("rag_embedding_max_wait_seconds", "Configured micro-batch window of the embedding batcher",
+              function=lambda: query_encoder.max_wait_ms / 1000.0)
+metrics.gauge("rag_embedding_cache_hit_ratio", "Embedding cache hit ratio",
+              function=lambda: embeddings.cache.stats()["hit_rate"] if embeddings.is_loaded and embeddings.cache is not None else None)
+metrics.gauge("rag_result_cache_hit_ratio", "Query result cache hit ratio",
+              function=lambda: result_cache.stats()["hit_rate"] if result_cache is not None else None)
+metrics.gauge("rag_result_cache_entries", "Entries in the query result cache",
+              function=lambda: result_cache.stats()["size"] if result_cache is not None else None)
+metrics.gauge("rag_pipeline_pending", "Documents queued for the Pathway dataflow and not yet embedded",
+              function=lambda: pipeline.status()["pending"] if pipeline.is_loaded else None)
+metrics.gauge("rag_pipeline_lag_seconds", "Queue-to-index lag of the last document the Pathway dataflow embedded",
+              function=lambda: pipeline.status()["last_lag_seconds"] if pipeline.is_loaded else None)
+metrics.gauge("rag_dedup_documents", "Documents in the duplicate detection index",
+              function=lambda: dedup_index.stats()["documents"] if dedup_index is not None and dedup_index.is_loaded else None)
+metrics.gauge("rag_index_documents", "Live records in the vector store",
+              function=lambda: vector_store.index_stats()["documents"] if vector_store.is_loaded else None)
+metrics.gauge("rag_index_staged", "Records in the delta segment, searched exactly until the next merge",
+              function=lambda: vector_store.index_stats()["staged"] if vector_store.is_loaded else None)
+metrics.gauge("rag_wal_records", "Write-ahead log records not yet folded into a snapshot",
+              function=lambda: vector_store.index_stats()["wal_records"] if vector_store.is_loaded else None)
+
+# Largest number of queries one /query/batch request may carry
+MAX_BATCH_QUERIES = int(os.getenv("RAG_MAX_BATCH_QUERIES", "256"))
+
+# Documents encoded and committed together by the bulk endpoints
+INDEX_BATCH_SIZE = int(os.getenv("RAG_INDEX_BATCH_SIZE", "64"))
+
+# Documents are stored as overlapping, clause-aligned chunks of this many words
+CHUNK_WINDOW = int(os.getenv("RAG_CHUNK_WINDOW", "160"))
+CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "32"))
 
 # Define models
 class QueryRequest(BaseModel):
     text: str
     k: int = 5
     use_hybrid: bool = True
+    # Weight between BM25 and vector (0 = BM25 only, 1 = vector only)
+    alpha: float = 0.7
+    fusion: str = "rrf"
+    # Metadata filter, e.g. {"contract_type": {"$in": ["nda", "msa"]}, "date": {"$gte": "2024-01-01"}}
+    filters: Optional[Dict[str, Any]] = None
+    # Vector search plan: auto, exact or approximate, an explicit efSearch
+    # (HNSW) / nprobe (IVF), a recall target or a latency budget per query;
+    # the plan used is reported back
+    search_mode: Optional[str] = None
+    ef_search: Optional[int] = None
+    nprobe: Optional[int] = None
+    recall_target: Optional[float] = None
+    latency_budget_ms: Optional[float] = None
+    # Query embedding as "list", "float16" (base64, raw bytes in binary formats) or "none"
+    embedding: str = "list"
+    # Hit texts are cut to snippets unless the full text is requested
+    full_text: bool = False
+    # json, msgpack, arrow or ndjson; overrides the Accept header
+    format: Optional[str] = None
+
+class BatchQuery(BaseModel):
+    text: str
+    k: int = 5
+    filters: Optional[Dict[str, Any]] = None
+
+class BatchQueryRequest(BaseModel):
+    queries: List[BatchQuery]
+    use_hybrid: bool = True
+    alpha: float = 0.7
+    fusion: str = "rrf"
+    search_mode: Optional[str] = None
+    ef_search: Optional[int] = None
+    nprobe: Optional[int] = None
+    recall_target: Optional[float] = None
+    latency_budget_ms: Optional[float] = None
+    full_text: bool = False
+    format: Optional[str] = None
 
 class DocumentRequest(BaseModel):
     text: str
     metadata: Optional[Dict[str, Any]] = None
+    # Re-indexing under an existing doc_id replaces the stored version
+    doc_id: Optional[str] = None
     
+class BulkIndexRequest(BaseModel):
+    documents: List[DocumentRequest]
+    batch_size: Optional[int] = None
+
 class QueryResponse(BaseModel):
     results: List[Dict[str, Any]]
-    query_embedding: List[float]
+    plan: Optional[Dict[str, Any]] = None
+    query_embedding: Optional[Union[List[float], str]] = None
     
+def _search_options(request) -> Dict[str, Any]:
+    """Search plan options of a query request, see search_planner.validate_search_options"""
+    return {
+        "mode": request.search_mode,
+        "ef_search": request.ef_search,
+        "nprobe": request.nprobe,
+        "recall": request.recall_target,
+        "latency_ms": request.latency_budget_ms
+    }
+
+def _cache_lookup(endpoint: str, text: str, **params):
+    """
+    Look up a cached result for the current index generation
+
+    Returns:
+        (key, generation, cached value or None); key is None when caching
+        does not apply, e.g. while the vector store is still loading
+    """
+    if result_cache is None or not vector_store.is_loaded:
+        return None, None, None
+    key = ResultCache.key(endpoint, text, **params)
+    generation = vector_store.generation
+    value = result_cache.get(key, generation)
+    RESULT_CACHE_LOOKUPS.inc(endpoint=endpoint, result="miss" if value is None else "hit")
+    return key, generation, value
+
+async def offload(func, *args, shed=True, **kwargs):
+    """Run blocking work on the bounded executor, mapping overload to a 503"""
+    try:
+        return await executor.run(func, *args, shed=shed, **kwargs)
+    except ExecutorOverloaded as e:
+        EXECUTOR_REJECTED.inc()
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
 # API endpoints
+def _negotiate(http_request: Request, requested_format: Optional[str], embedding: str = "none") -> str:
+    """Response format of a request, rejecting unknown options before any work is done"""
+    if embedding not in EMBEDDING_FORMATS:
+        raise UnsupportedFormat(f"Unknown embedding format {embedding!r}, expected one of {', '.join(EMBEDDING_FORMATS)}")
+    return negotiate(http_request.headers.get("accept"), requested_format)
+
+def _respond(payload: Dict[str, Any], hits_key: str, response_format: str):
+    """
+    Encode a payload in the negotiated format
+
+    Returns:
+        (response, (body, media type) to cache, or None for a stream)
+    """
+    if response_format == "ndjson":
+        # Hits go out line by line as they are serialized
+        return StreamingResponse(iter_ndjson(payload, hits_key), media_type=MEDIA_TYPES["ndjson"]), None
+    body, media_type = render(payload, hits_key, response_format)
+    return Response(content=body, media_type=media_type), (body, media_type)
+
 @app.post("/query", response_model=QueryResponse)
-async def query(request: QueryRequest):
-    """Query for relevant documents"""
+async def query(request: QueryRequest, http_request: Request):
+    """
+    Query for relevant documents
+
+    The response format follows the format option or the Accept header:
+    JSON (default), MessagePack, Arrow IPC stream or NDJSON.
+    """
     try:
-        query_text = request.text
-        
-        # Get embeddings for query
-        query_vector = embeddings.encode(query_text)
-        
-        # Get relevant documents
-        results = vector_store.search(
-            query_vector, 
-            k=request.k,
-            hybrid=request.use_hybrid
-        )
-        
-        return {
-            "results": results,
-            "query_embedding": query_vector.tolist()
-        }
+        with REQUEST_SECONDS.time(endpoint="query"):
+            query_text = request.text
+            response_format = _negotiate(http_request, request.format, request.embedding)
+
+            # A repeated query against an unchanged index skips encoding and search
+            cache_key, generation, cached = _cache_lookup(
+                "query", query_text, k=request.k, hybrid=request.use_hybrid,
+                alpha=request.alpha, fusion=request.fusion, filters=request.filters,
+                search=_search_options(request), embedding=request.embedding,
+                full_text=request.full_text, format=response_format
+            )
+            if cached is not None:
+                body, media_type = cached
+                return Response(content=body, media_type=media_type)
+            
+            # Get embeddings for query
+            with STAGE_SECONDS.time(endpoint="query", stage="encode"):
+                query_vector = await query_encoder.encode_async(query_text)
+            
+            # Get relevant documents
+            with STAGE_SECONDS.time(endpoint="query", stage="search"):
+                results, plan = await offload(
+                    vector_store.search,
+                    query_vector, 
+                    k=request.k,
+                    hybrid=request.use_hybrid,
+                    query_text=query_text,
+                    alpha=request.alpha,
+                    fusion=request.fusion,
+                    filters=request.filters,
+                    search_options=_search_options(request),
+                    return_plan=True
+                )
+            
+            # Serialized here so the time shows up as its own stage
+            with STAGE_SECONDS.time(endpoint="query", stage="serialize"):
+                payload = {"results": shape_hits(results, request.full_text), "plan": plan}
+                if request.embedding != "none":
+                    payload["query_embedding"] = encode_embedding(
+                        query_vector, request.embedding, binary=response_format in ("msgpack", "arrow")
+                    )
+                response, rendered = _respond(payload, "results", response_format)
+            if cache_key is not None and rendered is not None:
+                result_cache.put(cache_key, generation, rendered)
+            return response
+    except HTTPException as e:
+        REQUEST_ERRORS.inc(endpoint="query", status=e.status_code)
+        raise
+    except UnsupportedFormat as e:
+        REQUEST_ERRORS.inc(endpoint="query", status=406)
+        raise HTTPException(status_code=406, detail=str(e))
+    except ValueError as e:
+        # Malformed filter
+        REQUEST_ERRORS.inc(endpoint="query", status=400)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        REQUEST_ERRORS.inc(endpoint="query", status=500)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/query/batch")
+async def query_batch(request: BatchQueryRequest, http_request: Request):
+    """
+    Answer many queries with one batched encode and one search per index
+
+    Each query has its own k and filter. JSON and MessagePack responses hold
+    one result list per query in request order; Arrow and NDJSON responses
+    are flat, every hit carrying the position of its query.
+    """
+    try:
+        with REQUEST_SECONDS.time(endpoint="query_batch"):
+            response_format = _negotiate(http_request, request.format)
+            if len(request.queries) > MAX_BATCH_QUERIES:
+                raise HTTPException(
+                    status_code=413, detail=f"At most {MAX_BATCH_QUERIES} queries per batch"
+                )
+            texts = [query.text for query in request.queries]
+            results, plans = [], []
+            if texts:
+                with STAGE_SECONDS.time(endpoint="query_batch", stage="encode"):
+                    query_vectors = await offload(embeddings.encode, texts, batch_size=len(texts))
+                with STAGE_SECONDS.time(endpoint="query_batch", stage="search"):
+                    results, plans = await offload(
+                        vector_store.search_batch,
+                        query_vectors,
+                        [query.k for query in request.queries],
+                        query_texts=texts,
+                        filters=[query.filters for query in request.queries],
+                        hybrid=request.use_hybrid,
+                        alpha=request.alpha,
+                        fusion=request.fusion,
+                        search_options=_search_options(request),
+                        return_plans=True
+                    )
+
+            with STAGE_SECONDS.time(endpoint="query_batch", stage="serialize"):
+                results = [shape_hits(hits, request.full_text) for hits in results]
+                if response_format in ("arrow", "ndjson"):
+                    flat = [dict(hit, query=i) for i, hits in enumerate(results) for hit in hits]
+                    payload = {"results": flat, "queries": len(results), "plans": plans}
+                else:
+                    payload = {"results": results, "plans": plans}
+                response, _ = _respond(payload, "results", response_format)
+            return response
+    except HTTPException as e:
+        REQUEST_ERRORS.inc(endpoint="query_batch", status=e.status_code)
+        raise
+    except UnsupportedFormat as e:
+        REQUEST_ERRORS.inc(endpoint="query_batch", status=406)
+        raise HTTPException(status_code=406, detail=str(e))
+    except ValueError as e:
+        # Malformed filter
+        REQUEST_ERRORS.inc(endpoint="query_batch", status=400)
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
+        REQUEST_ERRORS.inc(endpoint="query_batch", status=500)
         raise HTTPException(status_code=500, detail=str(e))
 
+def _duplicate_status(doc_id, canonical, match, similarity):
+    """Status entry of a document that was not indexed because it duplicates canonical"""
+    DUPLICATES.inc(match=match, policy=DEDUP_POLICY)
+    if DEDUP_POLICY == "link" and doc_id:
+        return {"doc_id": doc_id, "status": "linked", "duplicate_of": canonical, "match": match, "similarity": similarity}
+    # Without an id of its own the caller refers to the stored copy
+    return {"doc_id": canonical, "status": "duplicate", "duplicate_of": canonical, "match": match, "similarity": similarity}
+
+def _replace_duplicate(canonical, doc_id):
+    """Drop the stored copy superseded by the newly indexed doc_id; its id now resolves to doc_id"""
+    vector_store.delete_document(canonical)
+    dedup_index.replace(canonical, doc_id)
+
+def _wait_for_copies(fingerprints):
+    """With dedup_lock held, wait until no other request is indexing a copy of one of the fingerprints"""
+    while any(
+        dedup_index.compare(fingerprint, other) is not None
+        for reserved in _reserved.values() for other in reserved for fingerprint in fingerprints
+    ):
+        dedup_lock.wait()
+
+def _reserve(fingerprints) -> int:
+    """With dedup_lock held, mark fingerprints as being indexed until _release"""
+    reservation = next(_reservation_ids)
+    _reserved[reservation] = fingerprints
+    return reservation
+
+def _release(reservation):
+    """
+    End a reservation, after the fingerprints were added to the dedup index
+    or the documents failed to store
+    """
+    with dedup_lock:
+        del _reserved[reservation]
+        dedup_lock.notify_all()
+
+def _index_document(document: DocumentRequest) -> Dict[str, Any]:
+    # Duplicates are resolved from the text alone, before anything is embedded
+    fingerprint = duplicate = reservation = None
+    if dedup_index is not None and document.text.strip():
+        with STAGE_SECONDS.time(endpoint="index", stage="dedup"):
+            fingerprint = dedup_index.fingerprint(document.text)
+            with dedup_lock:
+                _wait_for_copies([fingerprint])
+                duplicate = dedup_index.find(fingerprint, exclude=document.doc_id)
+                if duplicate is None or DEDUP_POLICY == "replace":
+                    reservation = _reserve([fingerprint])
+        if reservation is None:
+            status = _duplicate_status(document.doc_id, *duplicate)
+            if status["status"] == "linked":
+                dedup_index.link(status["doc_id"], status["duplicate_of"])
+            return status
+    try:
+        return _store_document(document, fingerprint, duplicate)
+    finally:
+        if reservation is not None:
+            _release(reservation)
+
+def _store_document(document: DocumentRequest, fingerprint, duplicate) -> Dict[str, Any]:
+    text = document.text
+    metadata = document.metadata or {}
+    
+    # Process document through pipeline
+    doc_id = pipeline.process(text, metadata, doc_id=document.doc_id)
+    
+    # Split into chunks and embed them in batches
+    chunk_ids, chunk_texts, chunk_metadata = chunk_records(doc_id, text, metadata, CHUNK_WINDOW, CHUNK_OVERLAP)
+    if not chunk_ids:
+        raise HTTPException(status_code=400, detail="No text provided")
+    with STAGE_SECONDS.time(endpoint="index", stage="encode"):
+        vectors = embeddings.encode(chunk_texts, batch_size=INDEX_BATCH_SIZE)
+    
+    # Add to vector store, replacing any previous version of the document
+    with STAGE_SECONDS.time(endpoint="index", stage="store"):
+        vector_store.add_vectors(
+            vectors=vectors,
+            doc_ids=chunk_ids,
+            texts=chunk_texts,
+            metadata_list=chunk_metadata
+        )
+    status = {"doc_id": doc_id, "status": "success"}
+    if fingerprint is not None:
+        dedup_index.add(doc_id, fingerprint)
+        if duplicate is not None:
+            canonical, match, similarity = duplicate
+            DUPLICATES.inc(match=match, policy=DEDUP_POLICY)
+            _replace_duplicate(canonical, doc_id)
+            status.update(replaced=canonical, match=match, similarity=similarity)
+    return status
+
 @app.post("/index")
 async def index_document(document: DocumentRequest):
     """Add a document to the index"""
     try:
-        text = document.text
-        metadata = document.metadata or {}
-        
-        # Process document through pipeline
-        doc_id = pipeline.process(text)
-        
-        # Embed document
-        embedding = embeddings.encode(text)
-        
-        # Add to vector store
-        vector_store.add_document(
-            doc_id=doc_id,
-            vector=embedding,
-            text=text,
-            metadata=metadata
-        )
-        
-        return {"status": "success", "doc_id": doc_id}
+        with REQUEST_SECONDS.time(endpoint="index"):
+            return await offload(_index_document, document)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _index_batch(documents: List[DocumentRequest]) -> List[Dict[str, Any]]:
+    """
+    Embed and store one batch of documents with a single vector store commit
+
+    Returns a status entry per input document, in input order.
+    """
+    statuses = [None] * len(documents)
+    batch = []
+    for i, document in enumerate(documents):
+        if not document.text or not document.text.strip():
+            statuses[i] = {"doc_id": document.doc_id, "status": "error", "error": "No text provided"}
+        else:
+            batch.append((i, document, None, None))
+    reservation = None
+    if dedup_index is not None and batch:
+        with STAGE_SECONDS.time(endpoint="index_bulk", stage="dedup"):
+            batch = [(i, document, dedup_index.fingerprint(document.text), None) for i, document, _, _ in batch]
+            with dedup_lock:
+                _wait_for_copies([fingerprint for _, _, fingerprint, _ in batch])
+                batch = _dedup_batch(batch, statuses)
+                reservation = _reserve([fingerprint for _, _, fingerprint, _ in batch])
+    try:
+        if batch:
+            _store_batch(batch, statuses)
+    finally:
+        if reservation is not None:
+            _release(reservation)
+    return _settle_duplicates(statuses)
+
+def _store_batch(batch, statuses):
+    """Index the (position, document, fingerprint, replaced duplicate) entries of a batch, filling in their statuses"""
+    try:
+        # Every document goes through the pipeline, keeping caller-supplied
+        # ids, so both indexes hold the same documents under the same ids
+        doc_ids = pipeline.process_batch(
+            [document.text for _, document, _, _ in batch],
+            [document.metadata for _, document, _, _ in batch],
+            [document.doc_id for _, document, _, _ in batch]
+        )
+
+        # Chunk every document of the batch, then embed and commit all chunks together
+        chunk_ids, chunk_texts, chunk_metadata = [], [], []
+        for (_, document, _, _), doc_id in zip(batch, doc_ids):
+            ids, texts, metadata_list = chunk_records(doc_id, document.text, document.metadata or {}, CHUNK_WINDOW, CHUNK_OVERLAP)
+            chunk_ids.extend(ids)
+            chunk_texts.extend(texts)
+            chunk_metadata.extend(metadata_list)
+
+        with STAGE_SECONDS.time(endpoint="index_bulk", stage="encode"):
+            vectors = embeddings.encode(chunk_texts, batch_size=INDEX_BATCH_SIZE)
+        with STAGE_SECONDS.time(endpoint="index_bulk", stage="store"):
+            vector_store.add_vectors(
+                vectors=vectors,
+                doc_ids=chunk_ids,
+                texts=chunk_texts,
+                metadata_list=chunk_metadata
+            )
+        for (i, _, fingerprint, replaced), doc_id in zip(batch, doc_ids):
+            statuses[i] = {"doc_id": doc_id, "status": "success"}
+            if fingerprint is not None:
+                dedup_index.add(doc_id, fingerprint)
+            if replaced is not None:
+                canonical, match, similarity = replaced
+                _replace_duplicate(canonical, doc_id)
+                statuses[i].update(replaced=canonical, match=match, similarity=similarity)
+    except Exception as e:
+        for i, document, _, _ in batch:
+            statuses[i] = {"doc_id": document.doc_id, "status": "error", "error": str(e)}
+
+def _settle_duplicates(statuses):
+    """Give copies of a document of the batch, referred to by position, its id and record the links"""
+    # Under replace a copy can point at a later copy that was replaced in
+    # turn, point every copy at the end of its chain first
+    for status in statuses:
+        position = status.get("duplicate_of")
+        if isinstance(position, int):
+            while isinstance(statuses[position].get("duplicate_of"), int):
+                position = statuses[position]["duplicate_of"]
+            status["duplicate_of"] = position
+    for status in statuses:
+        canonical = status.get("duplicate_of")
+        if isinstance(canonical, int):
+            if statuses[canonical]["status"] != "success":
+                status.update(doc_id=None, status="error", error="The copy it duplicates failed to index")
+                continue
+            canonical = status["duplicate_of"] = statuses[canonical]["doc_id"]
+            if status["status"] == "duplicate":
+                status["doc_id"] = canonical
+        if status["status"] == "linked":
+            dedup_index.link(status["doc_id"], canonical)
+    return statuses
+
+def _dedup_batch(batch, statuses):
+    """
+    Resolve the duplicates of a batch against the index and each other
+
+    Takes and returns (position, document, fingerprint, replaced) entries.
+    Copies are settled in statuses; the documents to index are returned with,
+    under the replace policy, the stored copy they supersede. Within the
+    batch the first copy is indexed (the last one under replace) and the
+    others refer to it by batch position until it has an id.
+    """
+    kept = []
+    for i, document, fingerprint, _ in batch:
+        duplicate = dedup_index.find(fingerprint, exclude=document.doc_id)
+        if duplicate is not None and DEDUP_POLICY != "replace":
+            statuses[i] = _duplicate_status(document.doc_id, *duplicate)
+            continue
+        for position, (j, _, other, earlier_duplicate) in enumerate(kept):
+            found = dedup_index.compare(fingerprint, other)
+            if found is None:
+                continue
+            if DEDUP_POLICY == "replace":
+                # The later copy wins and takes over any stored copy the earlier one replaced
+                del kept[position]
+                DUPLICATES.inc(match=found[0], policy=DEDUP_POLICY)
+                statuses[j] = {"doc_id": None, "status": "duplicate", "duplicate_of": i,
+                               "match": found[0], "similarity": found[1]}
+                duplicate = duplicate or earlier_duplicate
+            else:
+                statuses[i] = _duplicate_status(document.doc_id, j, *found)
+            break
+        if statuses[i] is None:
+            kept.append((i, document, fingerprint, duplicate))
+    return kept
+
+def _bulk_summary(statuses: List[Dict[str, Any]], started: float) -> Dict[str, Any]:
+    elapsed = time.perf_counter() - started
+    indexed = sum(1 for status in statuses if status["status"] == "success")
+    failed = sum(1 for status in statuses if status["status"] == "error")
+    return {
+        "status": "success" if not failed else "partial",
+        "indexed": indexed,
+        "duplicates": len(statuses) - indexed - failed,
+        "failed": failed,
+        "elapsed_seconds": elapsed,
+        "docs_per_second": indexed / elapsed if elapsed > 0 else 0.0,
+        "results": statuses
+    }
+
+@app.post("/index/bulk")
+async def index_bulk(request: BulkIndexRequest):
+    """Add many documents, embedding and committing them batch by batch"""
+    started = time.perf_counter()
+    batch_size = max(1, request.batch_size or INDEX_BATCH_SIZE)
+    statuses = []
+    for start in range(0, len(request.documents), batch_size):
+        statuses.extend(await offload(_index_batch, request.documents[start:start + batch_size], shed=False))
+    return _bulk_summary(statuses, started)
+
+@app.post("/index/bulk/ndjson")
+async def index_bulk_ndjson(request: Request, batch_size: Optional[int] = None):
+    """
+    Streaming variant of /index/bulk
+
+    The body is newline-delimited JSON, one document object per line. Batches
+    are indexed as soon as they fill up, so the upload is never held in memory.
+    Results are in input order, each with the 1-based line it was read from;
+    blank lines are skipped.
+    """
+    started = time.perf_counter()
+    batch_size = max(1, batch_size or INDEX_BATCH_SIZE)
+    statuses = []
+    # (line number, document, or None with the status of an unparsable line)
+    pending = []
+    line_number = 0
+    buffer = b""
+
+    def parse(line: bytes):
+        try:
+            pending.append((line_number, DocumentRequest(**json.loads(line)), None))
+        except Exception as e:
+            pending.append((line_number, None, {"doc_id": None, "status": "error", "error": f"Invalid line: {e}"}))
+
+    async def flush():
+        documents = [document for _, document, _ in pending if document is not None]
+        indexed = iter(await offload(_index_batch, documents, shed=False) if documents else [])
+        for number, document, status in pending:
+            statuses.append(dict(next(indexed) if document is not None else status, line=number))
+        pending.clear()
+
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                parse(line)
+            if len(pending) >= batch_size:
+                await flush()
+    if buffer.strip():
+        line_number += 1
+        parse(buffer)
+    if pending:
+        await flush()
+    return _bulk_summary(statuses, started)
+
+def _delete_document(doc_id: str) -> bool:
+    """
+    Delete a document or duplicate alias, True if it existed
+
+    Runs on the executor: the dedup index and the vector store may still be
+    loading, and their first access blocks until they are.
+    """
+    if dedup_index is not None and dedup_index.resolve(doc_id) != doc_id:
+        # A linked duplicate: only the alias goes, the stored copy is still referred to
+        dedup_index.remove(doc_id)
+        return True
+    if not vector_store.delete_document(doc_id):
+        return False
+    if dedup_index is not None:
+        dedup_index.remove(doc_id)
+    return True
+
+@app.delete("/documents/{doc_id}")
+async def delete_document(doc_id: str):
+    """Remove a document from the index"""
+    if not await offload(_delete_document, doc_id):
+        raise HTTPException(status_code=404, detail=f"Document {doc_id} not found")
+    return {"status": "success", "doc_id": doc_id}
+
+def _document_vector(text: str):
+    """Mean of the normalized chunk embeddings of a document"""
+    chunks = [chunk["text"] for chunk in iter_chunks(text, CHUNK_WINDOW, CHUNK_OVERLAP)]
+    vectors = embeddings.encode(chunks, batch_size=INDEX_BATCH_SIZE)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return vectors.mean(axis=0)
+
 @app.post("/analyze")
-async def analyze_document(request: Dict[str, Any] = Body(...)):
-    """Full RAG analysis of a document"""
+async def analyze_document(http_request: Request, request: Dict[str, Any] = Body(...)):
+    """
+    Full RAG analysis of a document
+
+    Accepts the full_text and format options of /query.
+    """
     try:
-        text = request.get("text", "")
-        if not text:
-            raise HTTPException(status_code=400, detail="No text provided")
+        with REQUEST_SECONDS.time(endpoint="analyze"):
+            text = request.get("text", "")
+            if not text:
+                raise HTTPException(status_code=400, detail="No text provided")
+            response_format = _negotiate(http_request, request.get("format"))
+                
+            # 1. Index the document
+            with STAGE_SECONDS.time(endpoint="analyze", stage="pipeline"):
+                doc_id = await offload(pipeline.process, text)
             
-        # 1. Index the document
-        doc_id = pipeline.process(text)
-        
-        # 2. Find relevant context
-        query_vector = embeddings.encode(text)
-        context_docs = vector_store.search(query_vector, k=3)
-        
-        # 3. Generate augmented response using Gemini API
-        # (Integration with Gemini happens in the server)
-        
-        return {
-            "doc_id": doc_id,
-            "context": context_docs,
-            "original_text": text
-        }
+            # 2. Find relevant context, querying with the whole document rather
+            # than the part of it that fits in one model input
+            cache_key, generation, context_docs = _cache_lookup("analyze", text, k=3)
+            if context_docs is None:
+                with STAGE_SECONDS.time(endpoint="analyze", stage="encode"):
+                    query_vector = await offload(_document_vector, text)
+                with STAGE_SECONDS.time(endpoint="analyze", stage="search"):
+                    context_docs = await offload(vector_store.search, query_vector, k=3)
+                if cache_key is not None:
+                    result_cache.put(cache_key, generation, context_docs)
+            
+            # 3. Generate augmented response using Gemini API
+            # (Integration with Gemini happens in the server)
+            
+            with STAGE_SECONDS.time(endpoint="analyze", stage="serialize"):
+                payload = {
+                    "doc_id": doc_id,
+                    "context": shape_hits(context_docs, bool(request.get("full_text", False))),
+                    "original_text": text
+                }
+                return _respond(payload, "context", response_format)[0]
+    except HTTPException as e:
+        REQUEST_ERRORS.inc(endpoint="analyze", status=e.status_code)
+        raise
+    except UnsupportedFormat as e:
+        REQUEST_ERRORS.inc(endpoint="analyze", status=406)
+        raise HTTPException(status_code=406, detail=str(e))
     except Exception as e:
+        REQUEST_ERRORS.inc(endpoint="analyze", status=500)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.on_event("startup")
+async def startup():
+    """Load and warm up the services without holding up the server"""
+    threading.Thread(target=warm_up, args=(COMPONENTS,), daemon=True, name="warm-up").start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Fold the write-ahead log into a final snapshot before exiting"""
+    query_encoder.close()
+    executor.shutdown()
+    if embeddings.is_loaded and embeddings.cache is not None:
+        embeddings.cache.flush()
+    if pipeline.is_loaded:
+        pipeline.stop()
+    if vector_store.is_loaded:
+        vector_store.close()
+    if dedup_index is not None and dedup_index.is_loaded:
+        dedup_index.close()
+
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Liveness: the process is up and serving requests"""
     return {"status": "ok", "service": "rag-api"}
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: every service is loaded and warmed up"""
+    ready = all(component.is_loaded for component in COMPONENTS)
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "loading",
+            "components": {component.name: component.describe() for component in COMPONENTS}
+        }
+    )
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics in the text exposition format"""
+    if not metrics.ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/pipeline/status")
+async def pipeline_status(doc_id: Optional[str] = None):
+    """Indexing watermark and lag of the Pathway dataflow, optionally for one document"""
+    if not pipeline.is_loaded:
+        raise HTTPException(status_code=503, detail="Pipeline is not loaded yet")
+    return pipeline.status(doc_id)
+
+@app.get("/stats")
+async def stats():
+    """Runtime statistics of the batching, execution and index components"""
+    return {
+        "executor": executor.stats(),
+        "embedding_scheduler": query_encoder.stats(),
+        "embedding_cache": embeddings.cache.stats() if embeddings.is_loaded and embeddings.cache is not None else None,
+        "result_cache": result_cache.stats() if result_cache is not None else None,
+        "pipeline": pipeline.status() if pipeline.is_loaded else None,
+        "dedup": dict(dedup_index.stats(), policy=DEDUP_POLICY) if dedup_index is not None and dedup_index.is_loaded else None,
+        "vector_store": vector_store.index_stats() if vector_store.is_loaded else None
+    }
+
 # Run the app with uvicorn
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,101 @@
+# rag-service/src/chunking.py
+import re
+from typing import Any, Dict, Iterator, List
+
+# Whitespace-delimited words approximate model tokens; MiniLM truncates at
+# 256 word pieces, which a 160-word window stays under for contract prose
+WORD_PATTERN = re.compile(r"\S+")
+
+# Blank lines and numbered / titled headings ("12.", "4.2", "ARTICLE V",
+# "Section 3", "§ 7") start a new clause
+CLAUSE_PATTERN = re.compile(
+    r"\n\s*\n|\n(?=[ \t]*(?:\d+(?:\.\d+)*[.)]?\s|ARTICLE\s|Article\s|SECTION\s|Section\s|§))"
+)
+
+def iter_chunks(text: str, window: int = 160, overlap: int = 32) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily split text into chunks of at most ``window`` words
+
+    A chunk ends at the last clause boundary in the second half of its window
+    when there is one, so clauses are kept intact. Otherwise it is cut at the
+    window and the next chunk repeats the last ``overlap`` words.
+
+    Yields:
+        Dicts with the chunk ``index``, its ``text`` and the ``start``/``end``
+        character offsets in the original text
+    """
+    words = [match.span() for match in WORD_PATTERN.finditer(text)]
+    if not words:
+        return
+    overlap = min(overlap, window - 1)
+
+    # Word indexes at which a clause starts
+    boundaries = [match.end() for match in CLAUSE_PATTERN.finditer(text)]
+    clause_starts = set()
+    b = 0
+    for i, (start, _) in enumerate(words):
+        while b < len(boundaries) and boundaries[b] <= start:
+            clause_starts.add(i)
+            b += 1
+
+    index = 0
+    first = 0
+    while first < len(words):
+        last = min(first + window, len(words))
+        next_first = last - overlap if last < len(words) else last
+        if last < len(words):
+            for cut in range(last - 1, first + window // 2, -1):
+                if cut in clause_starts:
+                    last = next_first = cut
+                    break
+
+        start, end = words[first][0], words[last - 1][1]
+        yield {"index": index, "text": text[start:end], "start": start, "end": end}
+        index += 1
+        first = next_first
+
+def chunk_id(parent_id: str, index: int) -> str:
+    """Document ID of a chunk record"""
+    return f"{parent_id}#{index}"
+
+def stitch_chunks(chunks: List[Dict[str, Any]]) -> str:
+    """
+    Rebuild a document's text from its chunk records
+
+    Overlapping words are dropped using the stored character offsets; the
+    whitespace between chunks is normalized to a single space.
+    """
+    parts = []
+    position = 0
+    for chunk in sorted(chunks, key=lambda c: c["start"]):
+        text = chunk["text"]
+        if chunk["start"] < position:
+            text = text[position - chunk["start"]:]
+        elif parts:
+            parts.append(" ")
+        parts.append(text)
+        position = max(position, chunk["end"])
+    return "".join(parts)
+
+def chunk_records(parent_id: str, text: str, metadata: Dict[str, Any], window: int = 160, overlap: int = 32):
+    """
+    Build the VectorStore records for one document's chunks
+
+    Each chunk record inherits the parent's metadata and points back to it
+    through ``parent_id``.
+
+    Returns:
+        (doc_ids, texts, metadata_list) ready for VectorStore.add_vectors
+    """
+    doc_ids, texts, metadata_list = [], [], []
+    for chunk in iter_chunks(text, window, overlap):
+        doc_ids.append(chunk_id(parent_id, chunk["index"]))
+        texts.append(chunk["text"])
+        metadata_list.append(dict(
+            metadata,
+            parent_id=parent_id,
+            chunk_index=chunk["index"],
+            start=chunk["start"],
+            end=chunk["end"]
+        ))
+    return doc_ids, texts, metadata_list
@@ -0,0 +1,219 @@
+# rag-service/src/dedup.py
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from typing import Dict, Optional, Set, Tuple
+
+import numpy as np
+
+# What to do with an incoming duplicate: index it anyway ("off"), drop it
+# ("skip"), record its id as an alias of the stored copy ("link"), or delete
+# the stored copy and index the new one ("replace")
+POLICIES = ("off", "skip", "link", "replace")
+
+# Largest prime below 2^32: a * x + b mod p with 32-bit a, x and b never
+# overflows uint64
+_PRIME = 4294967291
+
+# Shingle hashes permuted at a time, bounding the temporary arrays
+_SHINGLE_BLOCK = 4096
+
+def normalize(text: str) -> str:
+    """Lowercase alphanumeric words only, so whitespace and punctuation noise do not matter"""
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(normalize(text).encode("utf-8")).hexdigest()
+
+class DuplicateIndex:
+    """
+    Exact and near-duplicate lookup for whole documents.
+
+    Exact copies are found by the SHA-256 of the normalized text. Near
+    copies, e.g. the same contract with different OCR noise, by MinHash
+    signatures over character shingles, bucketed with LSH: a signature of
+    num_perm values is split into bands and two documents become candidates
+    when any band matches; candidates count as duplicates when their
+    estimated Jaccard similarity reaches the threshold. Signatures are
+    persisted in SQLite and held in memory as uint32 arrays (num_perm * 4
+    bytes per document).
+    """
+
+    def __init__(self, path: str, threshold: float = 0.8, num_perm: int = 128, bands: int = 32,
+                 shingle_size: int = 5):
+        """
+        Args:
+            path: SQLite file holding the hashes, signatures and aliases
+            threshold: Estimated Jaccard similarity from which a document is a near duplicate
+            num_perm: MinHash permutations per signature
+            bands: LSH bands; more bands find less similar candidates
+            shingle_size: Characters per shingle
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = np.random.default_rng(1)
+        self._a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)[:, None]
+        self._b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)[:, None]
+
+        self.hashes: Dict[str, str] = {}        # content hash -> doc_id
+        self.signatures: Dict[str, np.ndarray] = {}
+        self.doc_hashes: Dict[str, str] = {}    # doc_id -> content hash
+        self.buckets: Dict[Tuple[int, bytes], Set[str]] = {}
+        self.aliases: Dict[str, str] = {}       # alias doc_id -> canonical doc_id
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS signatures (doc_id TEXT PRIMARY KEY, hash TEXT NOT NULL, signature BLOB NOT NULL)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS aliases (alias TEXT PRIMARY KEY, doc_id TEXT NOT NULL)")
+        self.conn.commit()
+        for doc_id, digest, blob in self.conn.execute("SELECT doc_id, hash, signature FROM signatures"):
+            signature = np.frombuffer(blob, dtype=np.uint32)
+            if len(signature) == num_perm:
+                self._remember(doc_id, digest, signature)
+        self.aliases = dict(self.conn.execute("SELECT alias, doc_id FROM aliases"))
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature of the character shingles of the normalized text"""
+        normalized = normalize(text)
+        size = self.shingle_size
+        shingles = {normalized[i:i + size] for i in range(max(1, len(normalized) - size + 1))}
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64, count=len(shingles)
+        )
+        signature = np.full(self.num_perm, _PRIME, dtype=np.uint64)
+        for start in range(0, len(hashes), _SHINGLE_BLOCK):
+            block = hashes[None, start:start + _SHINGLE_BLOCK]
+            np.minimum(signature, ((self._a * block + self._b) % np.uint64(_PRIME)).min(axis=1), out=signature)
+        return signature.astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def _remember(self, doc_id, digest, signature):
+        self.hashes[digest] = doc_id
+        self.doc_hashes[doc_id] = digest
+        self.signatures[doc_id] = signature
+        for key in self._band_keys(signature):
+            self.buckets.setdefault(key, set()).add(doc_id)
+
+    def _forget(self, doc_id):
+        digest = self.doc_hashes.pop(doc_id, None)
+        if digest is not None and self.hashes.get(digest) == doc_id:
+            del self.hashes[digest]
+        signature = self.signatures.pop(doc_id, None)
+        if signature is not None:
+            for key in self._band_keys(signature):
+                bucket = self.buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(doc_id)
+                    if not bucket:
+                        del self.buckets[key]
+
+    def fingerprint(self, text: str) -> Tuple[str, np.ndarray]:
+        """(content hash, MinHash signature) of a text, computed once for find() and add()"""
+        return content_hash(text), self.signature(text)
+
+    def compare(self, fingerprint: Tuple[str, np.ndarray], other: Tuple[str, np.ndarray]) -> Optional[Tuple[str, float]]:
+        """("exact" or "near", similarity) if two fingerprints are duplicates, else None"""
+        if fingerprint[0] == other[0]:
+            return "exact", 1.0
+        similarity = float(np.mean(fingerprint[1] == other[1]))
+        return ("near", similarity) if similarity >= self.threshold else None
+
+    def find(self, fingerprint: Tuple[str, np.ndarray], exclude: Optional[str] = None) -> Optional[Tuple[str, str, float]]:
+        """
+        The stored document a fingerprint duplicates, if any
+
+        Args:
+            fingerprint: (content hash, signature) from fingerprint()
+            exclude: doc_id to ignore, e.g. the one being replaced by an upsert
+
+        Returns:
+            (canonical doc_id, "exact" or "near", similarity), or None
+        """
+        digest, signature = fingerprint
+        with self._lock:
+            doc_id = self.hashes.get(digest)
+            if doc_id is not None and doc_id != exclude:
+                return doc_id, "exact", 1.0
+
+            best, best_similarity = None, 0.0
+            candidates = set()
+            for key in self._band_keys(signature):
+                candidates |= self.buckets.get(key, set())
+            candidates.discard(exclude)
+            for candidate in candidates:
+                similarity = float(np.mean(self.signatures[candidate] == signature))
+                if similarity > best_similarity:
+                    best, best_similarity = candidate, similarity
+        if best is not None and best_similarity >= self.threshold:
+            return best, "near", best_similarity
+        return None
+
+    def add(self, doc_id: str, fingerprint: Tuple[str, np.ndarray]):
+        """Register a stored document; an alias of the same id stops being one"""
+        digest, signature = fingerprint
+        with self._lock:
+            self._forget(doc_id)
+            self._remember(doc_id, digest, signature)
+            self.aliases.pop(doc_id, None)
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO signatures VALUES (?, ?, ?)", (doc_id, digest, signature.tobytes())
+                )
+                self.conn.execute("DELETE FROM aliases WHERE alias = ?", (doc_id,))
+
+    def link(self, alias: str, doc_id: str):
+        """Record alias as another id of the stored document doc_id"""
+        with self._lock:
+            self.aliases[alias] = doc_id
+            with self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO aliases VALUES (?, ?)", (alias, doc_id))
+
+    def replace(self, old_doc_id: str, doc_id: str):
+        """Forget old_doc_id, superseded by doc_id: it and its aliases become aliases of doc_id"""
+        with self._lock:
+            self._forget(old_doc_id)
+            aliases = [alias for alias, target in self.aliases.items() if target == old_doc_id]
+            aliases.append(old_doc_id)
+            for alias in aliases:
+                self.aliases[alias] = doc_id
+            with self.conn:
+                self.conn.execute("DELETE FROM signatures WHERE doc_id = ?", (old_doc_id,))
+                self.conn.executemany("INSERT OR REPLACE INTO aliases VALUES (?, ?)", [(alias, doc_id) for alias in aliases])
+
+    def resolve(self, doc_id: str) -> str:
+        """The stored document an id refers to"""
+        return self.aliases.get(doc_id, doc_id)
+
+    def remove(self, doc_id: str):
+        """Forget a deleted document, or a single alias, along with the aliases pointing at it"""
+        with self._lock:
+            self._forget(doc_id)
+            aliases = [alias for alias, target in self.aliases.items() if target == doc_id or alias == doc_id]
+            for alias in aliases:
+                del self.aliases[alias]
+            with self.conn:
+                self.conn.execute("DELETE FROM signatures WHERE doc_id = ?", (doc_id,))
+                self.conn.executemany("DELETE FROM aliases WHERE alias = ?", [(alias,) for alias in aliases])
+
+    def stats(self):
+        with self._lock:
+            return {"documents": len(self.signatures), "aliases": len(self.aliases), "buckets": len(self.buckets)}
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,238 @@
+# rag-service/src/directory_loader.py
+import hashlib
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Files read ahead of the embedding batch currently being encoded
+READ_AHEAD_BATCHES = 4
+
+class FileManifest:
+    """
+    SQLite record of the files ingested from a directory.
+
+    One row per file: relative path, size, mtime (ns), SHA-256 of the
+    content and the document id it was indexed under.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+            "sha256 TEXT NOT NULL, doc_id TEXT NOT NULL)"
+        )
+        self.conn.commit()
+
+    def load(self) -> Dict[str, Tuple[int, int, str, str]]:
+        """path -> (size, mtime_ns, sha256, doc_id)"""
+        rows = self.conn.execute("SELECT path, size, mtime_ns, sha256, doc_id FROM files")
+        return {path: (size, mtime_ns, sha256, doc_id) for path, size, mtime_ns, sha256, doc_id in rows}
+
+    def upsert(self, rows: Iterable[Tuple[str, int, int, str, str]]):
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", rows)
+
+    def remove(self, paths: Iterable[str]):
+        with self.conn:
+            self.conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in paths])
+
+    def close(self):
+        self.conn.close()
+
+def document_id(rel_path: str) -> str:
+    """Stable document id of a file, so a changed file replaces its previous version"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, rel_path.replace(os.sep, "/")))
+
+def scan(directory: str, file_extensions: Optional[List[str]] = None) -> Iterator[Tuple[str, int, int]]:
+    """Yield (relative path, size, mtime_ns) of every matching file, reading only directory entries"""
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = list(os.scandir(current))
+        except OSError as e:
+            print(f"Error scanning {current}: {e}")
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+            elif entry.is_file():
+                if file_extensions and not any(entry.name.endswith(ext) for ext in file_extensions):
+                    continue
+                stat = entry.stat()
+                yield os.path.relpath(entry.path, directory), stat.st_size, stat.st_mtime_ns
+
+def _read(directory: str, rel_path: str) -> Tuple[str, Optional[str], Optional[str]]:
+    """(relative path, text, sha256), or text None with the error message as third value"""
+    try:
+        with open(os.path.join(directory, rel_path), "rb") as f:
+            data = f.read()
+        return rel_path, data.decode("utf-8"), hashlib.sha256(data).hexdigest()
+    except (OSError, UnicodeDecodeError) as e:
+        return rel_path, None, str(e)
+
+class DirectorySync:
+    """
+    Incremental, parallel ingestion of a directory tree.
+
+    A sync stats every file but only reads files whose size or mtime differ
+    from the manifest, on a pool of reader threads that also decode and hash
+    them. Files whose content hash did not change are not re-embedded.
+    Changed texts are embedded in batches and handed to ``add_batch``, after
+    the previous version of an updated file was passed to ``delete``; files
+    gone from the tree are passed to ``delete`` too. The manifest is
+    updated after every batch, so an interrupted sync resumes where it
+    stopped.
+    """
+
+    def __init__(self, embeddings_model, add_batch: Callable, delete: Callable[[str], object],
+                 manifest_path: str, readers: int = 8, batch_size: int = 64,
+                 progress: Optional[Callable[[Dict[str, float]], None]] = None, progress_interval: float = 5.0):
+        """
+        Args:
+            embeddings_model: Model with an encode(list of texts, batch_size) method
+            add_batch: Called with (doc_ids, texts, metadata_list, vectors) per batch
+            delete: Called with the doc_id of every removed or updated file,
+                the latter right before its new version is added
+            manifest_path: SQLite file recording the ingested files
+            readers: Threads reading, decoding and hashing files
+            batch_size: Files embedded and added together
+            progress: Called with the running counters, by default printed
+            progress_interval: Seconds between progress reports
+        """
+        self.embeddings_model = embeddings_model
+        self.add_batch = add_batch
+        self.delete = delete
+        self.manifest_path = manifest_path
+        self.readers = readers
+        self.batch_size = batch_size
+        self.progress = progress or self._print_progress
+        self.progress_interval = progress_interval
+
+    @staticmethod
+    def _print_progress(stats):
+        print(
+            f"Sync: {stats['scanned']} scanned, {stats['read']} read, {stats['added']} added, "
+            f"{stats['updated']} updated, {stats['deleted']} deleted, {stats['failed']} failed "
+            f"({stats['files_per_second']:.0f} files/s, {stats['mb_per_second']:.1f} MB/s read)"
+        )
+
+    def sync(self, directory: str, file_extensions: Optional[List[str]] = None) -> Dict[str, float]:
+        """
+        Bring the index in line with the directory
+
+        Returns:
+            Counters of the sync: scanned, unchanged, read, added, updated,
+            deleted and failed files, seconds and throughput
+        """
+        started = time.perf_counter()
+        stats = dict(scanned=0, unchanged=0, read=0, added=0, updated=0, deleted=0, failed=0, bytes_read=0)
+        last_report = [started]
+
+        def report(final=False):
+            now = time.perf_counter()
+            if not final and now - last_report[0] < self.progress_interval:
+                return
+            last_report[0] = now
+            elapsed = max(now - started, 1e-9)
+            stats.update(
+                seconds=elapsed,
+                files_per_second=stats["scanned"] / elapsed,
+                mb_per_second=stats["bytes_read"] / elapsed / 1e6
+            )
+            self.progress(dict(stats))
+
+        manifest = FileManifest(self.manifest_path)
+        try:
+            known = manifest.load()
+            seen = set()
+            candidates = []
+            for rel_path, size, mtime_ns in scan(directory, file_extensions):
+                stats["scanned"] += 1
+                seen.add(rel_path)
+                previous = known.get(rel_path)
+                if previous is not None and previous[0] == size and previous[1] == mtime_ns:
+                    stats["unchanged"] += 1
+                else:
+                    candidates.append((rel_path, size, mtime_ns))
+                report()
+
+            if candidates:
+                self._ingest(directory, candidates, known, manifest, stats, report)
+
+            removed = [rel_path for rel_path in known if rel_path not in seen]
+            for rel_path in removed:
+                self.delete(known[rel_path][3])
+                stats["deleted"] += 1
+            manifest.remove(removed)
+        finally:
+            manifest.close()
+        report(final=True)
+        return stats
+
+    def _ingest(self, directory, candidates, known, manifest, stats, report):
+        """Read candidates in parallel and embed the changed ones in batches"""
+        batch = []
+        touched = []
+        updated = []
+
+        def flush():
+            if batch:
+                # Updated files keep their doc_id, drop the old version first
+                # so it does not stay searchable next to the new one
+                for doc_id in updated:
+                    self.delete(doc_id)
+                texts = [text for _, text, _, _ in batch]
+                vectors = self.embeddings_model.encode(texts, batch_size=self.batch_size)
+                self.add_batch(
+                    [doc_id for _, _, _, doc_id in batch],
+                    texts,
+                    [metadata for _, _, metadata, _ in batch],
+                    vectors
+                )
+            manifest.upsert(touched)
+            batch.clear()
+            touched.clear()
+            updated.clear()
+
+        window = self.batch_size * READ_AHEAD_BATCHES
+        stat_of = {rel_path: (size, mtime_ns) for rel_path, size, mtime_ns in candidates}
+        with ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix="sync-reader") as pool:
+            # Submit a bounded window at a time so memory stays flat on huge trees
+            for start in range(0, len(candidates), window):
+                reads = pool.map(lambda c: _read(directory, c[0]), candidates[start:start + window])
+                for rel_path, text, digest in reads:
+                    if text is None:
+                        print(f"Error loading {rel_path}: {digest}")
+                        stats["failed"] += 1
+                        continue
+                    stats["read"] += 1
+                    stats["bytes_read"] += stat_of[rel_path][0]
+                    size, mtime_ns = stat_of[rel_path]
+                    previous = known.get(rel_path)
+                    doc_id = previous[3] if previous is not None else document_id(rel_path)
+                    touched.append((rel_path, size, mtime_ns, digest, doc_id))
+                    if previous is not None and previous[2] == digest:
+                        # Touched but unchanged, only the stat is new
+                        stats["unchanged"] += 1
+                        continue
+                    stats["updated" if previous is not None else "added"] += 1
+                    metadata = {
+                        "source": rel_path,
+                        "filename": os.path.basename(rel_path),
+                        "sha256": digest,
+                        "imported_at": time.time()
+                    }
+                    batch.append((rel_path, text, metadata, doc_id))
+                    if previous is not None:
+                        updated.append(doc_id)
+                    if len(batch) >= self.batch_size:
+                        flush()
+                    report()
+        flush()
@@ -0,0 +1,117 @@
+# rag-service/src/doc_store.py
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Largest number of bound parameters per IN (...) lookup
+LOOKUP_BATCH = 500
+
+class DocumentStore:
+    """
+    SQLite-backed storage for document texts and metadata.
+
+    Rows are keyed by the vector store's int64 ids, so a search only reads
+    the rows of its top hits instead of holding every text in memory. The
+    database runs in WAL mode: each thread reads through its own connection
+    while a checkpoint commits, and worker processes opening the same file
+    share the OS page cache. Metadata is stored as JSON, never pickled.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id INTEGER PRIMARY KEY, doc_id TEXT NOT NULL, parent_id TEXT, "
+            "text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def get_state(self) -> Optional[Dict[str, Any]]:
+        """Persisted vector store state, or None for a database never committed to"""
+        rows = self._connection().execute("SELECT key, value FROM state").fetchall()
+        if not rows:
+            return None
+        return {key: json.loads(value) for key, value in rows}
+
+    def iter_records(self) -> Iterator[Tuple[int, str, Dict[str, Any]]]:
+        """Yield (id, doc_id, metadata) of every stored document"""
+        for int_id, doc_id, metadata in self._connection().execute("SELECT id, doc_id, metadata FROM documents"):
+            yield int_id, doc_id, json.loads(metadata)
+
+    def iter_texts(self) -> Iterator[Tuple[int, str]]:
+        yield from self._connection().execute("SELECT id, text FROM documents")
+
+    def get_many(self, ids: Iterable[int]) -> Dict[int, Tuple[str, str, Dict[str, Any]]]:
+        """
+        Fetch stored documents by id
+
+        Returns:
+            Dict of id -> (doc_id, text, metadata); unknown ids are left out
+        """
+        ids = list(ids)
+        conn = self._connection()
+        found = {}
+        for start in range(0, len(ids), LOOKUP_BATCH):
+            batch = ids[start:start + LOOKUP_BATCH]
+            rows = conn.execute(
+                f"SELECT id, doc_id, text, metadata FROM documents WHERE id IN ({','.join('?' * len(batch))})",
+                batch
+            )
+            for int_id, doc_id, text, metadata in rows:
+                found[int_id] = (doc_id, text, json.loads(metadata))
+        return found
+
+    def commit(self, changes: Dict[int, Optional[Tuple[str, str, Dict[str, Any]]]], state: Dict[str, Any]):
+        """
+        Apply buffered changes and the new state in one transaction
+
+        Args:
+            changes: id -> (doc_id, text, metadata) to insert or replace, or
+                None to delete
+            state: Values replacing the persisted state
+        """
+        upserts = []
+        deletes = []
+        for int_id, record in changes.items():
+            if record is None:
+                deletes.append((int_id,))
+            else:
+                doc_id, text, metadata = record
+                upserts.append((int_id, doc_id, metadata.get("parent_id"), text, json.dumps(metadata)))
+
+        conn = self._connection()
+        with conn:
+            conn.executemany("DELETE FROM documents WHERE id = ?", deletes)
+            conn.executemany(
+                "INSERT OR REPLACE INTO documents (id, doc_id, parent_id, text, metadata) VALUES (?, ?, ?, ?, ?)",
+                upserts
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in state.items()]
+            )
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
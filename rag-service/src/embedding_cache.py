@@ -0,0 +1,147 @@
+# rag-service/src/embedding_cache.py
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+class DiskEmbeddingCache:
+    """
+    Fixed-size, memory-mapped embedding cache that survives restarts.
+
+    Slots are direct-mapped from the key hash: a colliding insert simply
+    overwrites the older entry, so no index structure has to be persisted
+    and lookups are a single page access.
+    """
+
+    KEY_BYTES = 32
+
+    def __init__(self, directory: str, dimension: int, capacity: int = 100000):
+        self.dimension = dimension
+        self.capacity = capacity
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.join(directory, f"embeddings_{dimension}_{capacity}")
+        self.keys = self._open(prefix + ".keys", np.uint8, (capacity, self.KEY_BYTES))
+        self.vectors = self._open(prefix + ".vectors", np.float32, (capacity, dimension))
+
+    @staticmethod
+    def _open(path, dtype, shape):
+        mode = "r+" if os.path.exists(path) else "w+"
+        return np.memmap(path, dtype=dtype, mode=mode, shape=shape)
+
+    def _slot(self, key: bytes) -> int:
+        return int.from_bytes(key[:8], "little") % self.capacity
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        slot = self._slot(key)
+        if self.keys[slot].tobytes() != key:
+            return None
+        return np.array(self.vectors[slot])
+
+    def put(self, key: bytes, vector: np.ndarray) -> bool:
+        """Store a vector, returning True if it evicted another entry"""
+        slot = self._slot(key)
+        evicted = self.keys[slot].any() and self.keys[slot].tobytes() != key
+        # Write the vector before the key so a half-written slot never matches
+        self.vectors[slot] = vector
+        self.keys[slot] = np.frombuffer(key, dtype=np.uint8)
+        return bool(evicted)
+
+    def flush(self):
+        self.vectors.flush()
+        self.keys.flush()
+
+class EmbeddingCache:
+    """
+    Content-addressed cache of text embeddings.
+
+    Entries are keyed by a SHA-256 of (model name, normalized text) and kept
+    in a bounded in-memory LRU, optionally backed by a DiskEmbeddingCache.
+    """
+
+    def __init__(self, model_name: str, dimension: int, capacity: int = 10000,
+                 disk_dir: Optional[str] = None, disk_capacity: int = 100000):
+        self.model_name = model_name
+        self.capacity = capacity
+        self.disk = DiskEmbeddingCache(disk_dir, dimension, disk_capacity) if disk_dir else None
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Collapse whitespace so trivially different copies share an entry"""
+        return " ".join(text.split())
+
+    def key(self, text: str) -> bytes:
+        payload = self.model_name + "\0" + self.normalize(text)
+        return hashlib.sha256(payload.encode("utf-8")).digest()
+
+    def get(self, text: str, count_miss: bool = True) -> Optional[np.ndarray]:
+        """
+        Return the cached vector for ``text`` or None
+
+        Probes that are followed by a counted lookup anyway (e.g. the
+        scheduler fast path) pass count_miss=False to avoid double counting.
+        """
+        key = self.key(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+
+            if self.disk is not None:
+                vector = self.disk.get(key)
+                if vector is not None:
+                    self.disk_hits += 1
+                    self._remember(key, vector)
+                    return vector
+
+            if count_miss:
+                self.misses += 1
+            return None
+
+    def put(self, text: str, vector: np.ndarray):
+        key = self.key(text)
+        vector = np.array(vector, dtype=np.float32)
+        with self._lock:
+            self._remember(key, vector)
+            if self.disk is not None and self.disk.put(key, vector):
+                self.disk_evictions += 1
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        vector.setflags(write=False)
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def flush(self):
+        if self.disk is not None:
+            with self._lock:
+                self.disk.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_evictions": self.disk_evictions,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "disk_enabled": self.disk is not None
+            }
@@ -0,0 +1,146 @@
+# rag-service/src/embedding_scheduler.py
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict
+
+import numpy as np
+
+import metrics
+
+BATCH_SIZE = metrics.histogram(
+    "rag_embedding_batch_size", "Texts encoded per micro-batch", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+QUEUE_WAIT_SECONDS = metrics.histogram(
+    "rag_embedding_queue_wait_seconds", "Time a query text waited for its micro-batch to start"
+)
+ENCODE_SECONDS = metrics.histogram("rag_embedding_batch_seconds", "Time to encode one micro-batch")
+
+class EmbeddingScheduler:
+    """
+    Dynamic micro-batching in front of Embeddings.
+
+    Concurrent single-text encode requests are queued and collected for up to
+    ``max_batch_size`` items or ``max_wait_ms`` milliseconds, whichever comes
+    first, then encoded with one batched forward pass. Each caller gets its
+    own row back through a future.
+    """
+
+    def __init__(self, embeddings, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.embeddings = embeddings
+        # Both knobs are read on every batch, so they can be tuned at runtime
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._queue_wait_seconds = 0.0
+        self._encode_seconds = 0.0
+        self._largest_batch = 0
+
+        # Guards _stopped, so nothing is queued after the worker was told to exit
+        self._submit_lock = threading.Lock()
+        self._stopped = False
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        """Queue a text for encoding and return a future for its vector"""
+        future = Future()
+        # Cache hits never wait for a batching window. While the model is
+        # still loading the probe would block the caller (the event loop), so
+        # the text is queued and the worker's encode checks the cache instead.
+        if getattr(self.embeddings, "is_loaded", True):
+            cached = self.embeddings.cached(text)
+            if cached is not None:
+                future.set_result(cached)
+                return future
+        with self._submit_lock:
+            if self._stopped:
+                future.set_exception(RuntimeError("Embedding scheduler is closed"))
+            else:
+                self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def encode(self, text: str) -> np.ndarray:
+        """Blocking encode of a single text through the batcher"""
+        return self.submit(text).result()
+
+    async def encode_async(self, text: str) -> np.ndarray:
+        """Encode a single text without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(text))
+
+    def _collect(self):
+        """Block for the first request, then gather more until the batch is full or the window closes"""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = [item for item in self._collect() if item is not None]
+            if batch:
+                self._encode(batch)
+            # The stop marker is queued last, so everything before it was encoded
+            if self._stopped and self._queue.empty():
+                return
+
+    def _encode(self, batch):
+        texts = [text for text, _, _ in batch]
+        started = time.perf_counter()
+        try:
+            vectors = self.embeddings.encode(texts, batch_size=len(texts))
+            for (_, future, _), vector in zip(batch, vectors):
+                future.set_result(vector)
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+        finished = time.perf_counter()
+
+        with self._stats_lock:
+            self._batches += 1
+            self._items += len(batch)
+            self._largest_batch = max(self._largest_batch, len(batch))
+            self._encode_seconds += finished - started
+            self._queue_wait_seconds += sum(started - enqueued for _, _, enqueued in batch)
+        BATCH_SIZE.observe(len(batch))
+        ENCODE_SECONDS.observe(finished - started)
+        for _, _, enqueued in batch:
+            QUEUE_WAIT_SECONDS.observe(started - enqueued)
+
+    def stats(self) -> Dict[str, Any]:
+        """Batching configuration and counters"""
+        with self._stats_lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "queue_depth": self._queue.qsize(),
+                "batches": self._batches,
+                "items": self._items,
+                "largest_batch": self._largest_batch,
+                "mean_batch_size": self._items / self._batches if self._batches else 0.0,
+                "mean_queue_wait_ms": 1000.0 * self._queue_wait_seconds / self._items if self._items else 0.0,
+                "mean_encode_ms": 1000.0 * self._encode_seconds / self._batches if self._batches else 0.0
+            }
+
+    def close(self):
+        """
+        Stop the worker and return once the queued requests are drained;
+        later submissions fail instead of waiting forever
+        """
+        with self._submit_lock:
+            self._stopped = True
+            self._queue.put(None)
+        self._worker.join()
@@ -1,21 +1,175 @@
 # rag-service/src/embeddings.py
-from sentence_transformers import SentenceTransformer
+import json
+import os
 import numpy as np
-from typing import Union, List
+from typing import Optional, Union, List
 
-class Embeddings:
-    def __init__(self, model_name="all-MiniLM-L6-v2"):
-        """Initialize the embeddings model"""
+from embedding_cache import EmbeddingCache
+import metrics
+
+ENCODE_SECONDS = metrics.histogram("rag_embedding_encode_seconds", "Time spent in Embeddings.encode calls")
+MODEL_TEXTS = metrics.counter("rag_embedding_model_texts", "Texts encoded by the model (cache misses)")
+
+# "torch" runs the SentenceTransformer in fp32; "onnx" and "onnx_int8" run an
+# exported graph (see onnx_export.py) on ONNX Runtime without importing torch
+BACKENDS = ("torch", "onnx", "onnx_int8")
+
+class TorchBackend:
+    """SentenceTransformer model on PyTorch"""
+
+    def __init__(self, model_name: str, threads: Optional[int] = None):
+        # Deferred so importing this module does not pull in torch
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            torch.set_num_threads(threads)
         self.model = SentenceTransformer(model_name)
         self.dimension = self.model.get_sentence_embedding_dimension()
-        print(f"Loaded embedding model with dimension {self.dimension}")
 
-    def encode(self, text: Union[str, List[str]]) -> np.ndarray:
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        return self.model.encode(texts, batch_size=batch_size, show_progress_bar=False)
+
+class OnnxBackend:
+    """
+    Exported transformer graph on ONNX Runtime, with the model's pooling
+    and normalization done in numpy
+
+    Texts are sorted by length before batching so each batch pads to
+    similar lengths, then returned in input order.
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = True, threads: Optional[int] = None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, "export_config.json")) as f:
+            self.config = json.load(f)
+        self.dimension = self.config["dimension"]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"])
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.inter_op_num_threads = 1
+        if threads:
+            options.intra_op_num_threads = threads
+        model_file = "model_int8.onnx" if quantized else "model.onnx"
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": attention_mask,
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64)
+        }
+        hidden = self.session.run(None, {name: feeds[name] for name in self.input_names})[0]
+
+        if self.config["pooling"] == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.config["normalize"]:
+            pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.astype(np.float32)
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            embeddings[rows] = self._encode_batch([texts[i] for i in rows])
+        return embeddings
+
+def load_backend(backend: str, model_name: str, onnx_dir: Optional[str] = None, threads: Optional[int] = None):
+    """
+    Build an embedding backend
+
+    Args:
+        backend: One of BACKENDS
+        model_name: SentenceTransformer model name
+        onnx_dir: Directory of the exported model for the ONNX backends;
+            exported there (which needs torch once) if it does not exist yet.
+            An automatic export is checked against the torch model, and
+            torch is used instead if it fails the check.
+        threads: Intra-op threads per encode call, None for the runtime default
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    if backend == "torch":
+        return TorchBackend(model_name, threads)
+
+    onnx_dir = onnx_dir or os.path.join("./models", f"{model_name.replace('/', '_')}-onnx")
+    parity_path = os.path.join(onnx_dir, "parity.json")
+    if not os.path.exists(os.path.join(onnx_dir, "export_config.json")):
+        from onnx_export import check_parity, export_onnx
+        export_onnx(model_name, onnx_dir)
+        report = check_parity(model_name, onnx_dir)
+        # Kept with the export, so a failed one is not trusted on the next start either
+        with open(parity_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    # Exports made with the CLI step carry no report and are trusted
+    if os.path.exists(parity_path):
+        with open(parity_path) as f:
+            result = json.load(f).get(backend)
+        if result is None or not result["passed"]:
+            print(f"{backend} export in {onnx_dir} failed the parity check ({result}), using torch instead")
+            return TorchBackend(model_name, threads)
+    return OnnxBackend(onnx_dir, quantized=backend == "onnx_int8", threads=threads)
+
+class Embeddings:
+    def __init__(self, model_name="all-MiniLM-L6-v2", cache_size=10000, cache_dir=None, disk_cache_size=100000,
+                 backend="torch", onnx_dir=None, threads=None):
+        """
+        Initialize the embeddings model
+
+        Args:
+            model_name: SentenceTransformer model to load
+            cache_size: Entries kept in the in-memory LRU cache (0 disables caching)
+            cache_dir: Optional directory for the memory-mapped on-disk cache tier
+            disk_cache_size: Number of slots in the on-disk cache
+            backend: Inference backend, one of BACKENDS
+            onnx_dir: Exported model directory for the ONNX backends
+            threads: Intra-op threads used by the backend
+        """
+        self.model_name = model_name
+        self.model = load_backend(backend, model_name, onnx_dir, threads)
+        # An ONNX export that failed its parity check falls back to torch
+        self.backend = backend = "torch" if isinstance(self.model, TorchBackend) else backend
+        self.dimension = self.model.dimension
+        # Int8 vectors differ slightly from fp32 ones, so they get their own cache entries
+        self.cache = EmbeddingCache(
+            model_name if backend == "torch" else f"{model_name}:{backend}",
+            self.dimension,
+            capacity=cache_size,
+            disk_dir=cache_dir,
+            disk_capacity=disk_cache_size
+        ) if cache_size > 0 else None
+        print(f"Loaded embedding model with dimension {self.dimension} ({backend} backend)")
+
+    def cached(self, text: str) -> Optional[np.ndarray]:
+        """Return the cached embedding for text without running the model, or None"""
+        if self.cache is None or not text:
+            return None
+        return self.cache.get(text, count_miss=False)
+
+    def encode(self, text: Union[str, List[str]], batch_size: int = 32) -> np.ndarray:
         """
         Encode text into embeddings
         
         Args:
             text: String or list of strings to encode
+            batch_size: Number of texts per forward pass when encoding a list
             
         Returns:
             numpy array of embeddings
@@ -27,14 +181,30 @@ class Embeddings:
             else:
                 return np.zeros((len(text), self.dimension))
         
-        # Encode text
-        embeddings = self.model.encode(text, show_progress_bar=False)
-        return embeddings
+        with ENCODE_SECONDS.time():
+            if self.cache is None:
+                # Encode text
+                embeddings = self.model.encode([text] if isinstance(text, str) else list(text), batch_size=batch_size)
+                MODEL_TEXTS.inc(len(embeddings))
+                return embeddings[0] if isinstance(text, str) else embeddings
+            
+            # Only texts missing from the cache go through the model
+            texts = [text] if isinstance(text, str) else list(text)
+            vectors = [self.cache.get(t) for t in texts]
+            missing = [i for i, vector in enumerate(vectors) if vector is None]
+            if missing:
+                encoded = self.model.encode([texts[i] for i in missing], batch_size=batch_size)
+                MODEL_TEXTS.inc(len(missing))
+                for i, vector in zip(missing, encoded):
+                    vectors[i] = vector
+                    self.cache.put(texts[i], vector)
+            
+            embeddings = np.vstack(vectors)
+            return embeddings[0] if isinstance(text, str) else embeddings
         
     def similarity(self, text1: str, text2: str) -> float:
         """Calculate cosine similarity between two texts"""
-        emb1 = self.encode(text1)
-        emb2 = self.encode(text2)
+        emb1, emb2 = self.encode([text1, text2])
         
         # Normalize vectors
         emb1 = emb1 / np.linalg.norm(emb1)
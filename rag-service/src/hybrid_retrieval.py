@@ -1,23 +1,232 @@
-from some_bm25_library import BM25
-from some_semantic_search_library import SemanticSearch
-
-class HybridRetrieval:
-    def __init__(self, documents):
-        self.bm25 = BM25(documents)
-        self.semantic_search = SemanticSearch(documents)
-
-    def retrieve(self, query):
-        bm25_results = self.bm25.search(query)
-        semantic_results = self.semantic_search.search(query)
-        # Combine BM25 and Semantic Search results
-        combined_results = self.combine_results(bm25_results, semantic_results)
-        return combined_results
-
-    def combine_results(self, bm25_results, semantic_results):
-        # Implement logic to combine results
-        return bm25_results + semantic_results
-
-# Usage
-documents = ["doc1", "doc2", "doc3"]
-hybrid_retrieval = HybridRetrieval(documents)
-results = hybrid_retrieval.retrieve(query="your_query")
\ No newline at end of file
+# rag-service/src/hybrid_retrieval.py
+import io
+import math
+import re
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens used for both indexing and querying"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+class BM25Index:
+    """
+    Incremental in-process BM25 inverted index.
+
+    Postings are kept per term as two compact parallel arrays (int64 doc ids,
+    uint32 term frequencies), and document lengths in a dense array indexed
+    by doc id. Deletes zero the length and are filtered at query time, then
+    physically dropped by compact(), so both add and delete are proportional
+    to the size of the document rather than the corpus. Document frequencies
+    include deleted postings until the next compaction.
+
+    Searches need no lock against a single writer: they read views of the
+    postings, and an add that finds its arrays viewed appends to copies.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.lengths = np.zeros(1024, dtype=np.float32)
+        self.live = np.zeros(1024, dtype=bool)
+        self.doc_count = 0
+        self.total_length = 0
+        self.deleted_docs = 0
+
+    def __len__(self):
+        return self.doc_count
+
+    def _grow(self, doc_id: int):
+        if doc_id < len(self.lengths):
+            return
+        size = max(doc_id + 1, 2 * len(self.lengths))
+        self.lengths = np.concatenate([self.lengths, np.zeros(size - len(self.lengths), dtype=np.float32)])
+        self.live = np.concatenate([self.live, np.zeros(size - len(self.live), dtype=bool)])
+
+    def add(self, doc_id: int, text: str):
+        """
+        Index a document under an integer id
+
+        Ids of deleted documents must not be reused before compact() runs,
+        their old postings would otherwise come back to life.
+        """
+        self.delete(doc_id)
+        self._grow(doc_id)
+
+        tokens = tokenize(text)
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for term, tf in counts.items():
+            ids, tfs = self.postings.setdefault(term, (array("q"), array("I")))
+            try:
+                ids.append(doc_id)
+            except BufferError:
+                # A concurrent search holds a view of the postings, append to a copy
+                ids = array("q", ids)
+                ids.append(doc_id)
+            try:
+                tfs.append(tf)
+            except BufferError:
+                tfs = array("I", tfs)
+                tfs.append(tf)
+            self.postings[term] = (ids, tfs)
+
+        self.lengths[doc_id] = len(tokens)
+        self.live[doc_id] = True
+        self.doc_count += 1
+        self.total_length += len(tokens)
+
+    def delete(self, doc_id: int):
+        if doc_id >= len(self.live) or not self.live[doc_id]:
+            return
+        self.total_length -= int(self.lengths[doc_id])
+        self.doc_count -= 1
+        self.deleted_docs += 1
+        self.lengths[doc_id] = 0
+        self.live[doc_id] = False
+
+    def search(self, query: str, k: int = 10, allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Return up to k (doc_id, score) pairs, best first
+
+        Args:
+            allowed: Optional sorted array of the only doc ids to consider
+        """
+        n_docs = self.doc_count
+        if n_docs == 0 or k <= 0:
+            return []
+        avg_length = self.total_length / n_docs
+
+        all_ids = []
+        all_scores = []
+        for term in set(tokenize(query)):
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            # A concurrent add may have extended one of the arrays already
+            count = min(len(entry[0]), len(entry[1]))
+            ids = np.frombuffer(entry[0], dtype=np.int64)[:count]
+            tfs = np.frombuffer(entry[1], dtype=np.uint32)[:count].astype(np.float32)
+            df = len(ids)
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * self.lengths[ids] / avg_length)
+            all_ids.append(ids)
+            all_scores.append(idf * tfs * (self.k1 + 1.0) / (tfs + norm))
+
+        if not all_ids:
+            return []
+        ids = np.concatenate(all_ids)
+        scores = np.concatenate(all_scores)
+
+        if self.deleted_docs:
+            live = self.live[ids]
+            ids, scores = ids[live], scores[live]
+        if allowed is not None:
+            keep = np.isin(ids, allowed)
+            ids, scores = ids[keep], scores[keep]
+        if len(ids) == 0:
+            return []
+
+        unique_ids, inverse = np.unique(ids, return_inverse=True)
+        totals = np.bincount(inverse, weights=scores)
+        top = np.argsort(-totals)[:k]
+        return [(int(unique_ids[i]), float(totals[i])) for i in top]
+
+    def compact(self):
+        """Physically drop postings of deleted documents"""
+        if not self.deleted_docs:
+            return
+        for term in list(self.postings):
+            ids, tfs = self.postings[term]
+            ids_np = np.frombuffer(ids, dtype=np.int64)
+            live = self.live[ids_np]
+            if live.all():
+                continue
+            if not live.any():
+                del self.postings[term]
+                continue
+            self.postings[term] = (
+                array("q", ids_np[live].tobytes()),
+                array("I", np.frombuffer(tfs, dtype=np.uint32)[live].tobytes())
+            )
+        self.deleted_docs = 0
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialize to an .npz archive of flat arrays
+
+        Postings are concatenated with per-term offsets, so loading needs no
+        unpickling and one slice per term.
+        """
+        terms = list(self.postings)
+        counts = np.array([len(self.postings[term][0]) for term in terms], dtype=np.int64)
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            params=np.array([self.k1, self.b], dtype=np.float64),
+            counters=np.array([self.doc_count, self.total_length, self.deleted_docs], dtype=np.int64),
+            terms=np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8),
+            offsets=np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            ids=np.concatenate([np.frombuffer(self.postings[term][0], dtype=np.int64) for term in terms]) if terms else np.zeros(0, np.int64),
+            tfs=np.concatenate([np.frombuffer(self.postings[term][1], dtype=np.uint32) for term in terms]) if terms else np.zeros(0, np.uint32),
+            lengths=self.lengths,
+            live=self.live
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BM25Index":
+        state = np.load(io.BytesIO(data), allow_pickle=False)
+        k1, b = state["params"]
+        index = cls(k1=float(k1), b=float(b))
+        index.doc_count, index.total_length, index.deleted_docs = (int(value) for value in state["counters"])
+        index.lengths = state["lengths"]
+        index.live = state["live"]
+
+        terms = state["terms"].tobytes().decode("utf-8").split("\n")
+        offsets, ids, tfs = state["offsets"], state["ids"], state["tfs"]
+        for i, term in enumerate(terms if len(offsets) > 1 else []):
+            start, end = offsets[i], offsets[i + 1]
+            index.postings[term] = (array("q", ids[start:end].tobytes()), array("I", tfs[start:end].tobytes()))
+        return index
+
+def reciprocal_rank_fusion(vector_ranking: List[int], keyword_ranking: List[int],
+                           alpha: float = 0.7, rank_constant: int = 60) -> Dict[int, float]:
+    """
+    Weighted reciprocal-rank fusion of two best-first id lists
+
+    alpha weights the vector ranking (0 = BM25 only, 1 = vector only).
+    """
+    scores: Dict[int, float] = {}
+    for rank, doc_id in enumerate(vector_ranking):
+        scores[doc_id] = scores.get(doc_id, 0.0) + alpha / (rank_constant + rank + 1)
+    for rank, doc_id in enumerate(keyword_ranking):
+        scores[doc_id] = scores.get(doc_id, 0.0) + (1.0 - alpha) / (rank_constant + rank + 1)
+    return scores
+
+def weighted_fusion(vector_scores: Dict[int, float], keyword_scores: Dict[int, float],
+                    alpha: float = 0.7) -> Dict[int, float]:
+    """
+    Convex combination of min-max normalized scores (higher is better)
+
+    alpha weights the vector scores (0 = BM25 only, 1 = vector only).
+    """
+    def normalize(scores):
+        if not scores:
+            return {}
+        low, high = min(scores.values()), max(scores.values())
+        span = high - low
+        return {doc_id: (score - low) / span if span > 0 else 1.0 for doc_id, score in scores.items()}
+
+    vector_norm = normalize(vector_scores)
+    keyword_norm = normalize(keyword_scores)
+    return {
+        doc_id: alpha * vector_norm.get(doc_id, 0.0) + (1.0 - alpha) * keyword_norm.get(doc_id, 0.0)
+        for doc_id in set(vector_norm) | set(keyword_norm)
+    }
@@ -0,0 +1,102 @@
+# rag-service/src/index_factory.py
+import math
+
+import faiss
+import numpy as np
+
+# Approximate index kinds the vector store can be configured with:
+#   flat      - exact brute force, 4 bytes per dimension
+#   hnsw      - HNSW graph over full float32 vectors (fast, most memory)
+#   hnsw_sq8  - HNSW graph over 8-bit scalar quantized vectors (~4x smaller)
+#   ivfpq     - inverted lists over product-quantized codes (dimension / 8 bytes)
+INDEX_TYPES = ("flat", "hnsw", "hnsw_sq8", "ivfpq")
+
+HNSW_M = 32
+
+def validate_index_type(index_type: str) -> str:
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {', '.join(INDEX_TYPES)}")
+    return index_type
+
+def requires_training(index_type: str) -> bool:
+    return index_type in ("hnsw_sq8", "ivfpq")
+
+def supports_remove(index_type: str) -> bool:
+    """HNSW graphs cannot drop nodes, deletions there have to be masked out"""
+    return index_type in ("flat", "ivfpq")
+
+def ivf_lists(n_vectors: int) -> int:
+    """
+    Number of IVF cells: ~4 * sqrt(N) as recommended by the FAISS guidelines,
+    capped so every cell gets the ~39 training points k-means wants
+    """
+    return max(16, min(65536, int(4 * math.sqrt(max(n_vectors, 1))), n_vectors // 39))
+
+def pq_subquantizers(dimension: int) -> int:
+    """Largest code size of at most dimension / 8 bytes that divides the dimension"""
+    for m in range(max(dimension // 8, 1), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+def min_training_size(index_type: str) -> int:
+    """Vectors needed before a compressed index can be trained"""
+    if index_type == "hnsw_sq8":
+        # The scalar quantizer only learns per-dimension ranges
+        return 1000
+    if index_type == "ivfpq":
+        # FAISS wants ~39 training points per centroid, PQ codebooks have 256
+        return 39 * 256
+    return 0
+
+def build_index(index_type: str, dimension: int, n_vectors: int = 0) -> faiss.Index:
+    """
+    Create an empty index of the given type that stores our int64 ids
+
+    n_vectors sizes the IVF coarse quantizer for the corpus it will hold.
+    """
+    validate_index_type(index_type)
+    if index_type == "ivfpq":
+        # IVF indexes store ids natively; a hashtable direct map allows
+        # reconstruct() and remove_ids() on arbitrary ids
+        nlist = ivf_lists(n_vectors)
+        index = faiss.index_factory(dimension, f"IVF{nlist},PQ{pq_subquantizers(dimension)}")
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        index.nprobe = max(8, nlist // 32)
+        return index
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dimension)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M)
+    else:
+        index = faiss.index_factory(dimension, f"HNSW{HNSW_M},SQ8")
+    return faiss.IndexIDMap2(index)
+
+def remove_ids(index: faiss.Index, ids) -> int:
+    """Remove ids from an index that supports it"""
+    ids = np.ascontiguousarray(ids, dtype="int64")
+    # The IVF hashtable direct map only accepts an array selector
+    return index.remove_ids(faiss.IDSelectorArray(len(ids), faiss.swig_ptr(ids)))
+
+def make_search_params(index_type: str, index: faiss.Index, selector=None, ef_search: int = None, nprobe: int = None):
+    """
+    Per-call search parameters matching the index type
+
+    Parameter objects override the index's own settings, so the index's
+    defaults are carried over unless ef_search / nprobe are given.
+    """
+    if index_type in ("hnsw", "hnsw_sq8"):
+        hnsw = faiss.downcast_index(index.index).hnsw
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search or hnsw.efSearch)
+    if index_type == "ivfpq":
+        return faiss.SearchParametersIVF(sel=selector, nprobe=min(nprobe or index.nprobe, index.nlist))
+    return faiss.SearchParameters(sel=selector)
+
+def default_search_effort(index_type: str, index: faiss.Index) -> int:
+    """The index's own efSearch (HNSW) or nprobe (IVF), 0 for exact indexes"""
+    if index_type in ("hnsw", "hnsw_sq8"):
+        return faiss.downcast_index(index.index).hnsw.efSearch
+    if index_type == "ivfpq":
+        return index.nprobe
+    return 0
@@ -0,0 +1,200 @@
+# rag-service/src/metadata_filter.py
+import bisect
+import threading
+from numbers import Number
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+# Chunk bookkeeping written by chunking.chunk_records, not useful to filter on
+EXCLUDED_FIELDS = ("chunk_index", "start", "end")
+
+RANGE_OPERATORS = ("$gt", "$gte", "$lt", "$lte")
+
+def _kind(value):
+    """Values are only compared with values of the same kind"""
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, Number):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    return None
+
+class MetadataIndex:
+    """
+    Inverted index from metadata field values to int64 record ids.
+
+    Every indexed field keeps a posting set per distinct value, plus sorted
+    value lists per kind for range queries. Filters use a small MongoDB-like
+    syntax; fields are ANDed:
+
+        {"source": "user_upload"}                     equality
+        {"contract_type": {"$in": ["nda", "msa"]}}    any of
+        {"tenant": {"$ne": "acme"}}                   not equal ($nin: none of)
+        {"date": {"$gte": "2024-01-01", "$lt": "2025-01-01"}}
+        {"$or": [{...}, {...}]}
+
+    Dates are compared as strings, so store them in ISO 8601 form. A list
+    value matches if any of its elements does.
+    """
+
+    def __init__(self, fields: Optional[Iterable[str]] = None):
+        """
+        Args:
+            fields: Metadata fields to index; None indexes every top-level
+                scalar or list-of-scalars field
+        """
+        self.fields = set(fields) if fields is not None else None
+        self.postings: Dict[str, Dict[Any, Set[int]]] = {}
+        self._sorted: Dict[str, Dict[str, List[Any]]] = {}
+        self.all_ids: Set[int] = set()
+        # Searches evaluate filters without the store's write lock
+        self._lock = threading.Lock()
+
+    def _values(self, metadata: Dict[str, Any]):
+        for field, value in metadata.items():
+            if field in EXCLUDED_FIELDS or (self.fields is not None and field not in self.fields):
+                continue
+            for item in (value if isinstance(value, (list, tuple)) else [value]):
+                if _kind(item) is not None:
+                    yield field, item
+
+    def add(self, int_id: int, metadata: Dict[str, Any]):
+        with self._lock:
+            self.all_ids.add(int_id)
+            for field, value in self._values(metadata):
+                values = self.postings.setdefault(field, {})
+                if value not in values:
+                    values[value] = set()
+                    self._sorted.pop(field, None)
+                values[value].add(int_id)
+
+    def remove(self, int_id: int, metadata: Dict[str, Any]):
+        with self._lock:
+            self.all_ids.discard(int_id)
+            for field, value in self._values(metadata):
+                values = self.postings.get(field, {})
+                ids = values.get(value)
+                if ids is None:
+                    continue
+                ids.discard(int_id)
+                if not ids:
+                    del values[value]
+                    self._sorted.pop(field, None)
+
+    def _sorted_values(self, field: str, kind: str) -> List[Any]:
+        by_kind = self._sorted.get(field)
+        if by_kind is None:
+            by_kind = {}
+            for value in self.postings.get(field, {}):
+                by_kind.setdefault(_kind(value), []).append(value)
+            for values in by_kind.values():
+                values.sort()
+            self._sorted[field] = by_kind
+        return by_kind.get(kind, [])
+
+    def _equal(self, field: str, value: Any) -> Set[int]:
+        if _kind(value) is None:
+            raise ValueError(f"Unsupported filter value for {field!r}: {value!r}")
+        return self.postings.get(field, {}).get(value, set())
+
+    def _range(self, field: str, condition: Dict[str, Any]) -> Set[int]:
+        bounds = [condition[op] for op in RANGE_OPERATORS if op in condition]
+        kinds = {_kind(bound) for bound in bounds}
+        if len(kinds) != 1 or None in kinds or "bool" in kinds:
+            raise ValueError(f"Range bounds for {field!r} must all be numbers or all be strings")
+        values = self._sorted_values(field, kinds.pop())
+
+        low, high = 0, len(values)
+        if "$gt" in condition:
+            low = max(low, bisect.bisect_right(values, condition["$gt"]))
+        if "$gte" in condition:
+            low = max(low, bisect.bisect_left(values, condition["$gte"]))
+        if "$lt" in condition:
+            high = min(high, bisect.bisect_left(values, condition["$lt"]))
+        if "$lte" in condition:
+            high = min(high, bisect.bisect_right(values, condition["$lte"]))
+
+        postings = self.postings[field] if values else {}
+        matched = set()
+        for value in values[low:high]:
+            matched |= postings[value]
+        return matched
+
+    def _field(self, field: str, condition: Any) -> Set[int]:
+        if field in EXCLUDED_FIELDS or (self.fields is not None and field not in self.fields):
+            raise ValueError(f"Field {field!r} is not filterable")
+        if not isinstance(condition, dict):
+            return self._equal(field, condition)
+
+        sets = []
+        unknown = set(condition) - {"$eq", "$ne", "$in", "$nin"} - set(RANGE_OPERATORS)
+        if unknown:
+            raise ValueError(f"Unsupported filter operator(s) for {field!r}: {', '.join(sorted(unknown))}")
+        if "$eq" in condition:
+            sets.append(self._equal(field, condition["$eq"]))
+        if "$in" in condition:
+            if not isinstance(condition["$in"], list):
+                raise ValueError(f"$in for {field!r} expects a list")
+            matched = set()
+            for value in condition["$in"]:
+                matched |= self._equal(field, value)
+            sets.append(matched)
+        if any(op in condition for op in RANGE_OPERATORS):
+            sets.append(self._range(field, condition))
+
+        excluded = set()
+        if "$ne" in condition:
+            excluded |= self._equal(field, condition["$ne"])
+        if "$nin" in condition:
+            if not isinstance(condition["$nin"], list):
+                raise ValueError(f"$nin for {field!r} expects a list")
+            for value in condition["$nin"]:
+                excluded |= self._equal(field, value)
+
+        matched = self._intersect(sets) if sets else set(self.all_ids)
+        return matched - excluded if excluded else matched
+
+    @staticmethod
+    def _intersect(sets: List[Set[int]]) -> Set[int]:
+        # Smallest first keeps every step proportional to the most selective condition
+        sets = sorted(sets, key=len)
+        result = set(sets[0])
+        for other in sets[1:]:
+            result &= other
+            if not result:
+                break
+        return result
+
+    def _evaluate(self, filters: Dict[str, Any]) -> Set[int]:
+        if not isinstance(filters, dict):
+            raise ValueError("Filters must be an object mapping fields to conditions")
+        sets = []
+        for field, condition in filters.items():
+            if field == "$or":
+                if not isinstance(condition, list) or not condition:
+                    raise ValueError("$or expects a non-empty list of filters")
+                matched = set()
+                for branch in condition:
+                    matched |= self._evaluate(branch)
+                sets.append(matched)
+            elif field.startswith("$"):
+                raise ValueError(f"Unsupported filter operator {field}")
+            else:
+                sets.append(self._field(field, condition))
+        return self._intersect(sets) if sets else set(self.all_ids)
+
+    def evaluate(self, filters: Dict[str, Any]) -> np.ndarray:
+        """
+        Ids of the records matching a filter
+
+        Returns:
+            Sorted int64 array
+
+        Raises:
+            ValueError: If the filter is malformed
+        """
+        with self._lock:
+            ids = self._evaluate(filters)
+        return np.sort(np.fromiter(ids, dtype=np.int64, count=len(ids)))
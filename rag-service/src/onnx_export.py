@@ -0,0 +1,138 @@
+# rag-service/src/onnx_export.py
+"""
+Export a SentenceTransformer model for the ONNX embedding backends
+
+    python onnx_export.py all-MiniLM-L6-v2 ./models/all-MiniLM-L6-v2-onnx --parity
+
+writes model.onnx (fp32), model_int8.onnx (dynamically quantized weights),
+tokenizer.json and export_config.json, then compares both graphs with the
+torch model. Exporting needs torch; serving the result does not.
+"""
+import argparse
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Default parity texts, short queries and contract clauses as in production traffic
+PARITY_TEXTS = [
+    "Either party may terminate this Agreement upon thirty days written notice.",
+    "The Customer shall pay all invoices within 45 days of receipt.",
+    "Confidential Information shall be kept strictly confidential for five years.",
+    "In no event shall the Supplier be liable for indirect or consequential damages.",
+    "This Agreement shall be governed by the laws of the State of Delaware.",
+    "termination clause",
+    "payment terms",
+    "Force majeure events beyond the reasonable control of a party, including strikes, floods and pandemics, "
+    "suspend the affected obligations for as long as the event continues."
+]
+
+def export_onnx(model_name: str, output_dir: str, quantize: bool = True, opset: int = 14):
+    """
+    Export the transformer of a SentenceTransformer model to ONNX
+
+    Args:
+        model_name: SentenceTransformer model name or path
+        output_dir: Directory to write the graphs, tokenizer and config to
+        quantize: Also write an int8 copy with dynamically quantized weights
+        opset: ONNX opset version
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(output_dir, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0]
+    pooling = next((module for module in model if type(module).__name__ == "Pooling"), None)
+    normalize = any(type(module).__name__ == "Normalize" for module in model)
+    if pooling is not None and not (pooling.pooling_mode_mean_tokens or pooling.pooling_mode_cls_token):
+        raise ValueError(f"{model_name} uses a pooling mode the ONNX backend does not implement")
+
+    tokenizer = transformer.tokenizer
+    tokenizer.save_pretrained(output_dir)
+    dummy = tokenizer(["an example sentence", "another one"], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    auto_model = transformer.auto_model.eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            auto_model,
+            tuple(dummy[name] for name in input_names),
+            os.path.join(output_dir, "model.onnx"),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(
+            os.path.join(output_dir, "model.onnx"),
+            os.path.join(output_dir, "model_int8.onnx"),
+            weight_type=QuantType.QInt8
+        )
+
+    with open(os.path.join(output_dir, "export_config.json"), "w") as f:
+        json.dump({
+            "model_name": model_name,
+            "dimension": model.get_sentence_embedding_dimension(),
+            "max_seq_length": model.max_seq_length,
+            "pooling": "cls" if pooling is not None and pooling.pooling_mode_cls_token else "mean",
+            "normalize": normalize,
+            "pad_token": tokenizer.pad_token,
+            "pad_token_id": tokenizer.pad_token_id
+        }, f, indent=2)
+    print(f"Exported {model_name} to {output_dir}")
+
+def check_parity(model_name: str, onnx_dir: str, texts: Optional[List[str]] = None,
+                 min_cosine: float = 0.98) -> Dict[str, Dict[str, float]]:
+    """
+    Compare the ONNX graphs with the torch model by cosine similarity
+
+    Returns:
+        Per graph ("onnx", "onnx_int8") the minimum and mean cosine similarity
+        to the torch embeddings and whether the minimum reaches min_cosine
+    """
+    from embeddings import OnnxBackend, TorchBackend
+
+    texts = texts or PARITY_TEXTS
+    reference = TorchBackend(model_name).encode(texts)
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+
+    report = {}
+    for name, quantized in (("onnx", False), ("onnx_int8", True)):
+        if quantized and not os.path.exists(os.path.join(onnx_dir, "model_int8.onnx")):
+            continue
+        vectors = OnnxBackend(onnx_dir, quantized=quantized).encode(texts)
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        cosines = np.sum(vectors * reference, axis=1)
+        report[name] = {
+            "min_cosine": float(cosines.min()),
+            "mean_cosine": float(cosines.mean()),
+            "passed": bool(cosines.min() >= min_cosine)
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a SentenceTransformer model for the ONNX embedding backends")
+    parser.add_argument("model_name", help="SentenceTransformer model name or path")
+    parser.add_argument("output_dir", help="Directory for the exported model")
+    parser.add_argument("--no-quantize", action="store_true", help="Skip the int8 graph")
+    parser.add_argument("--parity", action="store_true", help="Compare the exported graphs with the torch model")
+    parser.add_argument("--min-cosine", type=float, default=0.98, help="Cosine similarity the parity check requires")
+    args = parser.parse_args()
+
+    export_onnx(args.model_name, args.output_dir, quantize=not args.no_quantize)
+    if args.parity:
+        report = check_parity(args.model_name, args.output_dir, min_cosine=args.min_cosine)
+        print(json.dumps(report, indent=2))
+        if not all(result["passed"] for result in report.values()):
+            raise SystemExit("Parity check failed")
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,123 @@
 # rag-service/src/pathway_pipeline.py
-import pathway as pw
-from pathway.stdlib.ml.index import Embeddings
 import os
+import re
 import json
+import queue
+import threading
+import time
 from datetime import datetime
+from urllib.parse import urlparse
+
+import numpy as np
+
+# Most documents pushed to Pathway per connector commit
+MAX_BATCH_SIZE = 256
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Connections are reused from the pool, so this caps connections under load
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "32"))
 
 class PathwayTextPipeline:
-    def __init__(self):
+    """
+    Streaming Pathway dataflow that embeds documents into the Redis index.
+
+    Documents reach the dataflow through an in-process queue connector, so
+    process() only enqueues and returns. A background connector thread
+    drains the queue in batches of up to MAX_BATCH_SIZE documents per
+    commit, and a subscription on the embedded table advances the indexing
+    watermark reported by status().
+    """
+
+    def __init__(self, embeddings, max_queue_size=10000, redis_client=None):
+        """
+        Args:
+            embeddings: Shared Embeddings instance, so the service holds a
+                single copy of the model
+            max_queue_size: Documents waiting for the dataflow before process
+                and process_batch block (counted per document, not per batch)
+            redis_client: Client for queries, e.g. one for a local
+                Redis-compatible test server; by default a pooled client
+                for REDIS_URL is created on first use
+        """
         # Initialize the pipeline
-        self.embeddings = Embeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+        self.embeddings = embeddings
         self.index_path = "./data/vector_index"
         os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        self._thread = None
+        self._queue = queue.Queue()
+
+        # Sequence numbers: every submitted document gets the next one and the
+        # watermark is the highest one the dataflow has embedded
+        self._lock = threading.Lock()
+        # The queue holds batches, so it is bounded by the documents in them
+        self.max_queue_size = max_queue_size
+        self._queued = 0
+        self._queue_space = threading.Condition(self._lock)
+        self._submitted = 0
+        self._indexed = 0
+        self._pending = {}  # doc_id -> (sequence number, submit time)
+        self._last_lag = None
+        self._redis_client = redis_client
+
+    def start(self):
+        """Build the dataflow and run it in a background thread"""
+        import pathway as pw
+
+        self._setup_pipeline(pw)
         
-        # Setup the pipeline
-        self._setup_pipeline()
+        # pw.run() blocks for as long as the streaming pipeline runs
+        self._thread = threading.Thread(target=pw.run, daemon=True, name="pathway")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Let the connector finish the queued documents and end the input stream"""
+        if self._thread is not None:
+            self._queue.put(None)
         
-    def _setup_pipeline(self):
+    def _setup_pipeline(self, pw):
         # Define the schema for documents
         class InputSchema(pw.Schema):
             doc_id: str
             text: str
             metadata: dict
             timestamp: float
-        
+            seq: int
+
+        document_queue = self._queue
+        pipeline = self
+
+        class QueueSubject(pw.io.python.ConnectorSubject):
+            """Feeds queued batches into the dataflow, one commit per batch"""
+
+            def run(self):
+                while True:
+                    batch = document_queue.get()
+                    if batch is None:
+                        return
+                    pipeline._dequeued(len(batch))
+                    records = list(batch)
+                    # Whatever else queued up meanwhile joins this commit
+                    while len(records) < MAX_BATCH_SIZE:
+                        try:
+                            batch = document_queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if batch is None:
+                            document_queue.put(None)
+                            break
+                        pipeline._dequeued(len(batch))
+                        records.extend(batch)
+                    for record in records:
+                        self.next_json(record)
+                    self.commit()
+
         # Create a connector for real-time data
-        input_stream = pw.io.fs.read(
-            "./data/input",
-            format="json",
-            schema=InputSchema,
-            mode="streaming"
-        )
+        input_stream = pw.io.python.read(QueueSubject(), schema=InputSchema)
+        
+        @pw.udf
+        def embed(text: str) -> list:
+            return self.embeddings.encode(text).tolist()
         
         # Process the input stream
         documents = input_stream.select(
@@ -37,10 +125,12 @@ class PathwayTextPipeline:
             text=input_stream.text,
             metadata=input_stream.metadata,
             timestamp=input_stream.timestamp,
-            embedding=self.embeddings.embed(input_stream.text)
+            seq=input_stream.seq,
+            embedding=embed(input_stream.text)
         )
         
         # Create hybrid index (semantic + BM25)
+        redis_location = urlparse(REDIS_URL)
         self.index = pw.io.redis.index_embeddings(
             documents,
             embedding=documents.embedding,
@@ -51,88 +141,204 @@ class PathwayTextPipeline:
                 "timestamp": documents.timestamp
             },
             index_name="documents",
-            host="localhost",
-            port=6379
+            host=redis_location.hostname or "localhost",
+            port=redis_location.port or 6379
         )
-        
-        # Run the pipeline in the background
-        pw.run()
-        
-    def process(self, text):
-        """Process a document for indexing"""
-        doc_id = f"doc_{datetime.now().timestamp()}"
-        
-        # Write to input directory for streaming ingestion
-        with open(f"./data/input/{doc_id}.json", "w") as f:
-            json.dump({
+
+        def on_change(key, row, time, is_addition):
+            if is_addition:
+                self._mark_indexed(row["doc_id"], row["seq"], row["timestamp"])
+
+        pw.io.subscribe(documents, on_change=on_change)
+
+    def _dequeued(self, count):
+        """Free the queue space of documents the connector has taken"""
+        with self._queue_space:
+            self._queued -= count
+            self._queue_space.notify_all()
+
+    def _mark_indexed(self, doc_id, seq, timestamp):
+        with self._lock:
+            self._pending.pop(doc_id, None)
+            self._indexed = max(self._indexed, seq)
+            self._last_lag = time.time() - timestamp
+
+    def _submit(self, texts, metadata_list, doc_ids=None):
+        """Assign ids (where none is given) and sequence numbers and queue the documents as one batch"""
+        timestamp = datetime.now().timestamp()
+        with self._lock:
+            first = self._submitted + 1
+            self._submitted += len(texts)
+        doc_ids = [
+            doc_id or f"doc_{timestamp}_{first + i}"
+            for i, doc_id in enumerate(doc_ids or [None] * len(texts))
+        ]
+
+        records = [
+            {
                 "doc_id": doc_id,
                 "text": text,
-                "metadata": {"source": "user_upload"},
-                "timestamp": datetime.now().timestamp()
-            }, f)
+                "metadata": metadata or {"source": "user_upload"},
+                "timestamp": timestamp,
+                "seq": first + i
+            }
+            for i, (doc_id, text, metadata) in enumerate(zip(doc_ids, texts, metadata_list))
+        ]
+        # Without a running dataflow nothing would drain the queue
+        if self._thread is not None:
+            with self._queue_space:
+                # A batch larger than the whole bound still goes in once the queue is empty
+                while self._queued and self._queued + len(records) > self.max_queue_size:
+                    self._queue_space.wait()
+                self._queued += len(records)
+                for record in records:
+                    self._pending[record["doc_id"]] = (record["seq"], timestamp)
+            self._queue.put(records)
+        return doc_ids
         
-        return doc_id
+    def process(self, text, metadata=None, doc_id=None):
+        """
+        Queue a document for indexing and return its ID without waiting
+
+        A given doc_id is kept, so the Redis index stores the document under
+        the same id as the vector store. Use status(doc_id) to learn when it
+        has been indexed.
+        """
+        return self._submit([text], [metadata], [doc_id])[0]
         
-    def query(self, query_text, k=5):
-        """Query the index for relevant documents"""
-        # Get embeddings for the query
-        query_embedding = self.embeddings.model.encode(query_text)
+    def process_batch(self, texts, metadata_list=None, doc_ids=None):
+        """
+        Queue several documents for indexing as one batch
+
+        Args:
+            doc_ids: Caller-supplied ids, None (or None entries) to generate them
+
+        Returns:
+            List of document IDs, in input order
+        """
+        return self._submit(texts, metadata_list or [None] * len(texts), doc_ids)
+
+    def status(self, doc_id=None):
+        """
+        Indexing progress of the dataflow
+
+        Returns:
+            The submitted and indexed (watermark) sequence numbers, the
+            number of documents still pending, the lag of the last indexed
+            document and the age of the oldest pending one, in seconds. With
+            a doc_id also whether that document has been indexed.
+        """
+        now = time.time()
+        with self._lock:
+            oldest = min((submitted for _, submitted in self._pending.values()), default=None)
+            status = {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "submitted": self._submitted,
+                "indexed_watermark": self._indexed,
+                "pending": len(self._pending),
+                "queued_documents": self._queued,
+                "queued_batches": self._queue.qsize(),
+                "last_lag_seconds": self._last_lag,
+                "oldest_pending_seconds": now - oldest if oldest is not None else 0.0
+            }
+            if doc_id is not None:
+                status["doc_id"] = doc_id
+                status["indexed"] = self._thread is not None and doc_id not in self._pending
+        return status
         
-        # Hybrid search - combine semantic search with BM25
-        results = []
+    def _redis(self):
+        """Shared client on a bounded connection pool, created on first use"""
+        if self._redis_client is None:
+            import redis
+            pool = redis.ConnectionPool.from_url(REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS)
+            self._redis_client = redis.Redis(connection_pool=pool)
+        return self._redis_client
+
+    @staticmethod
+    def _keyword_query(query_text):
+        """Any-term RediSearch query over the words of the text, free of query syntax"""
+        terms = [term for term in re.findall(r"\w+", query_text.lower()) if len(term) > 1]
+        return "|".join(terms)
+
+    @staticmethod
+    def _parse_search(reply, with_scores=False):
+        """
+        Hits of a raw FT.SEARCH reply as (score or None, fields) pairs
+
+        The reply is [total, key, (score,) [field, value, ...], ...].
+        """
+        hits = []
+        step = 3 if with_scores else 2
+        for i in range(1, len(reply), step):
+            score = float(reply[i + 1]) if with_scores else None
+            values = reply[i + step - 1]
+            fields = {
+                (name.decode() if isinstance(name, bytes) else name): (value.decode() if isinstance(value, bytes) else value)
+                for name, value in zip(values[::2], values[1::2])
+            }
+            hits.append((score, fields))
+        return hits
+        
+    def query(self, query_text, k=5, alpha=0.7):
+        """
+        Hybrid query of the Redis index
+
+        The KNN and BM25 searches go to Redis in one pipelined round trip and
+        return only the fields used here. Both scores arrive normalized to
+        [0, 1] (cosine similarity, BM25STD.NORM) and are fused as
+        alpha * semantic + (1 - alpha) * keyword.
+        """
+        # Get embeddings for the query
+        query_embedding = np.asarray(self.embeddings.encode(query_text), dtype=np.float32)
+        keyword_query = self._keyword_query(query_text)
         
         try:
-            # Connect to Redis for retrieval
-            import redis
-            r = redis.Redis(host="localhost", port=6379)
-            
-            # Semantic search
-            semantic_results = r.ft.search(
-                "documents", 
-                f"*=>[KNN {k} @embedding $embedding AS score]", 
-                {"embedding": query_embedding.tobytes()}
+            pipe = self._redis().pipeline(transaction=False)
+            pipe.execute_command(
+                "FT.SEARCH", "documents", f"*=>[KNN {k} @embedding $embedding AS vector_score]",
+                "PARAMS", 2, "embedding", query_embedding.tobytes(),
+                "SORTBY", "vector_score",
+                "RETURN", 4, "doc_id", "text", "metadata", "vector_score",
+                "LIMIT", 0, k,
+                "DIALECT", 2
             )
-            
-            # BM25 search
-            keyword_results = r.ft.search(
-                "documents",
-                f"{query_text}",
-                {"limit": k}
-            )
-            
-            # Combine results
-            seen_docs = set()
-            
-            # Add semantic results
-            for doc in semantic_results.docs:
-                doc_data = json.loads(doc.json)
-                if doc_data["doc_id"] not in seen_docs:
-                    results.append({
-                        "doc_id": doc_data["doc_id"],
-                        "text": doc_data["text"],
-                        "metadata": doc_data["metadata"],
-                        "score": float(doc.score),
-                        "source": "semantic"
-                    })
-                    seen_docs.add(doc_data["doc_id"])
-            
-            # Add keyword results
-            for doc in keyword_results.docs:
-                doc_data = json.loads(doc.json)
-                if doc_data["doc_id"] not in seen_docs:
-                    results.append({
-                        "doc_id": doc_data["doc_id"],
-                        "text": doc_data["text"],
-                        "metadata": doc_data["metadata"],
-                        "score": float(doc.score) if hasattr(doc, "score") else 0.5,
-                        "source": "bm25"
-                    })
-                    seen_docs.add(doc_data["doc_id"])
-            
-            # Sort by score
-            results.sort(key=lambda x: x["score"], reverse=True)
-            return results[:k]
-            
+            if keyword_query:
+                pipe.execute_command(
+                    "FT.SEARCH", "documents", keyword_query,
+                    "SCORER", "BM25STD.NORM", "WITHSCORES",
+                    "RETURN", 3, "doc_id", "text", "metadata",
+                    "LIMIT", 0, k,
+                    "DIALECT", 2
+                )
+            replies = pipe.execute()
         except Exception as e:
             print(f"Error querying index: {e}")
-            return []
\ No newline at end of file
+            return []
+
+        # Hybrid search - combine semantic search with BM25
+        results = {}
+        for _, fields in self._parse_search(replies[0]):
+            # Cosine distance is in [0, 2]
+            similarity = 1.0 - float(fields["vector_score"]) / 2.0
+            results[fields["doc_id"]] = dict(fields, semantic=similarity, keyword=0.0, source="semantic")
+        if keyword_query:
+            for score, fields in self._parse_search(replies[1], with_scores=True):
+                if fields["doc_id"] in results:
+                    results[fields["doc_id"]].update(keyword=score, source="both")
+                else:
+                    results[fields["doc_id"]] = dict(fields, semantic=0.0, keyword=score, source="bm25")
+
+        ranked = []
+        for hit in results.values():
+            ranked.append({
+                "doc_id": hit["doc_id"],
+                "text": hit["text"],
+                # Only the metadata field is JSON, the rest arrives as plain strings
+                "metadata": json.loads(hit["metadata"]) if hit.get("metadata") else {},
+                "score": alpha * hit["semantic"] + (1.0 - alpha) * hit["keyword"],
+                "source": hit["source"]
+            })
+        
+        # Sort by score
+        ranked.sort(key=lambda x: x["score"], reverse=True)
+        return ranked[:k]
@@ -3,10 +3,13 @@ import pathway as pw
 from pathway.stdlib.ml.index import KNNIndex
 from typing import Dict, List, Any
 import uuid
+import hashlib
 import time
 import json
 import os
 
+from directory_loader import DirectorySync
+
 class RealtimeRAGPipeline:
     def __init__(self, embeddings_model, index_path=None):
         """
@@ -20,6 +23,8 @@ class RealtimeRAGPipeline:
         self.index_path = index_path
         self.document_table = None
         self.index = None
+        # Ids deleted since they were last added, hidden from query results
+        self._deleted = set()
         self._setup_pipeline()
         
     def _setup_pipeline(self):
@@ -41,7 +46,7 @@ class RealtimeRAGPipeline:
             id=pw.this.id,
             content=pw.this.content,
             metadata=pw.this.metadata,
-            embedding=pw.apply(self._embed_text, pw.this.content),
+            embedding=pw.apply(self._embed_text, pw.this.content, pw.this.embedding),
             timestamp=pw.this.timestamp
         )
         
@@ -81,33 +86,56 @@ class RealtimeRAGPipeline:
                 saved=pw.apply(save_index)
             )
         
-    def _embed_text(self, text):
-        """Convert text to embedding vector"""
+    def _embed_text(self, text, embedding=None):
+        """Convert text to embedding vector, unless it was embedded in a batch already"""
+        if embedding:
+            return embedding
         return self.embeddings_model.encode(text).tolist()
         
-    def add_document(self, content, metadata=None):
+    def add_document(self, content, metadata=None, doc_id=None, embedding=None):
         """
         Add a document to the pipeline for processing.
         
         Args:
             content: The document text
             metadata: Optional metadata dictionary
+            doc_id: Optional stable ID; a new UUID by default
+            embedding: Optional precomputed embedding
         
         Returns:
             document_id: The ID of the added document
         """
-        doc_id = str(uuid.uuid4())
+        doc_id = doc_id or str(uuid.uuid4())
+        self._deleted.discard(doc_id)
         
         # Add to pipeline
         self.document_table.append({
             "id": doc_id,
             "content": content,
             "metadata": metadata or {},
-            "embedding": [],  # Will be computed in the pipeline
+            "embedding": embedding or [],  # Empty ones are computed in the pipeline
             "timestamp": time.time()
         })
         
         return doc_id
+
+    def add_documents(self, doc_ids, contents, metadata_list, vectors):
+        """Add a batch of documents embedded together"""
+        for doc_id, content, metadata, vector in zip(doc_ids, contents, metadata_list, vectors):
+            self.add_document(content, metadata, doc_id=doc_id, embedding=list(map(float, vector)))
+
+    def delete_document(self, doc_id):
+        """
+        Hide a document from query results
+
+        Pathway tables have no row deletion, rows can only be retracted by
+        the input connector that produced them, and the document table here
+        is append-only. The rows of a deleted document therefore stay in the
+        table and the index until the pipeline is rebuilt; queries filter
+        them out. If the id is added again, older versions of it can be
+        returned next to the new one.
+        """
+        self._deleted.add(doc_id)
         
     def query(self, query_text, k=5, use_hybrid=True):
         """
@@ -122,25 +150,30 @@ class RealtimeRAGPipeline:
             List of retrieved documents with scores
         """
         query_embedding = self.embeddings_model.encode(query_text)
+        deleted = self._deleted
+        # Deleted documents are still indexed, ask for enough to fill k without them
+        k_fetch = k + len(deleted)
         
         if use_hybrid:
             # Hybrid search (BM25 + vector)
             results = self.index.hybrid_search(
                 query_text=query_text,
                 query_vector=query_embedding.tolist(),
-                k=k,
+                k=k_fetch,
                 alpha=0.7  # Weight between BM25 and vector (0 = BM25 only, 1 = vector only)
             )
         else:
             # Vector-only search
             results = self.index.vector_search(
                 query_embedding.tolist(),
-                k=k
+                k=k_fetch
             )
             
         # Format results
         formatted_results = []
         for item in results:
+            if item["id"] in deleted:
+                continue
             formatted_results.append({
                 "id": item["id"],
                 "content": item["content"],
@@ -148,44 +181,39 @@ class RealtimeRAGPipeline:
                 "score": float(item["_score"])
             })
             
-        return formatted_results
+        return formatted_results[:k]
         
-    def load_documents_from_directory(self, directory_path, file_extensions=None):
+    def load_documents_from_directory(self, directory_path, file_extensions=None, manifest_path=None,
+                                      readers=8, batch_size=64, progress=None):
         """
-        Load documents from a directory for batch processing.
+        Incrementally sync documents from a directory for batch processing.
+
+        Only new or changed files are read and embedded, in batches, and files
+        removed since the last sync are deleted; see directory_loader.DirectorySync.
         
         Args:
             directory_path: Path to directory containing documents
             file_extensions: List of file extensions to include, e.g. ['.txt', '.md']
+            manifest_path: SQLite manifest of the ingested files, by default
+                one per directory under ./data/manifests
+            readers: Threads reading and hashing files
+            batch_size: Files embedded together
+            progress: Optional callback receiving the running counters
             
         Returns:
-            count: Number of documents loaded
+            Counters of the sync (added, updated, deleted, unchanged, failed,
+            seconds, files_per_second, ...)
         """
-        count = 0
-        for root, _, files in os.walk(directory_path):
-            for file in files:
-                if file_extensions and not any(file.endswith(ext) for ext in file_extensions):
-                    continue
-                    
-                file_path = os.path.join(root, file)
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    
-                    # Extract relative path for metadata
-                    rel_path = os.path.relpath(file_path, directory_path)
-                    
-                    # Add document to pipeline
-                    self.add_document(
-                        content=content,
-                        metadata={
-                            "source": rel_path,
-                            "filename": file,
-                            "imported_at": time.time()
-                        }
-                    )
-                    count += 1
-                except Exception as e:
-                    print(f"Error loading {file_path}: {str(e)}")
-                    
-        return count
\ No newline at end of file
+        if manifest_path is None:
+            key = hashlib.sha1(os.path.abspath(directory_path).encode("utf-8")).hexdigest()[:16]
+            manifest_path = os.path.join("./data/manifests", f"{key}.db")
+        loader = DirectorySync(
+            self.embeddings_model,
+            add_batch=self.add_documents,
+            delete=self.delete_document,
+            manifest_path=manifest_path,
+            readers=readers,
+            batch_size=batch_size,
+            progress=progress
+        )
+        return loader.sync(directory_path, file_extensions)
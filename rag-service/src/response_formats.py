@@ -0,0 +1,152 @@
+# rag-service/src/response_formats.py
+"""
+Response encodings for the retrieval endpoints
+
+A response is a payload dict with a "results" (or "context") list of hits
+and optionally the query embedding. It can be rendered as JSON, MessagePack,
+an Arrow IPC stream (one row per hit) or newline-delimited JSON, chosen by
+an explicit format option or the Accept header.
+"""
+import base64
+import json
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "ndjson": "application/x-ndjson"
+}
+# Accept header media types, including the common aliases
+ACCEPTED_TYPES = dict(
+    {media_type: name for name, media_type in MEDIA_TYPES.items()},
+    **{"application/x-msgpack": "msgpack", "application/jsonl": "ndjson"}
+)
+
+# How the query embedding is included: left out, a list of floats, or the
+# little-endian float16 bytes (base64 in text formats)
+EMBEDDING_FORMATS = ("none", "list", "float16")
+
+# Characters of hit text kept unless the full text is requested
+SNIPPET_CHARS = 300
+
+class UnsupportedFormat(ValueError):
+    """Requested format is unknown or its library is not installed"""
+
+def negotiate(accept: Optional[str], requested: Optional[str] = None) -> str:
+    """
+    Response format from an explicit option, else the first supported Accept type
+
+    Raises:
+        UnsupportedFormat: If the explicit option is not a known format
+    """
+    if requested:
+        if requested not in MEDIA_TYPES:
+            raise UnsupportedFormat(f"Unknown format {requested!r}, expected one of {', '.join(MEDIA_TYPES)}")
+        return requested
+    for media_range in (accept or "").split(","):
+        media_type = media_range.split(";")[0].strip().lower()
+        if media_type in ACCEPTED_TYPES:
+            return ACCEPTED_TYPES[media_type]
+    return "json"
+
+def encode_embedding(vector: np.ndarray, embedding_format: str, binary: bool = False):
+    """The query embedding in the requested form, raw float16 bytes if binary"""
+    if embedding_format not in EMBEDDING_FORMATS:
+        raise UnsupportedFormat(f"Unknown embedding format {embedding_format!r}, expected one of {', '.join(EMBEDDING_FORMATS)}")
+    if embedding_format == "none":
+        return None
+    if embedding_format == "list":
+        return np.asarray(vector, dtype=np.float32).tolist()
+    data = np.asarray(vector, dtype="<f2").tobytes()
+    return data if binary else base64.b64encode(data).decode("ascii")
+
+def snippet(text: str, max_chars: int = SNIPPET_CHARS) -> str:
+    """Text cut at a word boundary to at most max_chars, marked with an ellipsis"""
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    space = cut.rfind(" ")
+    if space > max_chars // 2:
+        cut = cut[:space]
+    return cut.rstrip() + "..."
+
+def shape_hits(hits: List[Dict[str, Any]], full_text: bool, max_chars: int = SNIPPET_CHARS) -> List[Dict[str, Any]]:
+    """Hits with their text (and that of listed chunks) cut to snippets unless full_text"""
+    if full_text:
+        return hits
+    shaped = []
+    for hit in hits:
+        hit = dict(hit, text=snippet(hit["text"], max_chars))
+        if "chunks" in hit:
+            hit["chunks"] = [dict(chunk, text=snippet(chunk["text"], max_chars)) for chunk in hit["chunks"]]
+        shaped.append(hit)
+    return shaped
+
+def _json_bytes(value) -> bytes:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def _arrow_bytes(hits: List[Dict[str, Any]], extra: Dict[str, Any]) -> bytes:
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise UnsupportedFormat("Arrow responses need pyarrow installed")
+
+    columns = {
+        "id": pa.array([hit["id"] for hit in hits], pa.string()),
+        "distance": pa.array([hit["distance"] for hit in hits], pa.float32()),
+        "text": pa.array([hit["text"] for hit in hits], pa.string()),
+        # Free-form, so kept as JSON rather than a struct column
+        "metadata": pa.array([json.dumps(hit["metadata"]) for hit in hits], pa.string())
+    }
+    if any("query" in hit for hit in hits):
+        # Batch responses: position of the query each hit answers
+        columns["query"] = pa.array([hit.get("query") for hit in hits], pa.int32())
+    if any("score" in hit for hit in hits):
+        columns["score"] = pa.array([hit.get("score") for hit in hits], pa.float32())
+    schema_metadata = {}
+    for key, value in extra.items():
+        if value is not None:
+            schema_metadata[key] = value if isinstance(value, bytes) else _json_bytes(value)
+    table = pa.table(columns).replace_schema_metadata(schema_metadata)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def render(payload: Dict[str, Any], hits_key: str, response_format: str) -> Tuple[bytes, str]:
+    """
+    Encode a whole payload
+
+    For Arrow the hits become the rows and the other payload values the
+    schema metadata.
+
+    Returns:
+        (body, media type)
+    """
+    if response_format == "json":
+        body = _json_bytes(payload)
+    elif response_format == "msgpack":
+        try:
+            import msgpack
+        except ImportError:
+            raise UnsupportedFormat("MessagePack responses need msgpack installed")
+        body = msgpack.packb(payload, use_bin_type=True)
+    elif response_format == "arrow":
+        extra = {key: value for key, value in payload.items() if key != hits_key}
+        body = _arrow_bytes(payload[hits_key], extra)
+    else:
+        body = b"".join(iter_ndjson(payload, hits_key))
+    return body, MEDIA_TYPES[response_format]
+
+def iter_ndjson(payload: Dict[str, Any], hits_key: str) -> Iterator[bytes]:
+    """
+    Newline-delimited JSON: one {"hit": ...} line per hit in rank order, then
+    a final line with the remaining payload values
+    """
+    for rank, hit in enumerate(payload[hits_key]):
+        yield _json_bytes({"rank": rank, "hit": hit}) + b"\n"
+    yield _json_bytes({key: value for key, value in payload.items() if key != hits_key}) + b"\n"
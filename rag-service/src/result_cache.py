@@ -0,0 +1,85 @@
+# rag-service/src/result_cache.py
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+class ResultCache:
+    """
+    Bounded LRU cache of query results, invalidated by index generation.
+
+    Every entry is tagged with the vector store generation it was computed
+    at. The store bumps its generation on each mutation, so an entry from an
+    older generation is stale and dropped on lookup instead of expiring
+    after a guessed TTL.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(endpoint: str, text: str, **params) -> bytes:
+        """
+        SHA-256 of the endpoint, whitespace-normalized text and search parameters
+
+        Parameters are serialized with sorted keys, so equal filters given in
+        a different order share an entry.
+        """
+        payload = json.dumps(
+            [endpoint, " ".join(text.split()), params],
+            sort_keys=True, separators=(",", ":"), default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).digest()
+
+    def get(self, key: bytes, generation: int) -> Optional[Any]:
+        """Return the value cached for key at this generation, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] != generation:
+                del self._entries[key]
+                self.stale += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: bytes, generation: int, value: Any):
+        """
+        Cache a value computed at ``generation``
+
+        Read the generation before computing the value: a mutation that lands
+        in between then leaves the entry stale rather than wrongly current.
+        """
+        with self._lock:
+            self._entries[key] = (generation, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.stale
+            return {
+                "size": len(self._entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
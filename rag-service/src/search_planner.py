@@ -0,0 +1,164 @@
+# rag-service/src/search_planner.py
+import threading
+from typing import Any, Dict, Optional
+
+# How a query is answered: chosen per query ("auto"), a scan of every vector
+# ("exact") or the HNSW graph / IVF lists ("approximate")
+SEARCH_MODES = ("auto", "exact", "approximate")
+
+# Recall target -> search effort. efSearch for HNSW graphs (M=32), fraction
+# of the inverted lists probed for IVF. Conservative defaults for sentence
+# embeddings; a target above the last entry is searched exactly.
+HNSW_RECALL_EFFORT = ((0.90, 16), (0.95, 32), (0.98, 64), (0.99, 128), (0.995, 256))
+IVF_RECALL_FRACTION = ((0.80, 0.02), (0.90, 0.05), (0.95, 0.1), (0.98, 0.25), (0.99, 0.5))
+
+def validate_search_options(options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Checked copy of per-request search options
+
+    Keys: mode (one of SEARCH_MODES), ef_search, nprobe, recall (target in
+    (0, 1]) and latency_ms (budget per query); unset ones may be None.
+
+    Raises:
+        ValueError: If an option is out of range
+    """
+    options = {key: value for key, value in (options or {}).items() if value is not None}
+    unknown = set(options) - {"mode", "ef_search", "nprobe", "recall", "latency_ms"}
+    if unknown:
+        raise ValueError(f"Unknown search options: {', '.join(sorted(unknown))}")
+    if options.get("mode", "auto") not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode {options['mode']!r}, expected one of {', '.join(SEARCH_MODES)}")
+    for key in ("ef_search", "nprobe"):
+        if key in options and int(options[key]) < 1:
+            raise ValueError(f"{key} must be at least 1")
+    if "recall" in options and not 0.0 < float(options["recall"]) <= 1.0:
+        raise ValueError("recall must be in (0, 1]")
+    if "latency_ms" in options and float(options["latency_ms"]) <= 0:
+        raise ValueError("latency_ms must be positive")
+    return options
+
+class SearchPlanner:
+    """
+    Chooses between exact and approximate search for each query.
+
+    Explicit options win: an exact mode, an efSearch / nprobe value, a recall
+    target (mapped to an effort with the tables above) or a latency budget.
+    Otherwise small corpora are searched exactly, and larger ones exactly only
+    while that is measured to be faster. Latency is modeled from the searches
+    actually run: exact cost per stored vector, approximate cost per unit of
+    effort, both smoothed averages per query.
+    """
+
+    def __init__(self, exact_limit: int = 10000, max_effort: int = 1024, smoothing: float = 0.2):
+        """
+        Args:
+            exact_limit: Corpus size up to which searches are exact by default
+            max_effort: Upper bound for efSearch / nprobe
+            smoothing: Weight of the newest measurement in the latency averages
+        """
+        self.exact_limit = exact_limit
+        self.max_effort = max_effort
+        self.smoothing = smoothing
+        self._exact_rate = None     # Seconds per query per vector scanned
+        self._effort_rate = None    # Seconds per query per unit of effort
+        self._lock = threading.Lock()
+
+    def _predict_exact(self, corpus_size):
+        return self._exact_rate * corpus_size if self._exact_rate is not None else None
+
+    def _predict_approximate(self, effort):
+        return self._effort_rate * effort if self._effort_rate is not None else None
+
+    def plan(self, options: Dict[str, Any], index_type: str, corpus_size: int, k: int,
+             default_effort: int, nlist: int = 0) -> Dict[str, Any]:
+        """
+        Plan for a search of k results
+
+        Args:
+            options: Validated search options, see validate_search_options
+            index_type: Approximate index kind; "flat" or no default_effort
+                (nothing to approximate yet) always plans an exact search
+            corpus_size: Vectors in the approximate index
+            default_effort: The index's own efSearch / nprobe
+            nlist: Number of IVF lists, bounding nprobe
+
+        Returns:
+            {"mode": "exact" or "approximate", "ef_search", "nprobe", "reason"}
+        """
+        mode = options.get("mode", "auto")
+        ivf = index_type == "ivfpq"
+
+        def exact(reason):
+            return {"mode": "exact", "ef_search": None, "nprobe": None, "reason": reason}
+
+        def approximate(effort, reason):
+            effort = max(1, min(int(effort), self.max_effort))
+            if ivf:
+                return {"mode": "approximate", "ef_search": None, "nprobe": min(effort, nlist), "reason": reason}
+            # The graph search keeps efSearch candidates, fewer than k cannot be returned
+            return {"mode": "approximate", "ef_search": max(effort, k), "nprobe": None, "reason": reason}
+
+        if index_type == "flat" or not default_effort:
+            return exact("index is exact")
+        if mode == "exact":
+            return exact("exact search requested")
+
+        requested = options.get("nprobe") if ivf else options.get("ef_search")
+        if requested is not None:
+            return approximate(requested, "nprobe requested" if ivf else "efSearch requested")
+
+        if "recall" in options:
+            recall = float(options["recall"])
+            table = IVF_RECALL_FRACTION if ivf else HNSW_RECALL_EFFORT
+            for target, effort in table:
+                if recall <= target:
+                    effort = max(1, round(effort * nlist)) if ivf else effort
+                    return approximate(effort, f"recall target {recall}")
+            if mode == "approximate":
+                return approximate(self.max_effort, f"recall target {recall} above the effort table")
+            return exact(f"recall target {recall} needs an exact search")
+
+        with self._lock:
+            if "latency_ms" in options:
+                budget = float(options["latency_ms"]) / 1000.0
+                predicted = self._predict_exact(corpus_size)
+                if mode != "approximate" and predicted is not None and predicted <= budget:
+                    return exact("exact search fits the latency budget")
+                if self._effort_rate:
+                    return approximate(budget / self._effort_rate, "largest effort within the latency budget")
+                return approximate(default_effort, "no latency measurements yet")
+
+            if mode == "approximate":
+                return approximate(default_effort, "approximate search requested")
+            if corpus_size <= self.exact_limit:
+                return exact(f"corpus of {corpus_size} vectors is within the exact search limit")
+            predicted_exact = self._predict_exact(corpus_size)
+            predicted_approximate = self._predict_approximate(default_effort)
+            if predicted_exact is not None and predicted_approximate is not None and predicted_exact <= predicted_approximate:
+                return exact("exact search measured faster")
+            return approximate(default_effort, "default effort")
+
+    def observe(self, plan: Dict[str, Any], seconds: float, n_queries: int, corpus_size: int):
+        """Fold the time a search with this plan took into the latency model"""
+        if n_queries <= 0 or corpus_size <= 0:
+            return
+        per_query = seconds / n_queries
+        with self._lock:
+            if plan["mode"] == "exact":
+                rate = per_query / corpus_size
+                self._exact_rate = rate if self._exact_rate is None else (
+                    self.smoothing * rate + (1 - self.smoothing) * self._exact_rate
+                )
+            else:
+                rate = per_query / (plan["ef_search"] or plan["nprobe"])
+                self._effort_rate = rate if self._effort_rate is None else (
+                    self.smoothing * rate + (1 - self.smoothing) * self._effort_rate
+                )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "exact_limit": self.exact_limit,
+                "exact_us_per_1k_vectors": self._exact_rate * 1e9 if self._exact_rate is not None else None,
+                "approximate_us_per_effort": self._effort_rate * 1e6 if self._effort_rate is not None else None
+            }
@@ -0,0 +1,451 @@
+# rag-service/src/sharded_store.py
+import heapq
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import metrics
+
+SCATTER_SECONDS = metrics.histogram(
+    "rag_shard_scatter_seconds", "Time to fan a call out to every shard and gather the replies", ["operation"]
+)
+
+# Documents moved per round trip while rebalancing
+REBALANCE_BATCH = 1000
+
+# Seconds between a worker's checks for background rebuilds of its store
+GENERATION_POLL_INTERVAL = 0.1
+
+def shard_of(key: str, num_shards: int) -> int:
+    """Stable shard number of a partition key, the same in every process"""
+    return zlib.crc32(key.encode("utf-8")) % num_shards
+
+def partition_key(doc_id: str, metadata: Dict[str, Any]) -> str:
+    """Chunks are partitioned by their parent, so a document's chunks share a shard"""
+    return metadata.get("parent_id") or doc_id
+
+def _misplaced(store, num_shards: int, shard_index: int, limit: int) -> List[str]:
+    """Partition keys stored in this shard that belong to another one"""
+    chunk_ids = set()
+    for chunks in store.children.values():
+        chunk_ids.update(chunks)
+    keys = list(store.children) + [doc_id for doc_id in store.id_map if doc_id not in chunk_ids]
+    return [key for key in keys if shard_of(key, num_shards) != shard_index][:limit]
+
+# Commands served by the worker on top of the VectorStore methods
+WORKER_COMMANDS = {"misplaced": _misplaced}
+
+def _rank(result):
+    """Merge key of shard results: fused ones by score (higher is better), vector-only ones by distance"""
+    return -result["score"] if "score" in result else result["distance"]
+
+def _merged_plan(shard_plans, results) -> Dict[str, Any]:
+    """Plan of a scattered search: the plan of every shard and how their results were merged"""
+    return {
+        "shards": list(shard_plans),
+        "merge": "per_shard_fusion" if any("score" in result for result in results) else "distance"
+    }
+
+def _publish_generation(store, generations, slot: int):
+    """Mirror the store generation into shared memory, also after background merges and rebuilds"""
+    while True:
+        generations[slot] = store.generation
+        time.sleep(GENERATION_POLL_INTERVAL)
+
+def _shard_worker(conn, data_dir: str, omp_threads: int, store_kwargs: Dict[str, Any], generations, slot: int):
+    """
+    Own one VectorStore and serve (method, args, kwargs) calls until closed
+
+    The store generation is published to generations[slot] before every
+    reply, so a mutation is visible to the parent once its call returns.
+    """
+    import faiss
+    from vector_store import VectorStore
+
+    # Shards already run in parallel, so each gets its share of the cores
+    faiss.omp_set_num_threads(omp_threads)
+    try:
+        store = VectorStore(data_dir=data_dir, **store_kwargs)
+    except Exception as e:
+        conn.send((False, e))
+        return
+    generations[slot] = store.generation
+    threading.Thread(target=_publish_generation, args=(store, generations, slot), daemon=True).start()
+    conn.send((True, None))
+
+    while True:
+        try:
+            method, args, kwargs = conn.recv()
+        except EOFError:
+            store.close()
+            return
+        try:
+            if method in WORKER_COMMANDS:
+                result = WORKER_COMMANDS[method](store, *args, **kwargs)
+            else:
+                result = getattr(store, method)(*args, **kwargs)
+            reply = (True, result)
+        except Exception as e:
+            reply = (False, e)
+        generations[slot] = store.generation
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # Unpicklable result or exception
+            conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+        if method == "close":
+            return
+
+class _Shard:
+    def __init__(self, context, data_dir: str, omp_threads: int, store_kwargs: Dict[str, Any], generations, slot: int):
+        self.data_dir = data_dir
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_shard_worker,
+            args=(child_conn, data_dir, omp_threads, store_kwargs, generations, slot),
+            daemon=True,
+            name=f"shard-{os.path.basename(data_dir)}"
+        )
+        self.process.start()
+        child_conn.close()
+        # One request at a time per pipe
+        self.lock = threading.Lock()
+
+    def started(self):
+        ok, error = self.conn.recv()
+        if not ok:
+            raise error
+
+    def send(self, method, *args, **kwargs):
+        self.conn.send((method, args, kwargs))
+
+    def receive(self):
+        ok, result = self.conn.recv()
+        if not ok:
+            raise result
+        return result
+
+    def call(self, method, *args, **kwargs):
+        with self.lock:
+            self.send(method, *args, **kwargs)
+            return self.receive()
+
+class ShardedVectorStore:
+    """
+    VectorStore hash-partitioned across worker processes.
+
+    Every shard is a full VectorStore (index, WAL, document store) in its own
+    process and directory under data_dir, so searches of one query run on
+    several cores at once and the corpus is no longer bounded by one
+    process. Writes are routed by a stable hash of the document id (of the
+    parent id for chunks); searches are scattered to all shards and their
+    per-shard top k merged with a heap. Changing num_shards moves the
+    documents to their new shards on the next start, and on the first start
+    the documents of a single-process store in legacy_dir are moved in.
+
+    Vector distances are comparable across shards, so vector-only results
+    are merged exactly. Fused (hybrid keyword) scores are not: every shard
+    fuses its own candidate lists, with BM25 statistics of its own documents,
+    and the merge orders these scores as if they were global. The order of
+    fused results across shards is therefore approximate, and the plan of
+    such a search says so with "merge": "per_shard_fusion".
+    """
+
+    def __init__(self, num_shards: int = 2, dimension: int = 384, data_dir: str = "./data",
+                 legacy_dir: Optional[str] = None, **store_kwargs):
+        """
+        Args:
+            num_shards: Number of worker processes and partitions
+            dimension: Dimension of the stored vectors
+            data_dir: Directory holding one shard_<i> directory per shard
+            legacy_dir: Directory of an unsharded VectorStore whose documents
+                are moved into the shards when data_dir has no layout yet
+            store_kwargs: Further VectorStore arguments, used by every shard
+        """
+        if num_shards < 1:
+            raise ValueError("num_shards must be at least 1")
+        self.num_shards = num_shards
+        self.dimension = dimension
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
+
+        previous = self._read_layout()
+        count = max(num_shards, previous)
+        context = multiprocessing.get_context("spawn")
+        omp_threads = max(1, (os.cpu_count() or 1) // num_shards)
+        store_kwargs = dict(store_kwargs, dimension=dimension)
+
+        # Generation of every shard's store, written by the workers
+        self._generations = context.RawArray("q", count + 1)
+        self.shards = [
+            _Shard(context, self._shard_dir(i), omp_threads, store_kwargs, self._generations, i)
+            for i in range(count)
+        ]
+        for shard in self.shards:
+            shard.started()
+
+        if previous and previous != num_shards:
+            self._rebalance(previous)
+        elif not previous and legacy_dir and os.path.exists(os.path.join(legacy_dir, "documents.db")):
+            self._import_legacy(context, legacy_dir, omp_threads, store_kwargs)
+        self._write_layout()
+        print(f"Started {num_shards} vector store shards")
+
+    def _shard_dir(self, index):
+        return os.path.join(self.data_dir, f"shard_{index}")
+
+    def _layout_path(self):
+        return os.path.join(self.data_dir, "shards.json")
+
+    def _read_layout(self) -> int:
+        if not os.path.exists(self._layout_path()):
+            return 0
+        with open(self._layout_path()) as f:
+            return json.load(f)["num_shards"]
+
+    def _write_layout(self):
+        tmp_path = self._layout_path() + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"num_shards": self.num_shards}, f)
+        os.replace(tmp_path, self._layout_path())
+
+    @property
+    def generation(self) -> int:
+        """
+        Sum of the shard generations, like VectorStore.generation it moves
+        on every mutation and every background merge or rebuild
+        """
+        return sum(self._generations)
+
+    def _move_out(self, shard, shard_index: int) -> int:
+        """Move the documents of a shard that belong elsewhere to their shards, returns their count"""
+        moved = 0
+        while True:
+            keys = shard.call("misplaced", self.num_shards, shard_index, REBALANCE_BATCH)
+            if not keys:
+                return moved
+            vectors, doc_ids, texts, metadata_list = shard.call("export_documents", keys)
+            self._scatter_add(vectors, doc_ids, texts, metadata_list)
+            shard.call("delete_documents", keys)
+            moved += len(doc_ids)
+
+    def _import_legacy(self, context, legacy_dir: str, omp_threads: int, store_kwargs: Dict[str, Any]):
+        """
+        Move the documents of an unsharded store into the shards
+
+        Like a rebalance, documents are added before they are deleted from the
+        old store and the layout is only written afterwards, so an interrupted
+        import is redone on the next start. The old store is left empty.
+        """
+        print(f"Importing unsharded vector store from {legacy_dir} into {self.num_shards} shards")
+        # Its generation goes to the spare slot, which stays part of the sum
+        legacy = _Shard(context, legacy_dir, omp_threads, store_kwargs, self._generations, len(self._generations) - 1)
+        legacy.started()
+        try:
+            # No key hashes to shard -1, so every document is moved
+            moved = self._move_out(legacy, -1)
+        finally:
+            legacy.call("close")
+            legacy.process.join()
+        self._scatter("checkpoint")
+        print(f"Imported {moved} records")
+
+    def _rebalance(self, previous: int):
+        """
+        Move every document to its shard under the new count
+
+        Documents are added to their new shard before they are deleted from
+        the old one and the new layout is only recorded afterwards, so an
+        interrupted rebalance is simply redone on the next start.
+        """
+        print(f"Rebalancing vector store from {previous} to {self.num_shards} shards")
+        moved = 0
+        for index, shard in enumerate(self.shards):
+            moved += self._move_out(shard, index)
+
+        # Shards past the new count are empty now
+        for shard in self.shards[self.num_shards:]:
+            shard.call("close")
+            shard.process.join()
+            shutil.rmtree(shard.data_dir, ignore_errors=True)
+        self.shards = self.shards[:self.num_shards]
+        self._scatter("checkpoint")
+        print(f"Rebalanced {moved} records")
+
+    def _gather(self, calls):
+        """
+        Send (shard index, method, args, kwargs) calls to their shards in parallel
+
+        Returns:
+            Results in shard order
+        """
+        calls = sorted(calls, key=lambda call: call[0])
+        shards = [self.shards[call[0]] for call in calls]
+        # Always lock in shard order so concurrent calls cannot deadlock
+        for shard in shards:
+            shard.lock.acquire()
+        try:
+            for shard, (_, method, args, kwargs) in zip(shards, calls):
+                shard.send(method, *args, **kwargs)
+            results = []
+            error = None
+            for shard in shards:
+                # Drain every reply even after a failure, or the pipes fall out of step
+                try:
+                    results.append(shard.receive())
+                except Exception as e:
+                    error = error or e
+            if error is not None:
+                raise error
+            return results
+        finally:
+            for shard in shards:
+                shard.lock.release()
+
+    def _scatter(self, method, *args):
+        """Call a method on every shard in parallel and return their results in shard order"""
+        return self._gather([(index, method, args, {}) for index in range(len(self.shards))])
+
+    def _scatter_add(self, vectors, doc_ids, texts, metadata_list):
+        parts = {}
+        for i, (doc_id, metadata) in enumerate(zip(doc_ids, metadata_list)):
+            parts.setdefault(shard_of(partition_key(doc_id, metadata), self.num_shards), []).append(i)
+        self._gather([
+            (index, "add_vectors", (
+                vectors[rows],
+                [doc_ids[i] for i in rows],
+                [texts[i] for i in rows],
+                [metadata_list[i] for i in rows]
+            ), {})
+            for index, rows in parts.items()
+        ])
+
+    def add_vectors(self, vectors: np.ndarray, doc_ids: List[str], texts: List[str], metadata_list: List[Dict[str, Any]]):
+        """Add vectors with their metadata, each to the shard owning its document"""
+        if len(vectors) == 0:
+            return
+        vectors_np = np.array(vectors).astype('float32')
+        with SCATTER_SECONDS.time(operation="add"):
+            self._scatter_add(vectors_np, list(doc_ids), list(texts), list(metadata_list))
+
+    def add_document(self, doc_id: str, vector: np.ndarray, text: str, metadata: Dict[str, Any]):
+        """Add a single document to the index"""
+        self.add_vectors([vector], [doc_id], [text], [metadata])
+
+    def upsert_document(self, doc_id: str, vector: np.ndarray, text: str, metadata: Dict[str, Any]):
+        """Insert a document, or replace the stored version if doc_id already exists"""
+        self.add_document(doc_id, vector, text, metadata)
+
+    def delete_document(self, doc_id: str) -> bool:
+        """
+        Remove a document, or a parent document and all of its chunks
+
+        A chunk id does not tell its parent, so the delete goes to every shard.
+
+        Returns:
+            True if the document existed
+        """
+        with SCATTER_SECONDS.time(operation="delete"):
+            deleted = any(self._scatter("delete_document", doc_id))
+        return deleted
+
+    def search(self, query_vector: np.ndarray, k: int = 5, return_plan: bool = False, **kwargs):
+        """
+        Search every shard for its top k and merge them into the global top k
+
+        Accepts the same keyword arguments as VectorStore.search. Every shard
+        plans its own search, so the plan lists one per shard, and "merge"
+        tells whether distances ("distance") or per-shard fused scores
+        ("per_shard_fusion", approximate across shards) were merged.
+        """
+        query_vector = np.asarray(query_vector, dtype='float32')
+        with SCATTER_SECONDS.time(operation="search"):
+            shard_results = self._gather([
+                (index, "search", (query_vector, k), dict(kwargs, return_plan=return_plan))
+                for index in range(len(self.shards))
+            ])
+        if return_plan:
+            shard_results, plans = zip(*shard_results)
+            results = list(heapq.merge(*shard_results, key=_rank))[:k]
+            return results, _merged_plan(plans, results)
+        return list(heapq.merge(*shard_results, key=_rank))[:k]
+
+    def search_batch(self, query_vectors: np.ndarray, ks: List[int], return_plans: bool = False, **kwargs):
+        """
+        Send every query to every shard in one message and merge per query
+
+        Accepts the same keyword arguments as VectorStore.search_batch, plans
+        are those of search.
+        """
+        query_vectors = np.asarray(query_vectors, dtype='float32')
+        with SCATTER_SECONDS.time(operation="search_batch"):
+            shard_results = self._gather([
+                (index, "search_batch", (query_vectors, list(ks)), dict(kwargs, return_plans=return_plans))
+                for index in range(len(self.shards))
+            ])
+        if return_plans:
+            shard_results, shard_plans = zip(*shard_results)
+        results = [
+            list(heapq.merge(*(results[i] for results in shard_results), key=_rank))[:k]
+            for i, k in enumerate(ks)
+        ]
+        if return_plans:
+            return results, [
+                _merged_plan([plans[i] for plans in shard_plans], results[i]) for i in range(len(ks))
+            ]
+        return results
+
+    def get_document(self, doc_id: str):
+        """Retrieve a document by ID from whichever shard holds it"""
+        for document in self._scatter("get_document", doc_id):
+            if document is not None:
+                return document
+        return None
+
+    def export_documents(self, doc_ids: List[str]):
+        """Stored vectors, texts and metadata of documents across all shards"""
+        parts = self._scatter("export_documents", doc_ids)
+        return (
+            np.vstack([part[0] for part in parts]),
+            [doc_id for part in parts for doc_id in part[1]],
+            [text for part in parts for text in part[2]],
+            [metadata for part in parts for metadata in part[3]]
+        )
+
+    def index_stats(self) -> Dict[str, Any]:
+        """Summed index statistics plus those of every shard"""
+        shards = self._scatter("index_stats")
+        totals = {
+            key: sum(stats[key] for stats in shards)
+            for key in ("documents", "indexed", "staged", "trained_size", "masked_deletions", "wal_records")
+        }
+        return dict(
+            totals,
+            index_type=shards[0]["index_type"],
+            exact_search=shards[0]["exact_search"],
+            rebuilding=any(stats["rebuilding"] for stats in shards),
+            generation=self.generation,
+            num_shards=self.num_shards,
+            shards=shards
+        )
+
+    def checkpoint(self):
+        """Write a snapshot of every shard"""
+        self._scatter("checkpoint")
+
+    def wait_for_rebuild(self):
+        self._scatter("wait_for_rebuild")
+
+    def close(self):
+        """Flush every shard into a final snapshot and stop the workers"""
+        self._scatter("close")
+        for shard in self.shards:
+            shard.process.join()
+            shard.conn.close()
@@ -0,0 +1,156 @@
+# rag-service/src/snapshot.py
+from typing import List
+
+import faiss
+import numpy as np
+
+def nearest(query_vectors: np.ndarray, vectors: np.ndarray, ks: List[int]):
+    """
+    Exact top k (row, squared L2 distance) pairs of vectors per query, best first
+    """
+    # |q - v|^2 = |q|^2 - 2 q.v + |v|^2, for all pairs with one matrix product
+    distances = (
+        np.sum(query_vectors ** 2, axis=1)[:, None]
+        - 2.0 * query_vectors @ vectors.T
+        + np.sum(vectors ** 2, axis=1)[None, :]
+    )
+    np.maximum(distances, 0.0, out=distances)
+    hits = []
+    for query_vector, row, k in zip(query_vectors, distances, ks):
+        if len(row) > k:
+            top = np.argpartition(row, k)[:k]
+        else:
+            top = np.arange(len(row))
+        # Recompute the winners directly: the expansion loses precision, and
+        # differently for one query than for a batch
+        top_distances = np.sum((vectors[top] - query_vector) ** 2, axis=1)
+        order = np.argsort(top_distances, kind='stable')
+        hits.append([(int(top[i]), float(top_distances[i])) for i in order])
+    return hits
+
+class DeltaSegment:
+    """
+    Append-only buffer of the vectors written since the last merge.
+
+    Rows below count are never rewritten: appends fill spare capacity or move
+    to larger arrays, so a published view of the first n rows stays valid
+    while writers keep appending.
+    """
+
+    def __init__(self, dimension: int, capacity: int = 1024):
+        self.dimension = dimension
+        self.vectors = np.empty((capacity, dimension), dtype='float32')
+        self.ids = np.empty(capacity, dtype='int64')
+        self.count = 0
+
+    def append(self, vectors: np.ndarray, ids: np.ndarray):
+        end = self.count + len(ids)
+        if end > len(self.ids):
+            capacity = max(end, 2 * len(self.ids))
+            grown_vectors = np.empty((capacity, self.dimension), dtype='float32')
+            grown_ids = np.empty(capacity, dtype='int64')
+            grown_vectors[:self.count] = self.vectors[:self.count]
+            grown_ids[:self.count] = self.ids[:self.count]
+            self.vectors, self.ids = grown_vectors, grown_ids
+        self.vectors[self.count:end] = vectors
+        self.ids[self.count:end] = ids
+        self.count = end
+
+    def without(self, drop: np.ndarray) -> "DeltaSegment":
+        """New segment without the rows flagged in drop, e.g. deleted ones"""
+        keep = ~drop
+        segment = DeltaSegment(self.dimension, max(1024, 2 * int(keep.sum())))
+        segment.append(self.vectors[:self.count][keep], self.ids[:self.count][keep])
+        return segment
+
+    def tail(self, start: int) -> "DeltaSegment":
+        """New segment holding the rows from start on, e.g. those written during a merge"""
+        segment = DeltaSegment(self.dimension, max(1024, 2 * (self.count - start)))
+        segment.append(self.vectors[start:self.count], self.ids[start:self.count])
+        return segment
+
+class Snapshot:
+    """
+    Immutable state a search runs against: the main indexes, the delta rows
+    and the tombstoned ids at the time it was published.
+
+    Nothing a snapshot references is modified afterwards, writers publish a
+    new one instead. Selectors and lookups derived from it are built on first
+    use and cached; readers racing on that at worst build them twice.
+    """
+
+    def __init__(self, index, hybrid_index, delta_vectors: np.ndarray, delta_ids: np.ndarray, deleted: np.ndarray):
+        """
+        Args:
+            index: Exact flat copy, or None
+            hybrid_index: Approximate index, or None until it is trained
+            delta_vectors: Rows of the delta segment
+            delta_ids: Their int64 ids
+            deleted: Sorted int64 ids masked out at search time
+        """
+        self.index = index
+        self.hybrid_index = hybrid_index
+        self.delta_vectors = delta_vectors
+        self.delta_ids = delta_ids
+        self.deleted = deleted
+        self._deleted_selector = None
+        self._live_delta = None
+        self._delta_order = None
+        self._storage_labels = None
+
+    def deleted_selector(self):
+        """Selector excluding the tombstoned ids, None if there are none"""
+        if len(self.deleted) == 0:
+            return None
+        if self._deleted_selector is None:
+            deleted = faiss.IDSelectorBatch(self.deleted)
+            # Keep the inner selector referenced, IDSelectorNot does not own it
+            self._deleted_selector = (faiss.IDSelectorNot(deleted), deleted)
+        return self._deleted_selector[0]
+
+    def live_delta(self):
+        """(vectors, ids) of the delta rows that are not tombstoned"""
+        if self._live_delta is None:
+            if len(self.deleted):
+                live = ~np.isin(self.delta_ids, self.deleted)
+                self._live_delta = (self.delta_vectors[live], self.delta_ids[live])
+            else:
+                self._live_delta = (self.delta_vectors, self.delta_ids)
+        return self._live_delta
+
+    def storage_labels(self) -> np.ndarray:
+        """Row -> int64 id of an HNSW index, for exact scans of its storage"""
+        if self._storage_labels is None:
+            self._storage_labels = faiss.vector_to_array(self.hybrid_index.id_map)
+        return self._storage_labels
+
+    def reconstruct(self, ids) -> np.ndarray:
+        """
+        Stored vectors of ids: from the delta, or the exact copy if kept and
+        else the decoded approximate index
+
+        Raises:
+            KeyError: If an id is stored in neither
+        """
+        ids = np.asarray(ids, dtype='int64')
+        vectors = np.empty((len(ids), self.delta_vectors.shape[1]), dtype='float32')
+        staged = np.zeros(len(ids), dtype=bool)
+        rows = np.zeros(len(ids), dtype='int64')
+        if len(self.delta_ids):
+            if self._delta_order is None:
+                order = np.argsort(self.delta_ids, kind='stable')
+                self._delta_order = (order, self.delta_ids[order])
+            order, sorted_ids = self._delta_order
+            rows = order[np.minimum(np.searchsorted(sorted_ids, ids), len(order) - 1)]
+            staged = self.delta_ids[rows] == ids
+        if staged.any():
+            vectors[staged] = self.delta_vectors[rows[staged]]
+        if not staged.all():
+            source = self.index if self.index is not None else self.hybrid_index
+            if source is None:
+                raise KeyError(int(ids[~staged][0]))
+            try:
+                vectors[~staged] = source.reconstruct_batch(ids[~staged])
+            except RuntimeError as e:
+                raise KeyError(int(ids[~staged][0])) from e
+        return vectors
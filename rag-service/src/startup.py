@@ -0,0 +1,88 @@
+# rag-service/src/startup.py
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+class LazyComponent:
+    """
+    Service dependency that is built on first use instead of at import time.
+
+    Attribute access is forwarded to the built object, so callers use the
+    component as if it were the object itself; the first access blocks until
+    the factory has run. ``load_async`` starts building it in the background
+    and ``state`` reports progress for readiness checks.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self.factory = factory
+        # Names defined here shadow those of the built object, e.g. the
+        # pipeline's status() method, so keep them few and distinct
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.state == "ready"
+
+    def get(self) -> Any:
+        """Build the component if needed and return it"""
+        if self._instance is not None:
+            return self._instance
+        with self._lock:
+            if self._instance is None:
+                self.state = "loading"
+                started = time.perf_counter()
+                try:
+                    instance = self.factory()
+                except Exception as e:
+                    # The instance stays unset, so the next access retries
+                    self.state = "failed"
+                    self.error = str(e)
+                    raise
+                self.load_seconds = time.perf_counter() - started
+                self._instance = instance
+                self.state = "ready"
+                self.error = None
+                print(f"Loaded {self.name} in {self.load_seconds:.1f}s")
+        return self._instance
+
+    def load_async(self) -> threading.Thread:
+        thread = threading.Thread(target=self.try_load, daemon=True)
+        thread.start()
+        return thread
+
+    def try_load(self):
+        """Build the component, logging instead of raising on failure"""
+        try:
+            self.get()
+        except Exception as e:
+            print(f"Error loading {self.name}: {e}")
+
+    def describe(self) -> Dict[str, Any]:
+        return {"status": self.state, "error": self.error, "load_seconds": self.load_seconds}
+
+    def __getattr__(self, name):
+        # Only called for attributes not defined on the component itself
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+def parse_warmup_queries(value: Optional[str]) -> List[str]:
+    """Warm-up queries from a ';'-separated setting"""
+    return [query.strip() for query in (value or "").split(";") if query.strip()]
+
+def warm_up(components: List[LazyComponent]):
+    """
+    Load components one after another
+
+    Meant to run in a background thread at startup, so the port is bound
+    right away and the first real request does not pay for model loading,
+    index paging or kernel initialization. Failures are logged; the next
+    access to a failed component retries it.
+    """
+    for component in components:
+        component.try_load()
@@ -0,0 +1,66 @@
+# rag-service/src/task_executor.py
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+class ExecutorOverloaded(Exception):
+    """Raised when the executor queue is full and the task was shed"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Too many tasks in flight, retry later")
+        self.retry_after = retry_after
+
+class BoundedExecutor:
+    """
+    Thread pool for CPU and disk work with a bounded admission queue.
+
+    At most ``max_workers`` tasks run at once and at most ``max_queue_size``
+    more wait for a worker. Further submissions are rejected immediately with
+    ExecutorOverloaded instead of piling up behind a slow ingest.
+
+    Threads rather than processes: FAISS, numpy and torch release the GIL in
+    their heavy loops, and the indexes they work on live in this process.
+    Must be used from a single event loop.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue_size: int = 16, retry_after: int = 1):
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rag-worker")
+        self._slots = asyncio.Semaphore(max_workers + max_queue_size)
+        self._in_flight = 0
+        self.rejected = 0
+
+    async def run(self, func: Callable, *args, shed: bool = True, **kwargs) -> Any:
+        """
+        Run ``func`` on the pool and await its result
+
+        Args:
+            shed: Reject with ExecutorOverloaded when the queue is full. Pass
+                False for work that should wait its turn (bulk ingestion).
+        """
+        if shed and self._slots.locked():
+            self.rejected += 1
+            raise ExecutorOverloaded(self.retry_after)
+
+        async with self._slots:
+            self._in_flight += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._pool, functools.partial(func, *args, **kwargs))
+            finally:
+                self._in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue_size": self.max_queue_size,
+            "in_flight": self._in_flight,
+            "queued": max(self._in_flight - self.max_workers, 0),
+            "rejected": self.rejected
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
@@ -1,76 +1,683 @@
 # rag-service/src/vector_store.py
 import faiss
+import json
 import numpy as np
 import os
 import pickle
+import threading
+import time
 from typing import List, Dict, Any
 
+from wal import WriteAheadLog
+from doc_store import DocumentStore
+import metrics
+from hybrid_retrieval import BM25Index, reciprocal_rank_fusion, weighted_fusion
+from chunking import stitch_chunks
+from metadata_filter import MetadataIndex
+from search_planner import SearchPlanner, validate_search_options
+from snapshot import DeltaSegment, Snapshot, nearest
+from index_factory import (
+    build_index, default_search_effort, make_search_params, min_training_size,
+    remove_ids, requires_training, supports_remove, validate_index_type
+)
+
+STAGE_SECONDS = metrics.histogram(
+    "rag_vector_store_seconds", "Time spent in vector store operations", ["operation"]
+)
+DOCUMENTS_INDEXED = metrics.counter("rag_documents_indexed", "Records added or replaced in the vector store")
+DOCUMENTS_DELETED = metrics.counter("rag_documents_deleted", "Delete requests applied to the vector store")
+SEARCH_PLANS = metrics.counter("rag_search_plans", "Vector searches by the plan chosen for them", ["mode"])
+
+# Upper bound for efSearch / nprobe when widening a filtered search
+MAX_SEARCH_EFFORT = 1024
+
+# Files of a snapshot. Every checkpoint writes them under new names, see _save_index.
+SNAPSHOT_FILES = ("faiss_index.bin", "hybrid_index.bin", "staging_index.bin", "bm25_index.npz")
+
+_MISSING = object()
+
 class VectorStore:
-    def __init__(self, dimension=384):
-        """Initialize vector store with FAISS index"""
+    def __init__(self, dimension=384, data_dir="./data", checkpoint_interval=60.0, checkpoint_records=1000,
+                 index_type="hnsw", exact_search=False, rebuild_growth=4.0, mmap=True,
+                 filter_fields=None, brute_force_limit=10000, exact_search_limit=10000, delta_limit=10000):
+        """
+        Initialize vector store with FAISS index
+
+        Args:
+            dimension: Dimension of the stored vectors
+            data_dir: Directory holding the snapshot files and write-ahead log
+            checkpoint_interval: Seconds between background checkpoint checks
+            checkpoint_records: Number of logged mutations that triggers a checkpoint
+            index_type: Approximate index kind, one of index_factory.INDEX_TYPES
+            exact_search: Also keep a full-precision flat index for exact
+                (hybrid=False) searches, at 4 bytes per dimension per vector
+            rebuild_growth: Retrain a compressed index in the background once
+                the corpus grows this many times past its training size
+            mmap: Memory-map persisted indexes instead of reading them into
+                private memory, so restarts are fast and processes share pages
+            filter_fields: Metadata fields searches can filter on; None
+                indexes every scalar field
+            brute_force_limit: Filters matching at most this many documents
+                are searched exactly over just the matching vectors
+            exact_search_limit: Corpora up to this many vectors are searched
+                exactly unless a search asks otherwise, see SearchPlanner
+            delta_limit: Vectors written since the last merge that trigger a
+                background merge into the main indexes; until then they are
+                searched exactly
+        """
         self.dimension = dimension
-        self.index = faiss.IndexFlatL2(dimension)  # Base L2 distance index
-        
-        # Create hybrid index for better retrieval
-        # HNSW is faster for large datasets but requires more memory
-        self.hybrid_index = faiss.IndexHNSWFlat(dimension, 32)  # 32 is the number of neighbors
-        
-        # Metadata storage
-        self.metadata = {}
-        self.doc_texts = {}
-        
+        self.data_dir = data_dir
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_records = checkpoint_records
+        self.index_type = validate_index_type(index_type)
+        self.exact_search = exact_search
+        self.rebuild_growth = rebuild_growth
+        self.mmap = mmap
+        self.brute_force_limit = brute_force_limit
+        self.delta_limit = delta_limit
+        self.planner = SearchPlanner(exact_search_limit, max_effort=MAX_SEARCH_EFFORT)
+
+        # All indexes store our stable int64 ids instead of FAISS row numbers.
+        # The exact flat index is only kept when explicitly enabled.
+        self.index = build_index("flat", dimension) if exact_search else None  # Base L2 distance index
+
+        # Approximate index used for hybrid search. Compressed kinds need
+        # training, so it stays None until enough vectors were written.
+        self.hybrid_index = None if requires_training(index_type) else build_index(index_type, dimension)
+        self.trained_size = 0
+
+        # Searches never take the lock: they run against the last published
+        # Snapshot. The main indexes above are never modified once published
+        # (memory-mapped ones cannot be), writes append to the delta segment
+        # and tombstone deleted ids, and a background merge or rebuild works
+        # on copies that are swapped in when done.
+        self.delta = DeltaSegment(dimension)
+        self._snapshot = None
+        self._rebuild_thread = None
+
+        # Texts and metadata live on disk, keyed by int64 id. Changes since the
+        # last checkpoint are buffered (id -> (doc_id, text, metadata), or None
+        # once deleted) and committed together with the index snapshot.
+        os.makedirs(data_dir, exist_ok=True)
+        self.documents = DocumentStore(self._path("documents.db"))
+        self._pending = {}
+        self._flushing = {}
+
+        # Keyword index over the stored texts for hybrid search, keyed by the same int64 ids
+        self.bm25 = BM25Index()
+
+        # Stable doc_id <-> int64 id mapping shared by both indexes
+        self.id_map = {}
+        self.doc_ids = {}
+        self.next_id = 0
+
+        # Chunk records carry a parent_id in their metadata; parent -> chunk doc_ids
+        self.children = {}
+
+        # Metadata field value -> int64 ids, rebuilt from the document store on load
+        self.filters = MetadataIndex(filter_fields)
+
+        # Deleted ids still stored in the main indexes or the delta, masked out
+        # at search time until a merge or rebuild drops them (sorted int64)
+        self.deleted_ids = np.zeros(0, dtype='int64')
+
+        # Log sequence number of the last applied mutation
+        self.lsn = 0
+
+        # Bumped whenever search results may change, so cached results can
+        # tell they are stale; unlike the LSN it also counts index rebuilds.
+        # Bumped after a change is published, never before.
+        self.generation = 0
+        self._lock = threading.RLock()
+        self._checkpoint_lock = threading.Lock()
+        # Number of the last committed checkpoint, which names its files
+        self._checkpoint = 0
+
         # Load index if exists
         self._load_index()
-    
+        self._publish()
+
+        # Every mutation is appended to the log; the snapshot is only rewritten
+        # by the background checkpointer
+        self.wal = WriteAheadLog(self._path("wal.log"))
+        self._replay_wal()
+        with self._lock:
+            self._maybe_rebuild()
+
+        self._stop_event = threading.Event()
+        self._checkpoint_thread = threading.Thread(target=self._checkpoint_loop, daemon=True)
+        self._checkpoint_thread.start()
+
+    def _path(self, name):
+        return os.path.join(self.data_dir, name)
+
     def _save_index(self):
-        """Save index to disk"""
-        os.makedirs("./data", exist_ok=True)
-        
-        # Save FAISS index
-        faiss.write_index(self.index, "./data/faiss_index.bin")
-        faiss.write_index(self.hybrid_index, "./data/hybrid_index.bin")
-        
-        # Save metadata
-        with open("./data/metadata.pkl", "wb") as f:
-            pickle.dump({"metadata": self.metadata, "doc_texts": self.doc_texts}, f)
-    
+        """
+        Save a snapshot of the index to disk and drop the log records it covers
+
+        The keyword index and records are captured under the lock. Published
+        indexes never change, so they and the (slow) file writes are handled
+        outside it and inserts keep flowing meanwhile. The delta segment is
+        stored as the flat staging index.
+
+        Files are written under names of their own checkpoint and only the
+        document store commit, which carries the LSN, switches the state over
+        to them. A crash before it leaves the previous snapshot and its LSN
+        in place; the new files are unreferenced and removed on the next load.
+        """
+        os.makedirs(self.data_dir, exist_ok=True)
+
+        with self._lock:
+            self.bm25.compact()
+            position = self.wal.mark()
+            snapshot = self._snapshot
+            bm25_bytes = self.bm25.to_bytes()
+            state = {
+                "next_id": self.next_id,
+                "deleted_ids": snapshot.deleted.tolist(),
+                "index_type": self.index_type,
+                "trained_size": self.trained_size,
+                "lsn": self.lsn,
+                "checkpoint": self._checkpoint + 1
+            }
+            # Reads fall back to the flushing buffer until the commit is visible
+            self._flushing.update(self._pending)
+            self._pending = {}
+            changes = dict(self._flushing)
+
+        index_bytes = faiss.serialize_index(snapshot.index) if snapshot.index is not None else None
+        hybrid_bytes = faiss.serialize_index(snapshot.hybrid_index) if snapshot.hybrid_index is not None else None
+        staging = build_index("flat", self.dimension)
+        staging.add_with_ids(snapshot.delta_vectors, snapshot.delta_ids)
+        staging_bytes = faiss.serialize_index(staging)
+
+        files = {}
+        for name, data in zip(SNAPSHOT_FILES, (index_bytes, hybrid_bytes, staging_bytes, bm25_bytes)):
+            if data is not None:
+                stem, extension = os.path.splitext(name)
+                files[name] = f"{stem}.{state['checkpoint']}{extension}"
+                self._write_atomic(files[name], data)
+        state["files"] = files
+        self.documents.commit(changes, state)
+        self._checkpoint = state["checkpoint"]
+        self._remove_stale_files(files)
+
+        with self._lock:
+            for int_id in changes:
+                if self._flushing.get(int_id, 0) is changes[int_id]:
+                    del self._flushing[int_id]
+
+        self.wal.discard_before(position)
+
+    def _snapshot_file(self, files, name):
+        """Path of a snapshot file named by the state, None if the snapshot has none"""
+        if files is None:
+            # Written before versioned names, always under the plain name
+            return self._path(name) if os.path.exists(self._path(name)) else None
+        return self._path(files[name]) if name in files else None
+
+    def _remove_stale_files(self, files):
+        """Delete snapshot files the committed state does not name, e.g. of an interrupted checkpoint"""
+        live = set(files.values())
+        stems = tuple(os.path.splitext(name)[0] + "." for name in SNAPSHOT_FILES)
+        for name in os.listdir(self.data_dir):
+            if name.startswith(stems) and name not in live:
+                # Memory-mapped pages of a replaced file stay valid after the unlink
+                os.remove(self._path(name))
+
+    def _write_atomic(self, name, data):
+        """Atomically replace a snapshot file; None removes a file that is no longer used"""
+        if data is None:
+            if os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+            return
+        if isinstance(data, np.ndarray):
+            data = data.tobytes()
+        tmp_path = self._path(name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path(name))
+
     def _load_index(self):
         """Load index from disk if it exists"""
         try:
-            if os.path.exists("./data/faiss_index.bin"):
-                self.index = faiss.read_index("./data/faiss_index.bin")
-                self.hybrid_index = faiss.read_index("./data/hybrid_index.bin")
-                
-                with open("./data/metadata.pkl", "rb") as f:
-                    data = pickle.load(f)
-                    self.metadata = data["metadata"]
-                    self.doc_texts = data["doc_texts"]
-                print("Loaded existing vector store")
-            else:
+            state = self.documents.get_state()
+            if state is None and os.path.exists(self._path("metadata.pkl")):
+                state = self._import_legacy_metadata()
+            if state is None:
                 print("No existing vector store found, creating new one")
+                return
+
+            self.next_id = state["next_id"]
+            self.deleted_ids = np.unique(np.array(state["deleted_ids"], dtype='int64'))
+            self.trained_size = state["trained_size"]
+            self.lsn = state["lsn"]
+            self._checkpoint = state.get("checkpoint", 0)
+            files = state.get("files")
+            if files is not None:
+                self._remove_stale_files(files)
+            for int_id, doc_id, metadata in self.documents.iter_records():
+                self.id_map[doc_id] = int_id
+                self.doc_ids[int_id] = doc_id
+                if metadata.get("parent_id"):
+                    self.children.setdefault(metadata["parent_id"], set()).add(doc_id)
+                self.filters.add(int_id, metadata)
+
+            exact_index = self._read_faiss(self._snapshot_file(files, "faiss_index.bin"), self.mmap)
+            hybrid_index = self._read_faiss(self._snapshot_file(files, "hybrid_index.bin"), self.mmap)
+            staging = self._read_faiss(self._snapshot_file(files, "staging_index.bin"))
+
+            if exact_index is not None and not isinstance(exact_index, faiss.IndexIDMap2):
+                self._migrate_positional_index(exact_index)
+            elif state["index_type"] != self.index_type:
+                # Re-parameterized: seed from the old index, a rebuild follows
+                print(f"Index type changed from {state['index_type']} to {self.index_type}, rebuilding")
+                self._seed_from(exact_index, hybrid_index, staging)
+            else:
+                self.hybrid_index = hybrid_index if hybrid_index is not None else self.hybrid_index
+                self.index = exact_index if self.exact_search else None
+                if staging is not None and staging.ntotal:
+                    # Vectors staged at the checkpoint become the delta segment again
+                    self.delta.append(
+                        staging.index.reconstruct_n(0, staging.ntotal), faiss.vector_to_array(staging.id_map)
+                    )
+                if self.exact_search and exact_index is None:
+                    # Exact search was just enabled, fill it from the approximate copy
+                    self._publish()
+                    ids = np.fromiter(self.doc_ids, dtype='int64', count=len(self.doc_ids))
+                    ids = np.setdiff1d(ids, self.delta.ids[:self.delta.count])
+                    self.index = build_index("flat", self.dimension)
+                    self.index.add_with_ids(self._snapshot.reconstruct(ids), ids)
+
+            bm25_path = self._snapshot_file(files, "bm25_index.npz")
+            if bm25_path is not None:
+                with open(bm25_path, "rb") as f:
+                    self.bm25 = BM25Index.from_bytes(f.read())
+            else:
+                for int_id, text in self.documents.iter_texts():
+                    self.bm25.add(int_id, text)
+            print("Loaded existing vector store")
         except Exception as e:
             print(f"Error loading index: {e}")
-    
+
+    def _import_legacy_metadata(self):
+        """Move a pickled metadata snapshot into the document store, once"""
+        with open(self._path("metadata.pkl"), "rb") as f:
+            data = pickle.load(f)
+        metadata = data["metadata"]
+        id_map = data.get("id_map")
+        if id_map is None:
+            # Snapshots without stable ids numbered rows in insertion order
+            id_map = {doc_id: i for i, doc_id in enumerate(metadata)}
+        changes = {
+            int_id: (doc_id, data["doc_texts"].get(doc_id, ""), metadata.get(doc_id, {}))
+            for doc_id, int_id in id_map.items()
+        }
+        state = {
+            "next_id": data.get("next_id", len(id_map)),
+            "deleted_ids": sorted(data.get("deleted_ids", ())),
+            "index_type": data.get("index_type", "hnsw"),
+            "trained_size": data.get("trained_size", 0),
+            "lsn": data.get("lsn", 0)
+        }
+        self.documents.commit(changes, state)
+
+        # The pickled files are superseded, BM25 is rebuilt from the stored texts
+        self._write_atomic("metadata.pkl", None)
+        self._write_atomic("bm25_index.bin", None)
+        print(f"Imported {len(changes)} documents into {self.documents.path}")
+        return state
+
+    def _read_faiss(self, path, mmap=False):
+        if path is None:
+            return None
+        # Map stored vectors and codes in place instead of copying them
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC if mmap else 0)
+
+    def _migrate_positional_index(self, legacy_index):
+        """
+        Convert a snapshot written before stable ids existed
+
+        Rows were implicitly numbered in insertion order, which matches the
+        metadata dict order as long as no doc_id was ever re-added.
+        """
+        vectors = legacy_index.reconstruct_n(0, legacy_index.ntotal)
+        ids = np.array(sorted(self.doc_ids), dtype='int64')[:len(vectors)]
+        self._index_vectors(vectors[:len(ids)], ids)
+        print(f"Migrated {len(ids)} vectors to id-mapped indexes")
+
+    def _seed_from(self, *indexes):
+        """Load every live vector from previously persisted indexes into the current layout"""
+        ids = np.array(list(self.doc_ids), dtype='int64')
+        vectors = np.zeros((len(ids), self.dimension), dtype='float32')
+        missing = np.ones(len(ids), dtype=bool)
+        for index in indexes:
+            if index is None or not missing.any():
+                continue
+            present = np.array([self._contains(index, int(i)) for i in ids[missing]], dtype=bool)
+            rows = np.flatnonzero(missing)[present]
+            if len(rows):
+                vectors[rows] = index.reconstruct_batch(ids[rows])
+                missing[rows] = False
+        self.deleted_ids = np.zeros(0, dtype='int64')
+        self.trained_size = 0
+        self._index_vectors(vectors[~missing], ids[~missing])
+
+    def _replay_wal(self):
+        """Re-apply logged mutations that are newer than the loaded snapshot"""
+        replayed = 0
+        for record in self.wal.replay():
+            if record["lsn"] <= self.lsn:
+                continue
+            if record.get("op", "add") == "delete":
+                self._apply_delete(record["doc_ids"])
+            else:
+                self._apply_add(record["vectors"], record["doc_ids"], record["texts"], record["metadata_list"], record.get("ids"))
+            self.lsn = record["lsn"]
+            replayed += 1
+        if replayed:
+            print(f"Replayed {replayed} write-ahead log records")
+
+    def _checkpoint_loop(self):
+        """Fold the write-ahead log into a fresh snapshot once it grows large enough"""
+        while not self._stop_event.wait(self.checkpoint_interval):
+            if self.wal.record_count >= self.checkpoint_records:
+                self.checkpoint()
+
+    def checkpoint(self):
+        """Write a snapshot now if there are logged mutations not yet in one"""
+        with self._checkpoint_lock:
+            if self.wal.record_count == 0:
+                return
+            try:
+                with STAGE_SECONDS.time(operation="checkpoint"):
+                    self._save_index()
+            except Exception as e:
+                print(f"Error checkpointing index: {e}")
+
+    def close(self):
+        """Stop the checkpointer and flush the log into a final snapshot"""
+        self._stop_event.set()
+        self.checkpoint()
+        self.wal.close()
+        self.documents.close()
+
+    @staticmethod
+    def _contains(index, int_id):
+        try:
+            index.reconstruct(int_id)
+            return True
+        except RuntimeError:
+            return False
+
+    def _reconstruct(self, int_id):
+        """Best available copy of a stored vector: staged, exact or decoded"""
+        return self._snapshot.reconstruct([int_id])[0]
+
+    def _publish(self):
+        """Make the current indexes, delta rows and tombstones the snapshot searches run against"""
+        count = self.delta.count
+        self._snapshot = Snapshot(
+            self.index, self.hybrid_index, self.delta.vectors[:count], self.delta.ids[:count], self.deleted_ids
+        )
+
+    def _index_vectors(self, vectors, ids):
+        """Append vectors to the delta segment, searched exactly until the next merge"""
+        self.delta.append(vectors, ids)
+        self._publish()
+
+    def _unindex_vectors(self, ids):
+        """Tombstone ids, the next merge or rebuild drops them from the indexes"""
+        self.deleted_ids = np.union1d(self.deleted_ids, np.asarray(ids, dtype='int64'))
+        self._publish()
+
+    def _maybe_rebuild(self):
+        """Start a background merge or (re)build of the main indexes when one is due"""
+        if self._rebuild_thread is not None and self._rebuild_thread.is_alive():
+            return
+        staged_deletions = self._compact_delta()
+        live = len(self.doc_ids)
+        main = self.hybrid_index
+        if main is None:
+            rebuild = live >= min_training_size(self.index_type)
+        elif requires_training(self.index_type):
+            # Quantizers and IVF cells trained on a much smaller corpus lose recall
+            rebuild = live > self.rebuild_growth * max(self.trained_size, 1)
+        else:
+            rebuild = False
+        # Masked-out deletions still cost graph traversal, rebuild once they
+        # are a quarter of the live vectors (main and delta)
+        rebuild = rebuild or (
+            main is not None and not supports_remove(self.index_type)
+            and len(self.deleted_ids) - staged_deletions > 0.25 * live
+        )
+        # The delta is scanned exactly, fold it in before it gets slow; indexes
+        # that can drop vectors also drop their tombstones in a merge
+        merge = main is not None and (
+            self.delta.count >= self.delta_limit
+            or (supports_remove(self.index_type) and len(self.deleted_ids) >= self.delta_limit)
+        )
+        if rebuild:
+            ids = np.fromiter(self.doc_ids, dtype='int64', count=live)
+            self._rebuild_thread = threading.Thread(target=self._rebuild, args=(self._snapshot, ids), daemon=True)
+        elif merge:
+            self._rebuild_thread = threading.Thread(target=self._merge, args=(self._snapshot,), daemon=True)
+        else:
+            return
+        self._rebuild_thread.start()
+
+    def _compact_delta(self) -> int:
+        """
+        Drop deleted rows, and their tombstones, from the delta segment once
+        they are a quarter of it; they are not in the main indexes, so no
+        merge or rebuild is needed to get rid of them. Only called while no
+        merge or rebuild runs, those expect the delta to start with the rows
+        of their snapshot.
+
+        Returns:
+            Number of tombstones still masking delta rows
+        """
+        count = self.delta.count
+        if not count or not len(self.deleted_ids):
+            return 0
+        deleted = np.isin(self.delta.ids[:count], self.deleted_ids)
+        staged_deletions = int(deleted.sum())
+        if not staged_deletions or 4 * staged_deletions < count:
+            return staged_deletions
+        dropped = self.delta.ids[:count][deleted]
+        self.delta = self.delta.without(deleted)
+        self.deleted_ids = np.setdiff1d(self.deleted_ids, dropped, assume_unique=True)
+        # Searches return the same results, so the generation stays
+        self._publish()
+        return 0
+
+    def wait_for_rebuild(self):
+        """Block until running background merges and rebuilds have been swapped in"""
+        while True:
+            thread = self._rebuild_thread
+            if thread is None or not thread.is_alive() or thread is threading.current_thread():
+                return
+            thread.join()
+
+    @staticmethod
+    def _copy_index(index):
+        # A serialization round trip, clone_index would keep viewing the pages
+        # of a memory-mapped index and fail on the first add
+        return faiss.deserialize_index(faiss.serialize_index(index))
+
+    def _merge(self, snapshot):
+        """
+        Fold the delta rows and tombstones of a snapshot into copies of its
+        main indexes, off the lock, then swap them in
+
+        A copy briefly doubles the memory of the main indexes. HNSW graphs
+        cannot drop vectors, their tombstones stay masked until a rebuild.
+        """
+        try:
+            started = time.perf_counter()
+            index = self._copy_index(snapshot.hybrid_index)
+            exact_index = self._copy_index(snapshot.index) if snapshot.index is not None else None
+            vectors, ids = snapshot.live_delta()
+            dropped = np.intersect1d(snapshot.deleted, snapshot.delta_ids, assume_unique=True)
+            if len(snapshot.deleted):
+                if exact_index is not None:
+                    remove_ids(exact_index, snapshot.deleted)
+                if supports_remove(self.index_type):
+                    remove_ids(index, snapshot.deleted)
+                    dropped = snapshot.deleted
+            if len(ids):
+                index.add_with_ids(vectors, ids)
+                if exact_index is not None:
+                    exact_index.add_with_ids(vectors, ids)
+            self._swap(snapshot, index, exact_index, dropped)
+            STAGE_SECONDS.observe(time.perf_counter() - started, operation="merge")
+        except Exception as e:
+            print(f"Error merging index: {e}")
+
+    def _rebuild(self, snapshot, ids):
+        """
+        Build and train a fresh approximate index over the live ids of a
+        snapshot off the lock, then swap it in
+
+        Without an exact index the source vectors of a compressed index are
+        decoded approximations, which is good enough to retrain on.
+        """
+        try:
+            started = time.perf_counter()
+            vectors = snapshot.reconstruct(ids)
+            index = build_index(self.index_type, self.dimension, len(ids))
+            if not index.is_trained:
+                sample = vectors
+                if len(vectors) > 100000:
+                    sample = vectors[np.random.default_rng(0).choice(len(vectors), 100000, replace=False)]
+                index.train(sample)
+            exact_index = build_index("flat", self.dimension) if snapshot.index is not None else None
+            if len(ids):
+                index.add_with_ids(vectors, ids)
+                if exact_index is not None:
+                    exact_index.add_with_ids(vectors, ids)
+            self._swap(snapshot, index, exact_index, snapshot.deleted, trained_size=len(ids))
+            STAGE_SECONDS.observe(time.perf_counter() - started, operation="rebuild")
+            print(f"Rebuilt {self.index_type} index over {len(ids)} vectors")
+        except Exception as e:
+            print(f"Error rebuilding index: {e}")
+
+    def _swap(self, snapshot, index, exact_index, dropped, trained_size=None):
+        """
+        Publish indexes built from a snapshot
+
+        Writes since the snapshot are still in the delta rows after its own
+        and in the tombstones, so nothing needs replaying; only tombstones of
+        vectors the new indexes no longer hold are dropped.
+        """
+        with self._lock:
+            self.hybrid_index = index
+            self.index = exact_index
+            self.delta = self.delta.tail(len(snapshot.delta_ids))
+            self.deleted_ids = np.setdiff1d(self.deleted_ids, dropped, assume_unique=True)
+            if trained_size is not None:
+                self.trained_size = trained_size
+            self._publish()
+            # Only after publishing: searches read the generation without the
+            # lock, and must not cache old-snapshot results under the new one
+            self.generation += 1
+            # Ingests during a long job can leave the delta due for the next merge
+            self._rebuild_thread = None
+            self._maybe_rebuild()
+
+    def _apply_delete(self, doc_ids):
+        # Deleting a parent document deletes all of its chunks
+        expanded = []
+        for doc_id in doc_ids:
+            expanded.append(doc_id)
+            expanded.extend(self.children.get(doc_id, ()))
+
+        ids = [self.id_map.pop(doc_id) for doc_id in expanded if doc_id in self.id_map]
+        if not ids:
+            return
+        self._unindex_vectors(ids)
+        records = self._fetch(ids)
+        for int_id in ids:
+            self.bm25.delete(int_id)
+            doc_id = self.doc_ids.pop(int_id)
+            metadata = records[int_id][2] if int_id in records else {}
+            parent_id = metadata.get("parent_id")
+            self.filters.remove(int_id, metadata)
+            self._pending[int_id] = None
+            if parent_id in self.children:
+                self.children[parent_id].discard(doc_id)
+                if not self.children[parent_id]:
+                    del self.children[parent_id]
+        self.generation += 1
+
+    def _apply_add(self, vectors_np, doc_ids, texts, metadata_list, ids=None):
+        # Re-adding a doc_id replaces the previous version instead of
+        # leaving a stale duplicate behind. Chunks of a re-added parent replace
+        # all of its previous chunks, since the new version may have fewer.
+        parents = {metadata.get("parent_id") for metadata in metadata_list} - {None}
+        self._apply_delete([doc_id for doc_id in doc_ids if doc_id in self.id_map] + list(parents))
+
+        if ids is None:
+            ids = np.arange(self.next_id, self.next_id + len(doc_ids), dtype='int64')
+        ids = np.asarray(ids, dtype='int64')
+        self.next_id = max(self.next_id, int(ids.max()) + 1)
+
+        self._index_vectors(vectors_np, ids)
+
+        # Store metadata
+        for i, doc_id in enumerate(doc_ids):
+            int_id = int(ids[i])
+            self.id_map[doc_id] = int_id
+            self.doc_ids[int_id] = doc_id
+            self._pending[int_id] = (doc_id, texts[i], metadata_list[i])
+            self.bm25.add(int_id, texts[i])
+            self.filters.add(int_id, metadata_list[i])
+            if metadata_list[i].get("parent_id"):
+                self.children.setdefault(metadata_list[i]["parent_id"], set()).add(doc_id)
+        self.generation += 1
+        return ids
+
     def add_vectors(self, vectors: np.ndarray, doc_ids: List[str], texts: List[str], metadata_list: List[Dict[str, Any]]):
-        """Add vectors to the index with their associated metadata"""
+        """
+        Add vectors to the index with their associated metadata
+
+        Existing doc_ids are replaced, so this doubles as a bulk upsert.
+        """
         if len(vectors) == 0:
             return
-            
+
         # Convert to numpy array if not already
         vectors_np = np.array(vectors).astype('float32')
-        
-        # Add to both indices
-        self.index.add(vectors_np)
-        self.hybrid_index.add(vectors_np)
-        
-        # Store metadata
-        for i, doc_id in enumerate(doc_ids):
-            self.metadata[doc_id] = metadata_list[i]
-            self.doc_texts[doc_id] = texts[i]
-        
-        # Save updated index
-        self._save_index()
-    
+
+        # If a doc_id repeats within the batch only its last version is kept
+        if len(set(doc_ids)) != len(doc_ids):
+            last = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+            keep = sorted(last.values())
+            vectors_np = vectors_np[keep]
+            doc_ids = [doc_ids[i] for i in keep]
+            texts = [texts[i] for i in keep]
+            metadata_list = [metadata_list[i] for i in keep]
+
+        with STAGE_SECONDS.time(operation="add"), self._lock:
+            self.lsn += 1
+            ids = np.arange(self.next_id, self.next_id + len(doc_ids), dtype='int64')
+
+            # Log before applying so an acknowledged insert survives a crash
+            self.wal.append({
+                "lsn": self.lsn,
+                "op": "add",
+                "ids": ids,
+                "vectors": vectors_np,
+                "doc_ids": list(doc_ids),
+                "texts": list(texts),
+                "metadata_list": list(metadata_list)
+            })
+            self._apply_add(vectors_np, doc_ids, texts, metadata_list, ids)
+            self._maybe_rebuild()
+        DOCUMENTS_INDEXED.inc(len(doc_ids))
+
     def add_document(self, doc_id: str, vector: np.ndarray, text: str, metadata: Dict[str, Any]):
         """Add a single document to the index"""
         self.add_vectors(
@@ -79,47 +686,515 @@ class VectorStore:
             texts=[text],
             metadata_list=[metadata]
         )
-    
-    def search(self, query_vector: np.ndarray, k: int = 5, hybrid: bool = True):
+
+    def upsert_document(self, doc_id: str, vector: np.ndarray, text: str, metadata: Dict[str, Any]):
+        """Insert a document, or replace the stored version if doc_id already exists"""
+        self.add_document(doc_id, vector, text, metadata)
+
+    def delete_document(self, doc_id: str) -> bool:
+        """
+        Remove a document, or a parent document and all of its chunks
+
+        Returns:
+            True if the document existed
+        """
+        return self.delete_documents([doc_id]) == 1
+
+    def delete_documents(self, doc_ids: List[str]) -> int:
+        """
+        Remove many documents (or parents with their chunks) under one
+        write-ahead log record
+
+        Returns:
+            Number of the doc_ids that existed
+        """
+        with self._lock:
+            existing = [doc_id for doc_id in dict.fromkeys(doc_ids) if doc_id in self.id_map or doc_id in self.children]
+            if not existing:
+                return 0
+            self.lsn += 1
+            self.wal.append({"lsn": self.lsn, "op": "delete", "doc_ids": existing})
+            self._apply_delete(existing)
+            self._maybe_rebuild()
+        DOCUMENTS_DELETED.inc(len(existing))
+        return len(existing)
+
+    def search(self, query_vector: np.ndarray, k: int = 5, hybrid: bool = True,
+               query_text: str = None, alpha: float = 0.7, fusion: str = "rrf",
+               group_by_parent: bool = True, filters: Dict[str, Any] = None,
+               search_options: Dict[str, Any] = None, return_plan: bool = False):
         """
         Search for similar vectors
-        If hybrid=True, use the HNSW index which is faster but approximate
-        """
-        query_vector = query_vector.reshape(1, -1).astype('float32')
-        
-        # Use appropriate index based on hybrid flag
-        index_to_use = self.hybrid_index if hybrid else self.index
-        
-        # Search
-        distances, indices = index_to_use.search(query_vector, k)
-        
-        # Get results with metadata
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx < 0 or idx >= self.index.ntotal:  # Invalid index
+        If hybrid=True, let the planner choose between exact and approximate
+        search, and when query_text is given fuse in BM25 keyword matches on
+        the stored texts; hybrid=False is an exact vector-only search unless
+        search_options say otherwise
+
+        Args:
+            alpha: Weight between BM25 and vector (0 = BM25 only, 1 = vector only)
+            fusion: "rrf" for reciprocal-rank fusion or "weighted" for
+                normalized score fusion
+            group_by_parent: Return the top k parent documents, each with its
+                best matching chunk as text and all matching chunks listed
+            filters: Only return documents whose metadata matches, see
+                metadata_filter.MetadataIndex for the syntax
+            search_options: Search mode, efSearch / nprobe, recall target or
+                latency budget, see search_planner.validate_search_options
+            return_plan: Also return the plan the search ran with
+
+        Raises:
+            ValueError: If the filter or a search option is malformed
+        """
+        results = self.search_batch(
+            query_vector.reshape(1, -1), [k], [query_text], [filters],
+            hybrid=hybrid, alpha=alpha, fusion=fusion, group_by_parent=group_by_parent,
+            search_options=search_options, return_plans=return_plan
+        )
+        if return_plan:
+            return results[0][0], results[1][0]
+        return results[0]
+
+    def search_batch(self, query_vectors: np.ndarray, ks: List[int], query_texts: List[str] = None,
+                     filters: List[Dict[str, Any]] = None, hybrid: bool = True, alpha: float = 0.7,
+                     fusion: str = "rrf", group_by_parent: bool = True,
+                     search_options: Dict[str, Any] = None, return_plans: bool = False):
+        """
+        Search for many queries at once
+
+        Queries without a filter, and queries with the same filter, are
+        answered by one matrix search per index, and the stored records of
+        all hits are read together.
+
+        Args:
+            query_vectors: One query vector per row
+            ks: Number of results per query
+            query_texts: Per-query text for BM25 fusion, or None
+            filters: Per-query metadata filter, or None
+            (the other arguments apply to every query, see search)
+
+        Returns:
+            One result list per query, in query order, and with return_plans
+            also the list of their search plans
+
+        Raises:
+            ValueError: If a filter or search option is malformed
+        """
+        search_options = validate_search_options(search_options)
+        if not hybrid:
+            search_options.setdefault("mode", "exact")
+        query_vectors = np.asarray(query_vectors, dtype='float32').reshape(len(ks), -1)
+        query_texts = query_texts or [None] * len(ks)
+        filters = filters or [None] * len(ks)
+
+        # Identical filters are evaluated once and share the resulting array
+        allowed = [None] * len(ks)
+        if any(filters):
+            evaluated = {}
+            for i, query_filter in enumerate(filters):
+                if query_filter:
+                    key = json.dumps(query_filter, sort_keys=True, default=str)
+                    if key not in evaluated:
+                        evaluated[key] = self.filters.evaluate(query_filter)
+                    allowed[i] = evaluated[key]
+
+        # Taken after the filters, so it holds every vector they matched
+        snapshot = self._snapshot
+
+        # Several chunks of one parent can rank highly, so search deeper, and
+        # deeper again for the queries whose chunks still name fewer than k
+        # parents, until the index or the filter matches are exhausted
+        grouped = group_by_parent and bool(self.children)
+        depths = [4 * k if grouped else k for k in ks]
+        results = [None] * len(ks)
+        plans = [None] * len(ks)
+        pending = list(range(len(ks)))
+        while pending:
+            ranked, pending_plans = self._ranked_search(
+                query_vectors[pending], [depths[i] for i in pending], hybrid,
+                [query_texts[i] for i in pending], alpha, fusion, [allowed[i] for i in pending],
+                search_options, snapshot
+            )
+            with STAGE_SECONDS.time(operation="fetch"):
+                records = self._fetch(list({hit[0] for hits in ranked for hit in hits}))
+            widen = []
+            for i, hits, plan in zip(pending, ranked, pending_plans):
+                query_results = self._results(hits, records)
+                plans[i] = plan
+                if not grouped:
+                    results[i] = query_results
+                    continue
+                results[i] = self._group_by_parent(query_results, ks[i])
+                available = len(self.doc_ids) if allowed[i] is None else len(allowed[i])
+                if len(results[i]) < ks[i] and depths[i] < available:
+                    depths[i] = min(4 * depths[i], available)
+                    widen.append(i)
+            pending = widen
+        if return_plans:
+            return results, plans
+        return results
+
+    def _group_by_parent(self, results, k):
+        grouped = {}
+        for result in results:
+            parent_id = result["metadata"].get("parent_id")
+            if parent_id is None:
+                grouped.setdefault(result["id"], result)
                 continue
-                
-            # Find which document this is
-            distance = distances[0][i]
-            
-            # Create result object 
-            doc_id = list(self.metadata.keys())[idx]
+            chunk = {"id": result["id"], "distance": result["distance"], "text": result["text"]}
+            if parent_id not in grouped:
+                if len(grouped) >= k:
+                    continue
+                grouped[parent_id] = dict(result, id=parent_id, chunk_id=result["id"], chunks=[])
+            grouped[parent_id].setdefault("chunks", []).append(chunk)
+        return list(grouped.values())[:k]
+
+    def _ranked_search(self, query_vectors, ks, hybrid, query_texts, alpha, fusion, allowed, search_options, snapshot):
+        """
+        Best-first chunk or document hits per query, vector-only or fused with BM25
+
+        Returns:
+            (hits, plans): per query a list of (int id, distance) hits, with
+            the fused and BM25 scores appended when keywords were used, and
+            the plan of its vector search
+        """
+        use_keywords = [hybrid and bool(query_text) and alpha < 1.0 for query_text in query_texts]
+
+        # Fusion needs a deeper candidate list from each side than the final k
+        fetch_ks = [max(4 * k, 50) if keywords else k for k, keywords in zip(ks, use_keywords)]
+        vector_hits, plans = self._vector_search(query_vectors, fetch_ks, allowed, search_options, snapshot)
+
+        ranked = []
+        for i, k in enumerate(ks):
+            if not use_keywords[i] or (allowed[i] is not None and len(allowed[i]) == 0):
+                ranked.append(vector_hits[i][:k])
+                continue
+            with STAGE_SECONDS.time(operation="keyword_search"):
+                keyword_hits = self.bm25.search(query_texts[i], fetch_ks[i], allowed[i])
+            if fusion == "weighted":
+                scores = weighted_fusion(
+                    {int_id: -distance for int_id, distance in vector_hits[i]},
+                    dict(keyword_hits),
+                    alpha
+                )
+            else:
+                scores = reciprocal_rank_fusion(
+                    [int_id for int_id, _ in vector_hits[i]],
+                    [int_id for int_id, _ in keyword_hits],
+                    alpha
+                )
+
+            distances = dict(vector_hits[i])
+            keyword_scores = dict(keyword_hits)
+            hits = []
+            for int_id in sorted(scores, key=scores.get, reverse=True)[:k]:
+                distance = distances.get(int_id)
+                if distance is None:
+                    # Keyword-only hit, compute its vector distance for a uniform result shape.
+                    # It may be newer than the snapshot, so look it up in the current one.
+                    try:
+                        vector = self._reconstruct(int_id)
+                    except KeyError:
+                        continue  # Deleted and merged away since the keyword search
+                    distance = float(np.sum((vector - query_vectors[i]) ** 2))
+                hits.append((int_id, distance, scores[int_id], keyword_scores.get(int_id, 0.0)))
+            ranked.append(hits)
+        return ranked, plans
+
+    def _vector_search(self, query_vectors, ks, allowed, search_options, snapshot):
+        """
+        (int id, distance) pairs of live documents per query, best first
+
+        Queries are grouped by filter so every group is one matrix search
+        with one plan.
+
+        Returns:
+            (hits, plans) per query
+        """
+        hits = [[] for _ in ks]
+        plans = [{"mode": "exact", "ef_search": None, "nprobe": None, "index": None, "compressed": False,
+                  "reason": "filter matches nothing"} for _ in ks]
+        groups = {}
+        for i, query_allowed in enumerate(allowed):
+            if query_allowed is None or len(query_allowed):
+                groups.setdefault(id(query_allowed), []).append(i)
+
+        for rows in groups.values():
+            group_allowed = allowed[rows[0]]
+            group_ks = [ks[i] for i in rows]
+            if group_allowed is not None and len(group_allowed) <= self.brute_force_limit:
+                plan = {"mode": "exact", "ef_search": None, "nprobe": None, "index": "filtered_scan",
+                        "compressed": snapshot.index is None and self.index_type in ("hnsw_sq8", "ivfpq"),
+                        "reason": f"filter matches {len(group_allowed)} vectors, scanned directly"}
+                group_hits = self._brute_force_search(query_vectors[rows], group_ks, group_allowed, snapshot)
+            else:
+                group_hits, plan = self._index_search(
+                    query_vectors[rows], max(group_ks), group_allowed, search_options, snapshot
+                )
+            fallback = []
+            for i, k, row_hits in zip(rows, group_ks, group_hits):
+                hits[i] = row_hits[:k]
+                plans[i] = plan
+                if group_allowed is not None and len(hits[i]) < min(k, len(group_allowed)):
+                    fallback.append(i)
+            if fallback:
+                # The graph or the probed lists held too few matches, fall back to
+                # an exact scan so a selective filter still returns k results
+                exact = self._brute_force_search(
+                    query_vectors[fallback], [ks[i] for i in fallback], group_allowed, snapshot
+                )
+                for i, row_hits in zip(fallback, exact):
+                    hits[i] = row_hits
+                    plans[i] = dict(plan, mode="exact", reason=plan["reason"] + ", too few filter matches so rescanned exactly")
+        for plan in plans:
+            SEARCH_PLANS.inc(mode=plan["mode"])
+        return hits, plans
+
+    def _index_search(self, query_vectors, k, allowed, search_options, snapshot):
+        """
+        Top k (int id, distance) pairs per query from the delta segment and
+        the main indexes of a snapshot, searched as the planner decides
+
+        Search parameters are passed per call, never set on the shared index,
+        so concurrent searches with different efforts do not interfere.
+
+        Returns:
+            (hits per query, plan)
+        """
+        main = snapshot.hybrid_index
+        corpus_size = main.ntotal if main is not None else 0
+        plan = self.planner.plan(
+            search_options, self.index_type, corpus_size, k,
+            default_search_effort(self.index_type, main) if main is not None else 0,
+            main.nlist if self.index_type == "ivfpq" and main is not None else 0
+        )
+
+        # Mask out tombstoned vectors. A filter only lists live ids, so its
+        # selector masks deletions too.
+        if allowed is not None:
+            selector = faiss.IDSelectorBatch(allowed)
+            if plan["mode"] == "approximate":
+                # Only a fraction of the visited vectors pass the filter, widen
+                # the search accordingly to still find k of them
+                effort = plan["ef_search"] or plan["nprobe"]
+                widened = min(MAX_SEARCH_EFFORT, int(effort * len(self.doc_ids) / len(allowed)))
+                if widened > effort:
+                    key = "ef_search" if plan["ef_search"] else "nprobe"
+                    if key == "nprobe":
+                        widened = min(widened, main.nlist)
+                    plan = dict(plan, reason=plan["reason"] + f", widened to {widened} for the filter", **{key: widened})
+        else:
+            selector = snapshot.deleted_selector()
+
+        # Which copy the main search reads; an exact scan without the flat copy
+        # still ranks by the compressed codes of hnsw_sq8 and ivfpq
+        exact_copy = plan["mode"] == "exact" and snapshot.index is not None
+        storage_scan = (
+            plan["mode"] == "exact" and not exact_copy and main is not None and self.index_type in ("hnsw", "hnsw_sq8")
+        )
+        if main is None or main.ntotal == 0:
+            # Nothing merged (or trained) yet, the delta segment holds every vector
+            scanned = "delta"
+        elif exact_copy:
+            scanned = "flat"
+        elif storage_scan:
+            # The vectors (or codes) under the graph, not the graph itself
+            scanned = f"{self.index_type}_storage"
+        else:
+            scanned = self.index_type
+        plan = dict(
+            plan,
+            index=scanned,
+            compressed=scanned not in ("delta", "flat") and self.index_type in ("hnsw_sq8", "ivfpq")
+        )
+
+        hits = [[] for _ in range(len(query_vectors))]
+        started = time.perf_counter()
+        self._delta_search(query_vectors, k, allowed, snapshot, hits)
+        searches = []
+        if exact_copy:
+            searches.append((snapshot.index, faiss.SearchParameters(sel=selector)))
+        elif storage_scan:
+            # No flat copy kept: scan the vectors stored under the graph instead
+            self._storage_search(query_vectors, k, allowed, snapshot, hits)
+        elif main is not None:
+            searches.append((
+                main,
+                make_search_params(
+                    self.index_type, main, selector, plan["ef_search"],
+                    main.nlist if plan["mode"] == "exact" and self.index_type == "ivfpq" else plan["nprobe"]
+                )
+            ))
+        for index, params in searches:
+            if index.ntotal == 0:
+                continue
+            with STAGE_SECONDS.time(operation="vector_search"):
+                distances, indices = index.search(query_vectors, k, params=params)
+            for row_hits, row_distances, row_indices in zip(hits, distances, indices):
+                row_hits.extend(
+                    (int(idx), float(distance))
+                    for distance, idx in zip(row_distances, row_indices)
+                    if int(idx) in self.doc_ids  # Skip invalid or deleted ids
+                )
+        self.planner.observe(plan, time.perf_counter() - started, len(query_vectors), corpus_size)
+        for row_hits in hits:
+            row_hits.sort(key=lambda hit: hit[1])
+        return hits, plan
+
+    def _delta_search(self, query_vectors, k, allowed, snapshot, hits):
+        """Exact scan of the delta rows of a snapshot, appending (int id, distance) pairs to hits"""
+        vectors, ids = snapshot.live_delta()
+        if allowed is not None and len(ids):
+            keep = np.isin(ids, allowed)
+            vectors, ids = vectors[keep], ids[keep]
+        if len(ids) == 0:
+            return
+        with STAGE_SECONDS.time(operation="vector_search"):
+            nearest_rows = nearest(query_vectors, vectors, [k] * len(query_vectors))
+        for row_hits, row_nearest in zip(hits, nearest_rows):
+            row_hits.extend(
+                (int(ids[row]), distance) for row, distance in row_nearest if int(ids[row]) in self.doc_ids
+            )
+
+    def _storage_search(self, query_vectors, k, allowed, snapshot, hits):
+        """
+        Exact scan of the vectors an HNSW graph stores (8-bit codes for
+        hnsw_sq8), appending (int id, distance) pairs to hits
+        """
+        storage = faiss.downcast_index(snapshot.hybrid_index.index).storage
+        labels = snapshot.storage_labels()
+
+        # Storage rows are not our ids, translate the filter or the tombstones
+        selector = params = None
+        if allowed is not None:
+            selector = faiss.IDSelectorBatch(np.flatnonzero(np.isin(labels, allowed)))
+        elif len(snapshot.deleted):
+            selector = faiss.IDSelectorBatch(np.flatnonzero(~np.isin(labels, snapshot.deleted)))
+        if selector is not None:
+            params = faiss.SearchParameters(sel=selector)
+        with STAGE_SECONDS.time(operation="vector_search"):
+            distances, rows = storage.search(query_vectors, k, params=params)
+        for row_hits, row_distances, row_rows in zip(hits, distances, rows):
+            row_hits.extend(
+                (int(labels[row]), float(distance))
+                for distance, row in zip(row_distances, row_rows)
+                if row >= 0 and int(labels[row]) in self.doc_ids
+            )
+
+    def _brute_force_search(self, query_vectors, ks, allowed, snapshot):
+        """Exact distances of every query to just the allowed ids"""
+        with STAGE_SECONDS.time(operation="vector_search"):
+            # Ids deleted since the filter ran may already be merged out of the snapshot
+            allowed = np.array([int_id for int_id in allowed if int_id in self.doc_ids], dtype='int64')
+            vectors = snapshot.reconstruct(allowed)
+            return [
+                [(int(allowed[row]), distance) for row, distance in row_nearest]
+                for row_nearest in nearest(query_vectors, vectors, ks)
+            ]
+
+    def _fetch(self, int_ids):
+        """Stored (doc_id, text, metadata) by int id, checking unflushed changes first"""
+        records = {}
+        missing = []
+        for int_id in int_ids:
+            for buffer in (self._pending, self._flushing):
+                # Searches read without the lock, a checkpoint may drop the entry meanwhile
+                record = buffer.get(int_id, _MISSING)
+                if record is not _MISSING:
+                    if record is not None:
+                        records[int_id] = record
+                    break
+            else:
+                missing.append(int_id)
+        if missing:
+            records.update(self.documents.get_many(missing))
+        return records
+
+    def _results(self, hits, records=None):
+        """
+        Result dicts for (int id, distance[, fused score, BM25 score]) hits,
+        reading only their rows unless the records were fetched already
+        """
+        if records is None:
+            with STAGE_SECONDS.time(operation="fetch"):
+                records = self._fetch([hit[0] for hit in hits])
+        results = []
+        for hit in hits:
+            int_id = hit[0]
+            if int_id not in records:
+                continue  # Deleted since the index search
             result = {
-                "id": doc_id,
-                "distance": float(distance),
-                "text": self.doc_texts.get(doc_id, ""),
-                "metadata": self.metadata.get(doc_id, {})
+                "id": records[int_id][0],
+                "distance": float(hit[1]),
+                "text": records[int_id][1],
+                "metadata": records[int_id][2]
             }
+            if len(hit) > 2:
+                result["score"] = hit[2]
+                result["bm25_score"] = hit[3]
             results.append(result)
-            
         return results
-        
+
+    def index_stats(self) -> Dict[str, Any]:
+        """Layout and size of the vector indexes"""
+        snapshot = self._snapshot
+        thread = self._rebuild_thread
+        return {
+            "index_type": self.index_type,
+            "exact_search": snapshot.index is not None,
+            "documents": len(self.doc_ids),
+            "indexed": snapshot.hybrid_index.ntotal if snapshot.hybrid_index is not None else 0,
+            "staged": len(snapshot.delta_ids),
+            "trained_size": self.trained_size,
+            "masked_deletions": len(snapshot.deleted),
+            "wal_records": self.wal.record_count,
+            "generation": self.generation,
+            "rebuilding": thread is not None and thread.is_alive(),
+            "planner": self.planner.stats()
+        }
+
+    def export_documents(self, doc_ids: List[str]):
+        """
+        Stored vectors, texts and metadata of documents, e.g. to move them to
+        another store. Parent ids expand to all of their chunks.
+
+        Vectors of a compressed index without an exact copy are decoded
+        approximations.
+
+        Returns:
+            (vectors, doc_ids, texts, metadata_list) in add_vectors order
+        """
+        with self._lock:
+            expanded = []
+            for doc_id in doc_ids:
+                if doc_id in self.children:
+                    expanded.extend(sorted(self.children[doc_id]))
+                elif doc_id in self.id_map:
+                    expanded.append(doc_id)
+            ids = np.array([self.id_map[doc_id] for doc_id in expanded], dtype='int64')
+            if len(ids) == 0:
+                return np.empty((0, self.dimension), dtype='float32'), [], [], []
+            vectors = self._snapshot.reconstruct(ids)
+            records = self._fetch(ids.tolist())
+        return (
+            vectors,
+            [records[int_id][0] for int_id in ids.tolist()],
+            [records[int_id][1] for int_id in ids.tolist()],
+            [records[int_id][2] for int_id in ids.tolist()]
+        )
+
     def get_document(self, doc_id: str):
-        """Retrieve a document by ID"""
-        if doc_id in self.metadata:
-            return {
-                "id": doc_id,
-                "text": self.doc_texts.get(doc_id, ""),
-                "metadata": self.metadata.get(doc_id, {})
+        """Retrieve a document by ID, stitching chunked documents back together"""
+        if doc_id in self.children:
+            records = self._fetch([self.id_map[chunk_id] for chunk_id in self.children[doc_id]])
+            chunks = [dict(metadata, text=text) for _, text, metadata in records.values()]
+            metadata = {
+                key: value for key, value in chunks[0].items()
+                if key not in ("parent_id", "chunk_index", "start", "end", "text")
             }
-        return None
\ No newline at end of file
+            return {"id": doc_id, "text": stitch_chunks(chunks), "metadata": metadata}
+        if doc_id in self.id_map:
+            records = self._fetch([self.id_map[doc_id]])
+            if records:
+                _, text, metadata = records[self.id_map[doc_id]]
+                return {"id": doc_id, "text": text, "metadata": metadata}
+        return None
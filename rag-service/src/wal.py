@@ -0,0 +1,110 @@
+# rag-service/src/wal.py
+import os
+import pickle
+import struct
+import threading
+from typing import Any, Dict, Iterator
+
+class WriteAheadLog:
+    """
+    Append-only log of vector store mutations.
+
+    Every record is written as a 4-byte length prefix followed by a pickled
+    payload, so a record torn by a crash mid-append can be detected and
+    dropped on replay instead of corrupting the whole log.
+    """
+
+    HEADER = struct.Struct("<I")
+
+    def __init__(self, path: str, fsync: bool = True):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self.record_count = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "ab")
+
+    def append(self, record: Dict[str, Any]):
+        """Durably append a single record to the end of the log"""
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._file.write(self.HEADER.pack(len(payload)) + payload)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.record_count += 1
+
+    def replay(self) -> Iterator[Dict[str, Any]]:
+        """
+        Yield every complete record in the log, in write order.
+
+        A torn record at the tail is truncated away so later appends start
+        from a clean record boundary.
+        """
+        with self._lock:
+            self._file.flush()
+            valid_end = 0
+            count = 0
+            with open(self.path, "rb") as f:
+                while True:
+                    header = f.read(self.HEADER.size)
+                    if len(header) < self.HEADER.size:
+                        break
+                    (length,) = self.HEADER.unpack(header)
+                    payload = f.read(length)
+                    if len(payload) < length:
+                        break
+                    try:
+                        record = pickle.loads(payload)
+                    except Exception:
+                        break
+                    valid_end = f.tell()
+                    count += 1
+                    yield record
+
+            if os.path.getsize(self.path) > valid_end:
+                print(f"Truncating torn tail of write-ahead log {self.path}")
+                self._file.close()
+                with open(self.path, "r+b") as f:
+                    f.truncate(valid_end)
+                self._file = open(self.path, "ab")
+            self.record_count = count
+
+    def size(self) -> int:
+        """Current size of the log in bytes"""
+        with self._lock:
+            return self._file.tell()
+
+    def mark(self):
+        """Return an (offset, record_count) position to pass to discard_before"""
+        with self._lock:
+            return self._file.tell(), self.record_count
+
+    def discard_before(self, position):
+        """
+        Drop every record written before ``position`` (as returned by mark).
+
+        Used after a checkpoint: records up to the offset captured when the
+        snapshot was taken are folded into it, while anything appended during
+        the (slow) snapshot write is kept.
+        """
+        offset, records = position
+        with self._lock:
+            self._file.flush()
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                tail = f.read()
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(tail)
+                f.flush()
+                os.fsync(f.fileno())
+            self._file.close()
+            os.replace(tmp_path, self.path)
+            self._file = open(self.path, "ab")
+            self.record_count = max(self.record_count - records, 0)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
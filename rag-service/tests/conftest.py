@@ -0,0 +1,98 @@
+# rag-service/tests/conftest.py
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The service modules import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+DIMENSION = 8
+
+@pytest.fixture
+def vectors():
+    """Deterministic random vectors of the test dimension, n per call"""
+    rng = np.random.default_rng(0)
+    return lambda n: rng.random((n, DIMENSION), dtype=np.float32)
+
+@pytest.fixture
+def open_store(tmp_path):
+    """Open VectorStores on one data directory, closing whatever is left open at the end"""
+    from vector_store import VectorStore
+
+    stores = []
+
+    def open_store(**kwargs):
+        kwargs.setdefault("checkpoint_interval", 3600)
+        store = VectorStore(dimension=DIMENSION, data_dir=str(tmp_path / "store"), **kwargs)
+        stores.append(store)
+        return store
+
+    yield open_store
+    for store in stores:
+        store._stop_event.set()
+        store.wal.close()
+        store.documents.close()
+
+class HashEmbeddings:
+    """Bag-of-words vectors from hashed words, so texts sharing words are close"""
+
+    dimension = DIMENSION
+    cache = None
+
+    def _vector(self, text):
+        vector = np.zeros(DIMENSION, dtype=np.float32)
+        for word in text.lower().split():
+            vector[sum(word.encode("utf-8")) % DIMENSION] += 1.0
+        return vector / max(float(np.linalg.norm(vector)), 1e-6)
+
+    def encode(self, text, batch_size=32):
+        if isinstance(text, str):
+            return self._vector(text)
+        return np.array([self._vector(t) for t in text], dtype=np.float32).reshape(len(text), DIMENSION)
+
+    def cached(self, text):
+        return None
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    """
+    The API app on fake embeddings, a real VectorStore and a
+    PathwayTextPipeline whose dataflow is not started
+    """
+    from types import SimpleNamespace
+
+    from fastapi.testclient import TestClient
+
+    # The module creates ./data/input on import
+    monkeypatch.chdir(tmp_path)
+    import api
+    from embedding_scheduler import EmbeddingScheduler
+    from pathway_pipeline import PathwayTextPipeline
+    from result_cache import ResultCache
+    from startup import LazyComponent
+    from task_executor import BoundedExecutor
+    from vector_store import VectorStore
+
+    embeddings = HashEmbeddings()
+    store = VectorStore(dimension=DIMENSION, data_dir=str(tmp_path / "store"), checkpoint_interval=3600)
+    pipeline = PathwayTextPipeline(embeddings)
+    components = [
+        LazyComponent("embeddings", lambda: embeddings),
+        LazyComponent("vector_store", lambda: store),
+        LazyComponent("pipeline", lambda: pipeline)
+    ]
+    for component in components:
+        component.get()
+    monkeypatch.setattr(api, "embeddings", components[0])
+    monkeypatch.setattr(api, "vector_store", components[1])
+    monkeypatch.setattr(api, "pipeline", components[2])
+    monkeypatch.setattr(api, "COMPONENTS", components)
+    monkeypatch.setattr(api, "query_encoder", EmbeddingScheduler(components[0]))
+    monkeypatch.setattr(api, "executor", BoundedExecutor(max_workers=2, max_queue_size=2))
+    monkeypatch.setattr(api, "result_cache", ResultCache(64))
+    monkeypatch.setattr(api, "WARMUP_QUERIES", [])
+
+    with TestClient(api.app) as client:
+        yield SimpleNamespace(client=client, api=api, store=store, pipeline=pipeline, embeddings=embeddings)
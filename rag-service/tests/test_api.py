@@ -0,0 +1,69 @@
+# rag-service/tests/test_api.py
+import asyncio
+
+def _metric(service, sample):
+    """Value of one sample on /metrics, None when it is not exported"""
+    for line in service.client.get("/metrics").text.splitlines():
+        name, _, value = line.rpartition(" ")
+        if name == sample:
+            return float(value)
+    return None
+
+def test_caller_ids_reach_the_pipeline(service):
+    captured = []
+    original = service.pipeline._submit
+
+    def submit(texts, metadata_list, doc_ids=None):
+        ids = original(texts, metadata_list, doc_ids)
+        captured.extend(ids)
+        return ids
+    service.pipeline._submit = submit
+
+    response = service.client.post("/index", json={"text": "master services agreement", "doc_id": "msa-1"})
+    assert response.json() == {"doc_id": "msa-1", "status": "success"}
+    response = service.client.post("/index/bulk", json={"documents": [
+        {"text": "non disclosure agreement", "doc_id": "nda-1"},
+        {"text": "statement of work"}
+    ]})
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == ["success", "success"]
+    assert results[0]["doc_id"] == "nda-1"
+
+    # Explicit ids are kept, the missing one is generated by the pipeline
+    assert captured == ["msa-1", "nda-1", results[1]["doc_id"]]
+    assert results[1]["doc_id"].startswith("doc_")
+
+def test_full_executor_sheds_queries_with_503(service):
+    service.client.post("/index", json={"text": "master services agreement"})
+    rejected = _metric(service, "rag_executor_rejected_total") or 0.0
+
+    # Every worker and queue slot taken
+    service.api.executor._slots = asyncio.Semaphore(0)
+    response = service.client.post("/query", json={"text": "services agreement"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert service.api.executor.stats()["rejected"] == 1
+    assert _metric(service, "rag_executor_rejected_total") == rejected + 1
+    assert _metric(service, 'rag_request_errors_total{endpoint="query",status="503"}') >= 1
+
+def test_pipeline_status_stats_and_gauges(service):
+    response = service.client.post("/index", json={"text": "master services agreement", "doc_id": "msa-1"})
+    assert response.status_code == 200
+
+    status = service.client.get("/pipeline/status", params={"doc_id": "msa-1"})
+    assert status.status_code == 200
+    assert status.json()["doc_id"] == "msa-1"
+    assert status.json()["submitted"] == 1
+
+    stats = service.client.get("/stats").json()
+    assert stats["pipeline"]["submitted"] == 1
+    assert stats["vector_store"]["documents"] >= 1
+    assert stats["executor"]["max_workers"] == 2
+
+    assert _metric(service, "rag_pipeline_pending") == 0
+    assert _metric(service, "rag_index_documents") >= 1
+    assert _metric(service, "rag_wal_records") >= 1
+
+    # Readiness still reports each component under "status"
+    components = service.client.get("/ready").json()["components"]
+    assert components["pipeline"]["status"] == "ready"
@@ -0,0 +1,134 @@
+# rag-service/tests/test_dedup.py
+import threading
+
+import pytest
+
+CONTRACT = (
+    "This master services agreement is entered into by the supplier and the customer. "
+    "The supplier shall provide the services described in each statement of work."
+)
+NOISY_CONTRACT = CONTRACT.replace("supplier", "suppl1er", 1).replace("described", "descr1bed")
+OTHER = "Payment terms are net thirty days from the date of the invoice, late payments bear interest."
+
+@pytest.fixture
+def use_policy(service, tmp_path, monkeypatch):
+    """Switch the service to a dedup policy with an empty duplicate index"""
+    from dedup import DuplicateIndex
+    from startup import LazyComponent
+
+    indexes = []
+
+    def use_policy(policy):
+        index = DuplicateIndex(str(tmp_path / f"dedup_{len(indexes)}.db"))
+        indexes.append(index)
+        monkeypatch.setattr(service.api, "DEDUP_POLICY", policy)
+        monkeypatch.setattr(service.api, "dedup_index", LazyComponent("dedup_index", lambda: index))
+        return index
+
+    yield use_policy
+    for index in indexes:
+        index.close()
+
+def _index(service, text, doc_id=None):
+    response = service.client.post("/index", json={"text": text, "doc_id": doc_id})
+    assert response.status_code == 200
+    return response.json()
+
+def test_skip_returns_the_stored_copy(service, use_policy):
+    use_policy("skip")
+    stored = _index(service, CONTRACT, "msa")
+    assert stored["status"] == "success"
+
+    assert _index(service, CONTRACT, "msa-copy") == {
+        "doc_id": "msa", "status": "duplicate", "duplicate_of": "msa", "match": "exact", "similarity": 1.0
+    }
+    near = _index(service, NOISY_CONTRACT)
+    assert (near["status"], near["duplicate_of"], near["match"]) == ("duplicate", "msa", "near")
+    assert _index(service, OTHER)["status"] == "success"
+    assert service.store.get_document("msa-copy") is None
+
+def test_link_records_an_alias(service, use_policy):
+    index = use_policy("link")
+    _index(service, CONTRACT, "msa")
+    linked = _index(service, NOISY_CONTRACT, "msa-scan")
+    assert (linked["doc_id"], linked["status"], linked["duplicate_of"]) == ("msa-scan", "linked", "msa")
+    assert index.resolve("msa-scan") == "msa"
+
+    # Deleting the alias leaves the stored copy
+    assert service.client.delete("/documents/msa-scan").status_code == 200
+    assert index.resolve("msa-scan") == "msa-scan"
+    assert service.store.get_document("msa") is not None
+
+def test_replace_supersedes_the_stored_copy(service, use_policy):
+    index = use_policy("replace")
+    _index(service, CONTRACT, "msa-v1")
+    replaced = _index(service, NOISY_CONTRACT, "msa-v2")
+    assert (replaced["status"], replaced["replaced"]) == ("success", "msa-v1")
+    assert service.store.get_document("msa-v1") is None
+    assert service.store.get_document("msa-v2") is not None
+    assert index.resolve("msa-v1") == "msa-v2"
+
+    # Within a batch the last copy wins and earlier copies point at it
+    response = service.client.post("/index/bulk", json={"documents": [
+        {"text": CONTRACT, "doc_id": "msa-v3"},
+        {"text": OTHER, "doc_id": "terms"},
+        {"text": CONTRACT, "doc_id": "msa-v4"}
+    ]})
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == ["duplicate", "success", "success"]
+    assert results[0]["duplicate_of"] == "msa-v4"
+    assert results[2]["replaced"] == "msa-v2"
+    assert index.resolve("msa-v1") == "msa-v4"
+
+def test_ingest_runs_concurrently_and_copies_wait(service, use_policy, monkeypatch):
+    use_policy("skip")
+    api = service.api
+    from api import DocumentRequest
+
+    # The first upload stalls in its embedding step
+    entered, release = threading.Event(), threading.Event()
+    encode = service.embeddings.encode
+
+    def slow_encode(texts, batch_size=32):
+        if any("master services" in text for text in texts):
+            entered.set()
+            assert release.wait(10)
+        return encode(texts, batch_size)
+    monkeypatch.setattr(service.embeddings, "encode", slow_encode)
+
+    statuses = {}
+
+    def upload(name, text, doc_id):
+        statuses[name] = api._index_document(DocumentRequest(text=text, doc_id=doc_id))
+
+    first = threading.Thread(target=upload, args=("first", CONTRACT, "msa"))
+    first.start()
+    assert entered.wait(10)
+
+    # An unrelated document is indexed while the first one is embedded
+    upload("other", OTHER, "terms")
+    assert statuses["other"]["status"] == "success"
+
+    # A copy waits for the first upload instead of missing it
+    copy = threading.Thread(target=upload, args=("copy", NOISY_CONTRACT, "msa-scan"))
+    copy.start()
+    copy.join(0.3)
+    assert copy.is_alive()
+    release.set()
+    first.join(10)
+    copy.join(10)
+    assert statuses["first"]["status"] == "success"
+    assert (statuses["copy"]["status"], statuses["copy"]["duplicate_of"]) == ("duplicate", "msa")
+    assert not api._reserved
+
+def test_failed_store_releases_the_reservation(service, use_policy, monkeypatch):
+    index = use_policy("skip")
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("disk full")
+    with monkeypatch.context() as patch:
+        patch.setattr(service.store, "add_vectors", fail)
+        assert service.client.post("/index", json={"text": CONTRACT, "doc_id": "msa"}).status_code == 500
+    assert not service.api._reserved
+    assert index.stats()["documents"] == 0
+    assert _index(service, CONTRACT, "msa")["status"] == "success"
@@ -0,0 +1,91 @@
+# rag-service/tests/test_directory_loader.py
+import os
+
+import numpy as np
+import pytest
+
+from directory_loader import DirectorySync, document_id
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.encoded = 0
+
+    def encode(self, texts, batch_size=32):
+        self.encoded += len(texts)
+        return np.zeros((len(texts), 4), dtype=np.float32)
+
+class AppendOnlyIndex:
+    """Like the Pathway document table, an add never replaces a row with the same id"""
+
+    def __init__(self):
+        self.rows = []
+        self.calls = []
+
+    def add_batch(self, doc_ids, texts, metadata_list, vectors):
+        self.calls.append(("add", list(doc_ids)))
+        self.rows.extend(zip(doc_ids, texts))
+
+    def delete(self, doc_id):
+        self.calls.append(("delete", doc_id))
+        self.rows = [row for row in self.rows if row[0] != doc_id]
+
+@pytest.fixture
+def sync(tmp_path):
+    index = AppendOnlyIndex()
+    embeddings = FakeEmbeddings()
+    loader = DirectorySync(
+        embeddings, add_batch=index.add_batch, delete=index.delete,
+        manifest_path=str(tmp_path / "manifest.db"), readers=2, batch_size=2, progress=lambda stats: None
+    )
+    return loader, index, embeddings
+
+def _write(path, text, mtime_ns):
+    path.write_text(text)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def test_updated_file_replaces_previous_version(tmp_path, sync):
+    loader, index, embeddings = sync
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for i in range(3):
+        _write(docs / f"contract{i}.txt", f"version 1 of {i}", 1_000_000_000)
+
+    stats = loader.sync(str(docs))
+    assert stats["added"] == 3
+    assert len(index.rows) == 3
+
+    _write(docs / "contract1.txt", "version 2 of 1, longer", 2_000_000_000)
+    stats = loader.sync(str(docs))
+    assert (stats["updated"], stats["added"], stats["unchanged"]) == (1, 0, 2)
+
+    doc_id = document_id("contract1.txt")
+    assert [text for row_id, text in index.rows if row_id == doc_id] == ["version 2 of 1, longer"]
+    assert len(index.rows) == 3
+    # The old version goes before the new one is added under the same id
+    assert index.calls[-2:] == [("delete", doc_id), ("add", [doc_id])]
+
+def test_touched_unchanged_file_is_not_reindexed(tmp_path, sync):
+    loader, index, embeddings = sync
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    _write(docs / "a.txt", "same text", 1_000_000_000)
+    loader.sync(str(docs))
+
+    _write(docs / "a.txt", "same text", 2_000_000_000)
+    stats = loader.sync(str(docs))
+    assert stats["unchanged"] == 1 and stats["updated"] == 0
+    assert embeddings.encoded == 1
+    assert len(index.calls) == 1
+
+def test_removed_file_is_deleted(tmp_path, sync):
+    loader, index, embeddings = sync
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    _write(docs / "a.txt", "first", 1_000_000_000)
+    _write(docs / "b.txt", "second", 1_000_000_000)
+    loader.sync(str(docs))
+
+    (docs / "a.txt").unlink()
+    stats = loader.sync(str(docs))
+    assert stats["deleted"] == 1
+    assert [row_id for row_id, _ in index.rows] == [document_id("b.txt")]
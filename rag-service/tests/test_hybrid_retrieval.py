@@ -0,0 +1,77 @@
+# rag-service/tests/test_hybrid_retrieval.py
+import math
+
+import numpy as np
+import pytest
+
+from hybrid_retrieval import BM25Index, reciprocal_rank_fusion, weighted_fusion
+
+@pytest.fixture
+def bm25():
+    index = BM25Index()
+    index.add(0, "the supplier shall indemnify the customer")
+    index.add(1, "payment terms are net thirty days")
+    index.add(2, "termination for convenience on thirty days notice")
+    index.add(3, "governing law is the law of england")
+    return index
+
+def test_bm25_ranks_by_term_matches(bm25):
+    hits = bm25.search("thirty days payment", k=10)
+    assert [doc_id for doc_id, _ in hits] == [1, 2]
+    assert hits[0][1] > hits[1][1] > 0
+
+def test_bm25_matches_reference_score(bm25):
+    # Single-term query: idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len / avg_len))
+    n_docs, avg_length = 4, (6 + 6 + 7 + 7) / 4
+    idf = math.log(1.0 + (n_docs - 1 + 0.5) / (1 + 0.5))
+    expected = idf * 2 * 2.5 / (2 + 1.5 * (1 - 0.75 + 0.75 * 7 / avg_length))
+    [(doc_id, score)] = bm25.search("law", k=10)
+    assert doc_id == 3
+    assert score == pytest.approx(expected, rel=1e-5)
+
+def test_bm25_delete_readd_and_filter(bm25):
+    bm25.delete(1)
+    assert [doc_id for doc_id, _ in bm25.search("thirty days", k=10)] == [2]
+    bm25.add(4, "payment within thirty days")
+    assert {doc_id for doc_id, _ in bm25.search("payment", k=10)} == {4}
+    assert bm25.search("thirty", k=10, allowed=np.array([4], dtype=np.int64))[0][0] == 4
+
+    # Compaction drops the dead postings (and so their document frequencies),
+    # a serialization round trip keeps the scores exactly
+    before = [doc_id for doc_id, _ in bm25.search("thirty days payment", k=10)]
+    bm25.compact()
+    compacted = bm25.search("thirty days payment", k=10)
+    assert [doc_id for doc_id, _ in compacted] == before
+    assert all(1 not in np.frombuffer(ids, dtype=np.int64) for ids, _ in bm25.postings.values())
+    restored = BM25Index.from_bytes(bm25.to_bytes())
+    assert restored.search("thirty days payment", k=10) == compacted
+
+def test_reciprocal_rank_fusion_weights_both_rankings():
+    scores = reciprocal_rank_fusion([1, 2, 3], [3, 4], alpha=0.5, rank_constant=60)
+    assert scores[1] == pytest.approx(0.5 / 61)
+    assert scores[3] == pytest.approx(0.5 / 63 + 0.5 / 61)
+    # Found by both sides beats a first place on one
+    assert max(scores, key=scores.get) == 3
+    # alpha=1 is the vector ranking alone
+    vector_only = reciprocal_rank_fusion([1, 2, 3], [3, 4], alpha=1.0)
+    assert sorted(vector_only, key=vector_only.get, reverse=True)[:3] == [1, 2, 3]
+    assert vector_only[4] == 0.0
+
+def test_weighted_fusion_normalizes_scores():
+    scores = weighted_fusion({1: -0.1, 2: -0.5}, {2: 12.0, 3: 4.0}, alpha=0.5)
+    assert scores == pytest.approx({1: 0.5, 2: 0.5, 3: 0.0})
+    assert weighted_fusion({}, {7: 3.0}, alpha=0.3) == pytest.approx({7: 0.7})
+
+def test_store_hybrid_search_finds_keyword_only_match(open_store):
+    store = open_store()
+    vectors = np.eye(8, dtype=np.float32)[:4]
+    texts = ["alpha clause", "beta clause", "gamma clause", "indemnification obligations"]
+    store.add_vectors(vectors, ["a", "b", "c", "d"], texts, [{}] * 4)
+
+    # The query vector points at "a", the keywords only match "d"
+    vector_only = store.search(vectors[0], k=2, query_text="indemnification", alpha=1.0)
+    assert "d" not in [result["id"] for result in vector_only]
+    fused = store.search(vectors[0], k=2, query_text="indemnification", alpha=0.3)
+    assert [result["id"] for result in fused][0] == "d"
+    assert fused[0]["bm25_score"] > 0
+    assert fused[0]["distance"] == pytest.approx(2.0)
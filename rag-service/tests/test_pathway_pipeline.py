@@ -0,0 +1,38 @@
+# rag-service/tests/test_pathway_pipeline.py
+import threading
+
+from conftest import HashEmbeddings
+from pathway_pipeline import PathwayTextPipeline
+
+def _connector_take(pipeline):
+    """What the dataflow's connector does with the next queued batch"""
+    batch = pipeline._queue.get_nowait()
+    pipeline._dequeued(len(batch))
+    return batch
+
+def test_queue_is_bounded_by_documents():
+    pipeline = PathwayTextPipeline(HashEmbeddings(), max_queue_size=3)
+    # As if the dataflow was running, without pathway
+    pipeline._thread = threading.Thread(target=lambda: None)
+
+    pipeline.process_batch(["a", "b"])
+    pipeline.process("c")
+    assert pipeline.status()["queued_documents"] == 3
+
+    # A fourth document waits for the connector to take a batch
+    blocked = threading.Thread(target=pipeline.process, args=("d",))
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()
+    assert len(_connector_take(pipeline)) == 2
+    blocked.join(5)
+    assert not blocked.is_alive()
+    assert pipeline.status()["queued_documents"] == 2
+
+    # A batch larger than the bound is taken once the queue runs empty
+    _connector_take(pipeline)
+    _connector_take(pipeline)
+    doc_ids = pipeline.process_batch(["e", "f", "g", "h"])
+    assert pipeline.status()["queued_documents"] == 4
+    assert [record["doc_id"] for record in _connector_take(pipeline)] == doc_ids
+    assert pipeline.status()["pending"] == 8
@@ -0,0 +1,78 @@
+# rag-service/tests/test_response_formats.py
+import base64
+import json
+
+import numpy as np
+import pytest
+
+from response_formats import UnsupportedFormat, negotiate, snippet
+
+@pytest.fixture
+def indexed(service):
+    for text in ("master services agreement", "non disclosure agreement", "statement of work"):
+        assert service.client.post("/index", json={"text": text}).status_code == 200
+    return service
+
+def test_negotiate():
+    assert negotiate(None) == "json"
+    assert negotiate("text/html, application/x-msgpack;q=0.9") == "msgpack"
+    assert negotiate("application/jsonl") == "ndjson"
+    # An explicit option wins over the header
+    assert negotiate("application/msgpack", "arrow") == "arrow"
+    with pytest.raises(UnsupportedFormat):
+        negotiate(None, "xml")
+
+def test_snippet_cuts_at_a_word():
+    assert snippet("short text") == "short text"
+    assert snippet("word " * 100, max_chars=22) == "word word word word..."
+
+def test_json_with_float16_embedding(indexed):
+    response = indexed.client.post("/query", json={"text": "services agreement", "k": 2, "embedding": "float16"})
+    assert response.headers["content-type"] == "application/json"
+    body = response.json()
+    assert len(body["results"]) == 2
+    embedding = np.frombuffer(base64.b64decode(body["query_embedding"]), dtype="<f2")
+    np.testing.assert_allclose(embedding, indexed.embeddings.encode("services agreement"), atol=1e-3)
+
+def test_msgpack_by_accept_header(indexed):
+    msgpack = pytest.importorskip("msgpack")
+    response = indexed.client.post(
+        "/query", json={"text": "services agreement", "k": 2, "embedding": "float16"},
+        headers={"Accept": "application/msgpack"}
+    )
+    assert response.headers["content-type"] == "application/msgpack"
+    body = msgpack.unpackb(response.content)
+    assert len(body["results"]) == 2
+    # Binary formats carry the raw bytes
+    assert len(body["query_embedding"]) == 2 * indexed.embeddings.dimension
+
+def test_arrow_batch_is_flat(indexed):
+    pa = pytest.importorskip("pyarrow")
+    response = indexed.client.post("/query/batch", json={
+        "queries": [{"text": "services agreement", "k": 2}, {"text": "statement of work", "k": 1}],
+        "format": "arrow"
+    })
+    assert response.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.column("query").to_pylist() == [0, 0, 1]
+    assert json.loads(table.schema.metadata[b"queries"]) == 2
+
+def test_ndjson_streams_hits_then_payload(indexed):
+    response = indexed.client.post(
+        "/query", json={"text": "services agreement", "k": 3}, headers={"Accept": "application/x-ndjson"}
+    )
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["rank"] for line in lines[:-1]] == [0, 1, 2]
+    assert "plan" in lines[-1] and "results" not in lines[-1]
+
+def test_unknown_formats_are_406(indexed):
+    response = indexed.client.post("/query", json={"text": "agreement", "format": "xml"})
+    assert response.status_code == 406
+    response = indexed.client.post("/query", json={"text": "agreement", "embedding": "int4"})
+    assert response.status_code == 406
+    response = indexed.client.post("/query/batch", json={"queries": [{"text": "agreement"}], "format": "xml"})
+    assert response.status_code == 406
+    # An Accept header without a supported type falls back to JSON
+    response = indexed.client.post("/query", json={"text": "agreement"}, headers={"Accept": "text/html"})
+    assert response.status_code == 200 and response.json()["results"]
@@ -0,0 +1,148 @@
+# rag-service/tests/test_snapshot.py
+import threading
+
+import numpy as np
+
+from result_cache import ResultCache
+
+def _ids(results):
+    return [result["id"] for result in results]
+
+def _add(store, vectors, doc_ids):
+    store.add_vectors(vectors, doc_ids, [f"text of {doc_id}" for doc_id in doc_ids], [{} for _ in doc_ids])
+
+def test_reads_concurrent_with_deletes_and_upserts(open_store, vectors):
+    # A small delta limit so merges and rebuilds swap snapshots during the test
+    store = open_store(delta_limit=50)
+    data = vectors(400)
+    _add(store, data, [f"doc{i}" for i in range(400)])
+
+    errors = []
+    stop = threading.Event()
+
+    def read():
+        queries = vectors(50)
+        while not stop.is_set():
+            for query in queries:
+                try:
+                    results = store.search(query, k=5, query_text="text of doc")
+                    # A hit deleted while the search runs is dropped, not backfilled
+                    assert 3 <= len(results) <= 5
+                    assert len(set(_ids(results))) == len(results)
+                    assert all(result["text"].startswith(("text of", "new")) for result in results)
+                except Exception as e:
+                    errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    try:
+        for i in range(0, 200, 2):
+            assert store.delete_document(f"doc{i}")
+            # Searches started after the delete returned never see it
+            assert f"doc{i}" not in _ids(store.search(data[i], k=5, hybrid=False))
+            store.upsert_document(f"doc{i + 1}", data[i + 1], "new text", {})
+            assert store.get_document(f"doc{i + 1}")["text"] == "new text"
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+    store.wait_for_rebuild()
+
+    assert not errors, errors[:3]
+    assert store.index_stats()["documents"] == 300
+    assert _ids(store.search(data[1], k=1, hybrid=False)) == ["doc1"]
+
+def test_result_cache_never_holds_deleted_documents(open_store, vectors):
+    store = open_store(delta_limit=20)
+    data = vectors(100)
+    _add(store, data, [f"doc{i}" for i in range(100)])
+    cache = ResultCache(16)
+    query = data[0]
+    stop = threading.Event()
+
+    def read():
+        # As the API does: read the generation, search, cache under that generation
+        while not stop.is_set():
+            generation = store.generation
+            cache.put(b"query", generation, _ids(store.search(query, k=100, hybrid=False)))
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    try:
+        for i in range(60):
+            store.delete_document(f"doc{i}")
+            cached = cache.get(b"query", store.generation)
+            if cached is not None:
+                assert f"doc{i}" not in cached
+            _add(store, data[i:i + 1], [f"new{i}"])
+            cached = cache.get(b"query", store.generation)
+            if cached is not None:
+                assert f"new{i}" in cached
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+
+def test_generation_moves_on_background_merge(open_store, vectors):
+    store = open_store(delta_limit=10)
+    _add(store, vectors(5), [f"doc{i}" for i in range(5)])
+    store.wait_for_rebuild()
+    generation = store.generation
+    _add(store, vectors(10), [f"more{i}" for i in range(10)])
+    store.wait_for_rebuild()
+
+    stats = store.index_stats()
+    assert stats["staged"] == 0 and stats["indexed"] == 15
+    # One bump for the add and at least one for swapping in the merged index
+    assert store.generation >= generation + 2
+    np.testing.assert_array_equal(np.sort(list(store.doc_ids)), np.arange(15))
+
+def test_deletes_before_the_first_merge_do_not_rebuild(open_store, vectors):
+    store = open_store(index_type="hnsw", delta_limit=1000)
+    data = vectors(100)
+    _add(store, data, [f"doc{i}" for i in range(100)])
+
+    # Nothing is merged yet, so a delete has nothing in the main index to mask
+    store.delete_document("doc0")
+    assert store._rebuild_thread is None
+    assert store.index_stats()["masked_deletions"] == 1
+
+    # Once a quarter of the delta is deleted its rows are dropped instead
+    for i in range(1, 25):
+        store.delete_document(f"doc{i}")
+    stats = store.index_stats()
+    assert (stats["indexed"], stats["staged"], stats["masked_deletions"]) == (0, 75, 0)
+    assert store._rebuild_thread is None
+    assert _ids(store.search(data[30], k=1, hybrid=False)) == ["doc30"]
+    assert "doc3" not in _ids(store.search(data[3], k=100, hybrid=False))
+
+    # The compacted delta is what the next checkpoint persists
+    store.checkpoint()
+    assert sorted(open_store(index_type="hnsw").id_map) == sorted(f"doc{i}" for i in range(25, 100))
+
+def test_rebuild_ratio_counts_live_main_and_delta(open_store, vectors):
+    store = open_store(index_type="hnsw", delta_limit=40)
+    data = vectors(100)
+    _add(store, data[:40], [f"doc{i}" for i in range(40)])
+    store.wait_for_rebuild()
+    _add(store, data[40:70], [f"doc{i}" for i in range(40, 70)])
+    assert store.index_stats()["indexed"] == 40
+
+    # 12 of 70 live vectors (over a quarter of the 40 merged ones) are masked
+    for i in range(12):
+        store.delete_document(f"doc{i}")
+    assert store._rebuild_thread is None
+    assert store.index_stats()["masked_deletions"] == 12
+
+    # The 15th tips it over and the rebuild folds in the delta; deletes
+    # during the rebuild stay masked
+    for i in range(12, 20):
+        store.delete_document(f"doc{i}")
+    store.wait_for_rebuild()
+    stats = store.index_stats()
+    assert stats["documents"] == 50
+    assert stats["indexed"] > 40 and stats["masked_deletions"] < 12
+    assert stats["indexed"] + stats["staged"] - stats["masked_deletions"] == 50
+    assert _ids(store.search(data[20], k=1, hybrid=False)) == ["doc20"]
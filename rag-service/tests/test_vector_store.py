@@ -0,0 +1,118 @@
+# rag-service/tests/test_vector_store.py
+import os
+
+import numpy as np
+import pytest
+
+def _ids(results):
+    return [result["id"] for result in results]
+
+def _add(store, vectors, doc_ids):
+    store.add_vectors(vectors, doc_ids, [f"text of {doc_id}" for doc_id in doc_ids], [{} for _ in doc_ids])
+
+def test_wal_replay_after_crash(open_store, vectors):
+    store = open_store()
+    data = vectors(20)
+    _add(store, data, [f"doc{i}" for i in range(20)])
+    store.checkpoint()
+
+    # Logged but never folded into a snapshot: an upsert, a delete and a new document
+    upserted = vectors(1)
+    store.upsert_document("doc3", upserted[0], "new text", {"version": 2})
+    store.delete_document("doc5")
+    _add(store, vectors(1), ["doc20"])
+    ids_before = dict(store.id_map)
+
+    # No close(), as if the process died here
+    reopened = open_store()
+    assert reopened.wal.record_count == 3
+    assert reopened.id_map == ids_before
+    assert reopened.get_document("doc3") == {"id": "doc3", "text": "new text", "metadata": {"version": 2}}
+    assert reopened.get_document("doc5") is None
+    assert reopened.index_stats()["documents"] == 20
+
+    # Replayed records keep their int64 ids, so later inserts do not reuse them
+    assert reopened.next_id == store.next_id
+    assert _ids(reopened.search(upserted[0], k=1, hybrid=False)) == ["doc3"]
+    assert _ids(reopened.search(data[0], k=1, hybrid=False)) == ["doc0"]
+    assert "doc5" not in _ids(reopened.search(data[5], k=20, hybrid=False))
+
+def test_crash_between_index_files_and_commit(open_store, vectors, monkeypatch):
+    store = open_store()
+    data = vectors(5)
+    _add(store, data[:3], ["a", "b", "c"])
+    store.checkpoint()
+    _add(store, data[3:], ["d", "e"])
+
+    # The new index files are written, the document store commit never happens
+    def crash(changes, state):
+        raise SystemExit("crashed")
+    monkeypatch.setattr(store.documents, "commit", crash)
+    with pytest.raises(SystemExit):
+        store._save_index()
+    monkeypatch.undo()
+
+    reopened = open_store()
+    assert reopened.index_stats()["staged"] == 5
+    assert _ids(reopened.search(data[3], k=5, hybrid=False))[0] == "d"
+    assert sorted(_ids(reopened.search(data[3], k=5, hybrid=False))) == ["a", "b", "c", "d", "e"]
+    # The files of the interrupted checkpoint are gone, the committed ones remain
+    files = reopened.documents.get_state()["files"]
+    snapshot_files = [name for name in os.listdir(reopened.data_dir) if name.endswith((".bin", ".npz"))]
+    assert sorted(snapshot_files) == sorted(files.values())
+
+def test_wal_replay_drops_torn_record(open_store, vectors):
+    store = open_store()
+    _add(store, vectors(3), ["a", "b", "c"])
+    with open(store.wal.path, "ab") as f:
+        f.write(b"\xff\x00\x00\x00truncated")
+
+    reopened = open_store()
+    assert sorted(reopened.id_map) == ["a", "b", "c"]
+    _add(reopened, vectors(1), ["d"])
+    assert sorted(open_store().id_map) == ["a", "b", "c", "d"]
+
+def test_grouped_search_returns_k_parents(open_store):
+    store = open_store()
+    basis = np.eye(8, dtype=np.float32)
+    query = basis[0]
+
+    # Thirty chunks of one parent crowd out every other parent's chunk
+    rng = np.random.default_rng(1)
+    chunks = query + 0.01 * rng.random((30, 8), dtype=np.float32)
+    store.add_vectors(
+        chunks, [f"big#{i}" for i in range(30)], ["big"] * 30,
+        [{"parent_id": "big", "chunk_index": i, "tenant": "acme"} for i in range(30)]
+    )
+    others = [("other", "globex", 0.2), ("p1", "acme", 0.3), ("p2", "acme", 0.4), ("p3", "acme", 0.5)]
+    for j, (parent, tenant, offset) in enumerate(others):
+        store.add_document(
+            f"{parent}#0", query + offset * basis[j + 1], parent,
+            {"parent_id": parent, "chunk_index": 0, "tenant": tenant}
+        )
+
+    assert _ids(store.search(query, k=3, hybrid=False)) == ["big", "other", "p1"]
+    filtered = store.search(query, k=3, hybrid=False, filters={"tenant": "acme"})
+    assert _ids(filtered) == ["big", "p1", "p2"]
+    assert len(filtered[0]["chunks"]) == 30
+    # Fewer matching parents than k: all of them, no endless widening
+    assert _ids(store.search(query, k=10, hybrid=False, filters={"tenant": "globex"})) == ["other"]
+    # Also when BM25 matches are fused in
+    assert sorted(_ids(store.search(query, k=3, query_text="p3", filters={"tenant": "acme"}))) == ["big", "p1", "p3"]
+
+@pytest.mark.parametrize("exact_search", [False, True])
+def test_plan_reports_the_scanned_index(open_store, vectors, exact_search):
+    store = open_store(index_type="hnsw", exact_search=exact_search, delta_limit=10)
+    data = vectors(20)
+    _add(store, data[:5], [f"doc{i}" for i in range(5)])
+
+    # Below the delta limit nothing is merged, only the delta is scanned
+    _, plan = store.search(data[0], k=3, hybrid=False, return_plan=True)
+    assert (plan["mode"], plan["index"]) == ("exact", "delta")
+
+    _add(store, data[5:], [f"doc{i}" for i in range(5, 20)])
+    store.wait_for_rebuild()
+    _, plan = store.search(data[0], k=3, hybrid=False, return_plan=True)
+    assert plan["index"] == ("flat" if exact_search else "hnsw_storage")
+    _, plan = store.search(data[0], k=3, hybrid=False, search_options={"mode": "approximate"}, return_plan=True)
+    assert plan["index"] == "hnsw"
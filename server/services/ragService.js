@@ -25,19 +25,47 @@ class RAGService {
         }
     }
 
+    /**
+     * Index many documents in the RAG service with a single request
+     * @param {Array<object>} documents - Documents as { text, metadata, doc_id }
+     * @param {number} batchSize - Documents embedded and committed together
+     * @returns {Promise<object>} - Per-document statuses and throughput
+     */
+    async indexDocumentsBulk(documents, batchSize = 64) {
+        try {
+            const response = await axios.post(`${this.baseUrl}/index/bulk`, {
+                documents,
+                batch_size: batchSize
+            }, {
+                maxBodyLength: Infinity,
+                maxContentLength: Infinity
+            });
+            return response.data;
+        } catch (error) {
+            console.error('RAG service bulk indexing error:', error.response?.data || error.message);
+            throw new Error('Failed to bulk index documents in RAG service: ' + (error.response?.data?.detail || error.message));
+        }
+    }
+
     /**
      * Query the RAG service for relevant documents
      * @param {string} text - The query text
      * @param {number} k - Number of results to return
      * @param {boolean} useHybrid - Whether to use hybrid search
+     * @param {object} [filters] - Metadata filter, e.g. { contract_type: { $in: ['nda'] } }
+     * @param {object} [options] - fullText (default true, the hit texts feed the Gemini prompt)
+     *   and embedding ('none', 'list' or 'float16'; default 'none', it is not used here)
      * @returns {Promise<object>} - The query results
      */
-    async queryRAG(text, k = 5, useHybrid = true) {
+    async queryRAG(text, k = 5, useHybrid = true, filters = null, { fullText = true, embedding = 'none' } = {}) {
         try {
             const response = await axios.post(`${this.baseUrl}/query`, {
                 text,
                 k,
-                use_hybrid: useHybrid
+                use_hybrid: useHybrid,
+                full_text: fullText,
+                embedding,
+                ...(filters ? { filters } : {})
             });
             return response.data;
         } catch (error) {
@@ -46,6 +74,27 @@ class RAGService {
         }
     }
 
+    /**
+     * Run many queries in one request, e.g. one per clause of a contract under review
+     * @param {Array<string|object>} queries - Query texts, or { text, k, filters } objects
+     * @param {object} [options] - useHybrid (default true), k (default 5, for queries without
+     *   their own) and fullText (default true)
+     * @returns {Promise<Array<Array<object>>>} - One result list per query, in request order
+     */
+    async queryBatch(queries, { useHybrid = true, k = 5, fullText = true } = {}) {
+        try {
+            const response = await axios.post(`${this.baseUrl}/query/batch`, {
+                queries: queries.map(query => (typeof query === 'string' ? { text: query, k } : { k, ...query })),
+                use_hybrid: useHybrid,
+                full_text: fullText
+            });
+            return response.data.results;
+        } catch (error) {
+            console.error('RAG service batch query error:', error.response?.data || error.message);
+            throw new Error('Failed to batch query RAG service: ' + (error.response?.data?.detail || error.message));
+        }
+    }
+
     /**
      * Perform a full RAG analysis of a document
      * @param {string} text - The text to analyze